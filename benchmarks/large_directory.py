@@ -0,0 +1,282 @@
+"""Generate a large directory of users and hierarchical groups, bulk load
+it in a storage backend, and measure the queries whose cost grows with
+it.
+
+Run it from the repository root:
+
+    python benchmarks/large_directory.py --users 1000000 --groups 100000 \
+        --backend postgres --output results.json
+
+Groups form trees: organizations (``org12``) with teams nested up to
+``--max-depth`` levels (``org12.team3.team1``), each group being
+managed by its ``.staff`` group. Numbers of teams, and group sizes,
+follow Pareto distributions, the latter tuned by ``--alpha`` and
+``--min-group-size`` and capped to the number of users: most groups
+have a handful of members, a few of them have a large part of the
+directory. Staff groups get a few of the members of their group.
+
+The dataset only depends on the sizes and ``--seed``. It is given to
+``bulk_load()`` by batches of ``--batch-size`` rows, into a sqlite
+file (``--sqlite-file``, a temporary one by default) or into the
+PostgreSQL database given by ``--postgres`` (default:
+PASEE_TEST_POSTGRES), which should be a dedicated one. Tables are then
+analyzed (``ANALYZE``), so the planner knows their new sizes, as a
+deployment loading a directory in bulk should do too. Use
+``--skip-load`` to benchmark an already loaded database again.
+
+``get_groups_of_user``, ``get_authorizations_for_user`` and
+``get_members_of_group`` (first page, like the views) are then called
+``--calls`` times each, sequentially, for random users and groups.
+Calls per second and p50/p95/p99 latencies are printed, and saved with
+``--output`` as JSON.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import pasee  # noqa: E402
+from pasee.groups.views import MEMBERS_PER_PAGE  # noqa: E402
+from pasee.pasee import build_storage_backend  # noqa: E402
+from pasee.storage_interface import StorageBackend  # noqa: E402
+
+T = TypeVar("T")  # pylint: disable=invalid-name
+
+# Share of groups being organizations, the other ones being their teams.
+ORGANIZATIONS_SHARE = 0.02
+# Shape of the Pareto distribution of the number of teams of a group.
+TEAMS_ALPHA = 1.5
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def username(index: int) -> str:
+    """Name of a user of the dataset."""
+    return f"kisee-user-{index}"
+
+
+def generate_groups(rng: random.Random, count: int, max_depth: int) -> List[str]:
+    """Names of count groups forming trees, not counting staff groups.
+
+    Trees are grown breadth first, so they are as deep as their number
+    of teams allows, up to max_depth.
+    """
+    organizations = max(1, int(count * ORGANIZATIONS_SHARE))
+    names = [f"org{index}" for index in range(min(count, organizations))]
+    depths = [0] * len(names)
+    expanded = 0
+    while len(names) < count:
+        if expanded == len(names):  # All trees are max_depth deep.
+            names.append(f"org{organizations}")
+            depths.append(0)
+            organizations += 1
+        parent, depth = names[expanded], depths[expanded]
+        expanded += 1
+        if depth == max_depth:
+            continue
+        teams = min(int(rng.paretovariate(TEAMS_ALPHA)), count - len(names))
+        names.extend(f"{parent}.team{team}" for team in range(1, teams + 1))
+        depths.extend([depth + 1] * teams)
+    return names
+
+
+def generate_memberships(
+    rng: random.Random, args, groups: Iterable[str]
+) -> Iterator[Tuple[str, str]]:
+    """(user, group) pairs, members of each group being followed by the
+    members of its staff group.
+    """
+    for group in groups:
+        size = min(args.users, int(args.min_group_size * rng.paretovariate(args.alpha)))
+        members = rng.sample(range(args.users), size)
+        for index in members:
+            yield username(index), group
+        for index in members[: 1 + rng.randrange(3)]:
+            yield username(index), f"{group}.staff"
+
+
+def batches(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Lists of at most size items of iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def storage_settings(args, tmpdir: str) -> Dict[str, Any]:
+    """[storage_backend] section for the requested backend."""
+    if args.backend == "sqlite":
+        return {
+            "class": "pasee.storage_backend.demo_backend.sqlite.DemoSqliteStorage",
+            "options": {
+                "file": args.sqlite_file or os.path.join(tmpdir, "pasee.sqlite")
+            },
+        }
+    if not args.postgres:
+        raise SystemExit("--backend postgres needs --postgres or PASEE_TEST_POSTGRES")
+    url = urlsplit(args.postgres)
+    return {
+        "class": "pasee.storage_backend.pgsql_backend.pgsql.PostgresStorage",
+        "options": {
+            "user": url.username,
+            "password": url.password,
+            "database": url.path.lstrip("/"),
+            "host": url.hostname,
+            "port": url.port or 5432,
+        },
+    }
+
+
+async def analyze(args, storage: StorageBackend) -> None:
+    """Refresh the planner statistics of the loaded tables."""
+    if args.backend == "postgres":
+        async with storage.acquire() as connection:  # type: ignore
+            await connection.execute("ANALYZE users, groups, user_in_group")
+    else:
+        await storage._run(  # type: ignore # pylint: disable=protected-access
+            lambda connection: connection.execute("ANALYZE")
+        )
+
+
+async def load(args, storage: StorageBackend, groups: List[str]) -> Dict[str, Any]:
+    """Bulk load users, groups and their memberships, by batches, then
+    analyze the tables, the load time including it.
+    """
+    rng = random.Random(f"{args.seed}-memberships")
+    start = time.perf_counter()
+    for users in batches(map(username, range(args.users)), args.batch_size):
+        await storage.bulk_load(users, [], [])
+    all_groups = itertools.chain.from_iterable(
+        (group, f"{group}.staff") for group in groups
+    )
+    for group_batch in batches(all_groups, args.batch_size):
+        await storage.bulk_load([], group_batch, [])
+    memberships = 0
+    for membership_batch in batches(
+        generate_memberships(rng, args, groups), args.batch_size
+    ):
+        await storage.bulk_load([], [], membership_batch)
+        memberships += len(membership_batch)
+    await analyze(args, storage)
+    return {
+        "users": args.users,
+        "groups": 2 * len(groups),
+        "memberships": memberships,
+        "load_seconds": time.perf_counter() - start,
+    }
+
+
+async def measure(args, storage: StorageBackend, groups: List[str]) -> Dict[str, Any]:
+    """Calls per second and latencies of each query."""
+    rng = random.Random(f"{args.seed}-queries")
+    queries = {
+        "get_groups_of_user": lambda: storage.get_groups_of_user(
+            username(rng.randrange(args.users))
+        ),
+        "get_authorizations_for_user": lambda: storage.get_authorizations_for_user(
+            username(rng.randrange(args.users))
+        ),
+        "get_members_of_group": lambda: storage.get_members_of_group(
+            rng.choice(groups), page_size=MEMBERS_PER_PAGE
+        ),
+    }
+    results = {}
+    for name, query in queries.items():
+        latencies = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            await query()
+            latencies.append(time.perf_counter() - start)
+        results[name] = {
+            "calls_per_second": len(latencies) / sum(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return results
+
+
+async def run(args, tmpdir: str) -> Dict[str, Any]:
+    """Load the dataset unless asked not to, then measure queries."""
+    groups = generate_groups(random.Random(args.seed), args.groups, args.max_depth)
+    storage = build_storage_backend(storage_settings(args, tmpdir))
+    async with storage:
+        dataset = None if args.skip_load else await load(args, storage, groups)
+        return {"dataset": dataset, "queries": await measure(args, storage, groups)}
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--sqlite-file")
+    parser.add_argument("--postgres", default=os.environ.get("PASEE_TEST_POSTGRES"))
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--alpha", type=float, default=1.2)
+    parser.add_argument("--min-group-size", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--output", help="JSON file to save results to.")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = loop.run_until_complete(run(args, tmpdir))
+    if results["dataset"]:
+        dataset = results["dataset"]
+        print(
+            f"Loaded {dataset['users']} users, {dataset['groups']} groups and "
+            f"{dataset['memberships']} memberships in "
+            f"{dataset['load_seconds']:.1f}s"
+        )
+    for name, result in results["queries"].items():
+        print(
+            f"{name:>28}: {result['calls_per_second']:8.1f} calls/s, "
+            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+            f"p99={result['p99_ms']:.2f}ms"
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {
+                    "date": datetime.utcnow().isoformat(),
+                    "pasee": pasee.__version__,
+                    "python": platform.python_version(),
+                    "arguments": {
+                        name: value
+                        for name, value in vars(args).items()
+                        if name not in {"postgres", "output"}
+                    },
+                    **results,
+                },
+                output,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
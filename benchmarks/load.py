@@ -0,0 +1,434 @@
+"""Load test a Pasee server with a mix of logins, token refreshes, group
+listings and membership changes, at a fixed concurrency.
+
+Run it from the repository root:
+
+    python benchmarks/load.py --mix mixed --concurrency 20 \
+        --requests 5000 --output results.json
+
+Pasee (``identification_app``, through ``--workers`` processes) runs
+against a fresh sqlite database, or against the PostgreSQL database
+given by ``--postgres`` (default: PASEE_TEST_POSTGRES), in which
+``kisee-load-*`` users and ``load.*`` groups are created if missing.
+Logins go through a fake Kisee, running in its own process, issuing
+ES256 tokens signed with a key generated for the run.
+
+Each client logs in as a staff member first (not measured), then sends
+requests drawn from the mix using its own seeded random generator, so
+two runs with the same arguments send the same requests. Throughput
+and p50/p95/p99 latencies are printed per endpoint, and saved as JSON
+with the arguments and versions used, to compare releases.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import jwt
+from aiohttp import ClientError, ClientSession, web
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+import pasee  # noqa: E402
+from pasee import workers  # noqa: E402
+from pasee.__main__ import load_conf, serve  # noqa: E402
+from pasee.pasee import build_storage_backend  # noqa: E402
+
+PASSWORD = "load-test-password"  # nosec (fake Kisee)
+
+# Weights of each operation, by mix name.
+MIXES = {
+    "login": {"login": 70, "refresh": 30},
+    "mixed": {
+        "login": 10,
+        "refresh": 40,
+        "list_groups": 20,
+        "list_members": 20,
+        "change_membership": 10,
+    },
+    "admin": {"list_groups": 30, "list_members": 40, "change_membership": 30},
+}
+
+# Reported endpoint of each operation.
+ENDPOINTS = {
+    "login": "POST /tokens/?idp=kisee",
+    "refresh": "POST /tokens/?refresh",
+    "list_groups": "GET /groups/?user={username}",
+    "list_members": "GET /groups/{group}/",
+    "change_membership": "PATCH /groups/{group}/",
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def fake_kisee(private_key_pem: str) -> web.Application:
+    """A Kisee answering to any login with PASSWORD, with an ES256 token."""
+
+    async def get_root(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"resources": {"jwt": {"href": f"{request.url.origin()}/jwt/"}}}
+        )
+
+    async def post_jwt(request: web.Request) -> web.Response:
+        credentials = await request.json()
+        if credentials.get("password") != PASSWORD:
+            raise web.HTTPForbidden()
+        token = jwt.encode(
+            {
+                "iss": "fake-kisee",
+                "sub": credentials["login"],
+                "exp": datetime.utcnow() + timedelta(hours=1),
+            },
+            private_key_pem,
+            algorithm="ES256",
+        )
+        return web.json_response({"tokens": [token]}, status=201)
+
+    app = web.Application()
+    app.add_routes([web.get("/", get_root), web.post("/jwt/", post_jwt)])
+    return app
+
+
+def generate_key_pair() -> Tuple[str, str]:
+    """PEM of a new P-256 private key, and of its public key."""
+    private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem.decode(), public_pem.decode()
+
+
+def run_fake_kisee(private_key_pem: str, sock) -> None:
+    """Process target serving the fake Kisee."""
+    logging.disable(logging.WARNING)
+    web.run_app(fake_kisee(private_key_pem), sock=sock, print=None, access_log=None)
+
+
+def run_pasee(settings: Dict[str, Any], sock) -> None:
+    """Process target serving Pasee, with settings["workers"] processes."""
+    logging.disable(logging.WARNING)
+    if settings["workers"] == 1:
+        serve(settings, sock=sock)
+        return
+    workers.Supervisor(
+        lambda index: serve(settings, sock=sock), settings["workers"]
+    ).run()
+
+
+def storage_settings(args, tmpdir: str) -> Dict[str, Any]:
+    """[storage_backend] section for the requested backend."""
+    if args.backend == "sqlite":
+        return {
+            "class": "pasee.storage_backend.demo_backend.sqlite.DemoSqliteStorage",
+            "options": {"file": os.path.join(tmpdir, "pasee.sqlite")},
+        }
+    if not args.postgres:
+        raise SystemExit("--backend postgres needs --postgres or PASEE_TEST_POSTGRES")
+    url = urlsplit(args.postgres)
+    return {
+        "class": "pasee.storage_backend.pgsql_backend.pgsql.PostgresStorage",
+        "options": {
+            "user": url.username,
+            "password": url.password,
+            "database": url.path.lstrip("/"),
+            "host": url.hostname,
+            "port": url.port or 5432,
+        },
+    }
+
+
+def pasee_settings(args, tmpdir: str, kisee_url: str, kisee_public_key: str):
+    """Settings of the Pasee under test, logging in through the fake Kisee."""
+    settings = load_conf(args.settings)
+    kisee = {
+        "name": "kisee",
+        "implementation": "pasee.identity_providers.kisee.KiseeIdentityProvider",
+        "endpoint": f"{kisee_url}/",
+        "settings": {"public_keys": [kisee_public_key]},
+        "input_fields": [
+            {"name": "login", "required": True},
+            {"name": "password", "required": True},
+        ],
+    }
+    settings["identity_providers"] = [kisee]
+    settings["idps"] = {"kisee": kisee}
+    settings["storage_backend"] = storage_settings(args, tmpdir)
+    settings["server"] = {"access_log": False}
+    settings["workers"] = args.workers
+    return settings
+
+
+def team(index: int) -> str:
+    """Name of a group of the dataset."""
+    return f"load.team{index}"
+
+
+async def populate(args, settings) -> None:
+    """Create staff members (one per client), users, and teams having a
+    few of these users as members, skipping what already exists.
+    """
+    rng = random.Random(args.seed)
+    storage = build_storage_backend(settings["storage_backend"])
+    async with storage:
+        for group in ["staff", "load"] + [
+            name
+            for index in range(args.groups)
+            for name in (team(index), f"{team(index)}.staff")
+        ]:
+            if not await storage.group_exists(group):
+                await storage.create_group(group)
+        await storage.add_members_to_group(
+            [f"kisee-load-admin-{index}" for index in range(args.concurrency)],
+            "staff",
+        )
+        members: Dict[str, List[str]] = {
+            team(index): [] for index in range(args.groups)
+        }
+        for index in range(args.users):
+            for group in rng.sample(list(members), min(3, args.groups)):
+                members[group].append(f"kisee-load-user-{index}")
+        for group, usernames in members.items():
+            if usernames:
+                await storage.add_members_to_group(usernames, group)
+
+
+async def wait_for_server(session: ClientSession, url: str) -> None:
+    """Wait until the server answers."""
+    for _ in range(100):
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                return
+        except ClientError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server not answering on {url}")
+
+
+class Client:
+    """A staff member sending requests drawn from a mix."""
+
+    def __init__(self, args, session: ClientSession, base_url: str, index: int):
+        self.args = args
+        self.session = session
+        self.base_url = base_url
+        self.username = f"load-admin-{index}"
+        self.rng = random.Random(f"{args.seed}-{index}")
+        self.access_token = ""
+        self.refresh_token = ""
+
+    async def send(self, method: str, path: str, **kwargs) -> Tuple[int, Any]:
+        """Status and decoded JSON body (None if not JSON) of a request."""
+        headers = {"Accept": "application/json"}
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        headers.update(kwargs.pop("headers", {}))
+        async with self.session.request(
+            method, self.base_url + path, headers=headers, **kwargs
+        ) as response:
+            body = await response.read()
+            if response.content_type.endswith("json"):
+                return response.status, json.loads(body)
+            return response.status, None
+
+    async def login(self) -> int:
+        """Get an access and a refresh token for this client."""
+        status, body = await self.send(
+            "POST",
+            "/tokens/?idp=kisee",
+            json={"login": self.username, "password": PASSWORD},
+        )
+        if status == 201:
+            self.access_token = body["access_token"]
+            self.refresh_token = body["refresh_token"]
+        return status
+
+    def user(self) -> str:
+        """A random user of the dataset, as known by Pasee."""
+        return f"kisee-load-user-{self.rng.randrange(self.args.users)}"
+
+    def request(self, operation: str) -> Tuple[str, str, Dict[str, Any]]:
+        """Method, path and options of a request for operation."""
+        group = team(self.rng.randrange(self.args.groups))
+        if operation == "login":
+            login = f"load-user-{self.rng.randrange(self.args.users)}"
+            return (
+                "POST",
+                "/tokens/?idp=kisee",
+                {"json": {"login": login, "password": PASSWORD}},
+            )
+        if operation == "refresh":
+            return (
+                "POST",
+                "/tokens/?refresh",
+                {"headers": {"Authorization": f"Bearer {self.refresh_token}"}},
+            )
+        if operation == "list_groups":
+            return "GET", f"/groups/?user={self.user()}", {}
+        if operation == "list_members":
+            return "GET", f"/groups/{group}/", {}
+        action = self.rng.choice(["add", "remove"])
+        return "PATCH", f"/groups/{group}/", {"json": {action: [self.user()]}}
+
+
+async def run_mix(args, base_url: str) -> Dict[str, Any]:
+    """Send args.requests requests drawn from the mix, args.concurrency at
+    a time, giving the results by endpoint.
+    """
+    operations, weights = zip(*sorted(MIXES[args.mix].items()))
+    latencies: Dict[str, List[float]] = {operation: [] for operation in operations}
+    errors: Dict[str, int] = {operation: 0 for operation in operations}
+    remaining = args.requests
+
+    async def run_client(client: Client) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            operation = client.rng.choices(operations, weights)[0]
+            method, path, options = client.request(operation)
+            start = time.perf_counter()
+            status, _ = await client.send(method, path, **options)
+            latencies[operation].append(time.perf_counter() - start)
+            if status >= 300:
+                errors[operation] += 1
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with ClientSession(connector=connector) as session:
+        await wait_for_server(session, f"{base_url}/")
+        clients = [
+            Client(args, session, base_url, index) for index in range(args.concurrency)
+        ]
+        for client in clients:
+            status = await client.login()
+            if status != 201:
+                raise RuntimeError(f"Login of {client.username} failed: {status}")
+        start = time.perf_counter()
+        await asyncio.gather(*[run_client(client) for client in clients])
+        elapsed = time.perf_counter() - start
+    results: Dict[str, Any] = {
+        "total": {
+            "requests": args.requests,
+            "errors": sum(errors.values()),
+            "requests_per_second": args.requests / elapsed,
+        }
+    }
+    for operation in operations:
+        if not latencies[operation]:
+            continue
+        results[ENDPOINTS[operation]] = {
+            "requests": len(latencies[operation]),
+            "errors": errors[operation],
+            "requests_per_second": len(latencies[operation]) / elapsed,
+            "p50_ms": percentile(latencies[operation], 50) * 1000,
+            "p95_ms": percentile(latencies[operation], 95) * 1000,
+            "p99_ms": percentile(latencies[operation], 99) * 1000,
+        }
+    return results
+
+
+def start_process(target, *args) -> Tuple[multiprocessing.Process, str]:
+    """Run target(*args, sock) in a forked process, giving its URL."""
+    sock = workers.listen("127.0.0.1", 0)
+    process = multiprocessing.get_context("fork").Process(
+        target=target, args=(*args, sock)
+    )
+    process.start()
+    url = "http://127.0.0.1:{}".format(sock.getsockname()[1])
+    sock.close()
+    return process, url
+
+
+def report(results: Dict[str, Any]) -> None:
+    """Print results, one line per endpoint."""
+    for endpoint, result in results.items():
+        line = (
+            f"{endpoint:>28}: {result['requests']:6d} requests, "
+            f"{result['errors']:4d} errors, {result['requests_per_second']:8.1f} req/s"
+        )
+        if "p50_ms" in result:
+            line += (
+                f", p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                f"p99={result['p99_ms']:.2f}ms"
+            )
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--settings", default="tests/test-settings.toml")
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--postgres", default=os.environ.get("PASEE_TEST_POSTGRES"))
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to save results to.")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+    private_key, public_key = generate_key_pair()
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        kisee, kisee_url = start_process(run_fake_kisee, private_key)
+        try:
+            settings = pasee_settings(args, tmpdir, kisee_url, public_key)
+            loop.run_until_complete(populate(args, settings))
+            server, base_url = start_process(run_pasee, settings)
+            try:
+                results = loop.run_until_complete(run_mix(args, base_url))
+            finally:
+                server.terminate()
+                server.join()
+        finally:
+            kisee.terminate()
+            kisee.join()
+    report(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {
+                    "date": datetime.utcnow().isoformat(),
+                    "pasee": pasee.__version__,
+                    "python": platform.python_version(),
+                    "aiohttp": aiohttp.__version__,
+                    "arguments": {
+                        name: value
+                        for name, value in vars(args).items()
+                        if name not in {"postgres", "output"}
+                    },
+                    "results": results,
+                },
+                output,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Measure requests per second and latency of a Pasee server, for each
+event loop implementation.
+
+Run it from the repository root:
+
+    python benchmarks/server_loops.py --concurrency 50 --requests 5000
+
+For each loop (``asyncio``, and ``uvloop`` if installed) a server is
+started as ``python -m pasee --event-loop <loop>``, with access logs
+disabled, then clients hammer ``GET /public-key/`` and
+``POST /tokens/?refresh``, one endpoint after the other.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import jwt
+from aiohttp import ClientError, ClientSession
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from pasee.__main__ import load_conf  # noqa: E402
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+USERNAME = "kisee-benchmark"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port() -> int:
+    """A TCP port nobody listens to, hopefully still free when used."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_settings(path: str, settings_file: str) -> None:
+    """Copy of the settings, without access logs."""
+    with open(settings_file) as source, open(path, "w") as settings:
+        settings.write(source.read())
+        settings.write("\n[server]\naccess_log = false\n")
+
+
+async def wait_for_server(session: ClientSession, url: str) -> None:
+    """Wait until the server answers."""
+    for _ in range(100):
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                return
+        except ClientError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server not answering on {url}")
+
+
+async def hammer(args, session: ClientSession, method: str, url: str, headers):
+    """Send args.requests requests, args.concurrency at a time."""
+    latencies: List[float] = []
+    remaining = args.requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            async with session.request(method, url, headers=headers) as response:
+                await response.read()
+                assert response.status < 300, response.status
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": args.requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_loop(args, event_loop: str, settings_file: str) -> Dict[str, Dict]:
+    """Benchmark a server running on the given event loop."""
+    settings = load_conf(settings_file)
+    refresh_token = jwt.encode(
+        {"iss": "benchmark", "sub": USERNAME, "refresh_token": True},
+        settings["private_key"],
+        algorithm=settings["algorithm"],
+    )
+    port = free_port()
+    server = subprocess.Popen(  # nosec
+        [
+            sys.executable,
+            "-m",
+            "pasee",
+            "--settings-file",
+            settings_file,
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--event-loop",
+            event_loop,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with ClientSession() as session:
+            await wait_for_server(session, f"{base_url}/")
+            return {
+                "GET /public-key/": await hammer(
+                    args, session, "GET", f"{base_url}/public-key/", {}
+                ),
+                "POST /tokens/?refresh": await hammer(
+                    args,
+                    session,
+                    "POST",
+                    f"{base_url}/tokens/?refresh",
+                    {"Authorization": f"Bearer {refresh_token}"},
+                ),
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--settings", default="tests/test-settings.toml")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument(
+        "--event-loop",
+        choices=["asyncio", "uvloop"],
+        action="append",
+        dest="event_loops",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    event_loops = args.event_loops or ["asyncio"] + (["uvloop"] if uvloop else [])
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings_file = os.path.join(tmpdir, "settings.toml")
+        write_settings(settings_file, args.settings)
+        for event_loop in event_loops:
+            results = loop.run_until_complete(run_loop(args, event_loop, settings_file))
+            for endpoint, result in results.items():
+                print(
+                    f"{event_loop:>8} {endpoint:>22}: "
+                    f"{result['requests_per_second']:8.1f} req/s, "
+                    f"p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Measure event loop latency while tokens are being refreshed concurrently,
+for each sqlite backend.
+
+Run it from the repository root:
+
+    python benchmarks/sqlite_loop_latency.py --concurrency 50 --requests 2000
+
+A ticker coroutine wakes up every millisecond and records how late it
+is, while clients hammer ``POST /tokens/?refresh``. The membership
+table is filled with ``--rows`` rows so each token needs a sizeable
+query: a backend running its queries on the loop shows up as a high
+loop latency.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import jwt
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from pasee.__main__ import load_conf  # noqa: E402
+from pasee.pasee import identification_app  # noqa: E402
+from pasee.storage_backend.demo_backend.sqlite import DemoSqliteStorage  # noqa: E402
+
+BACKENDS = {
+    "demo": "pasee.storage_backend.demo_backend.sqlite.DemoSqliteStorage",
+    "threaded": "pasee.storage_backend.demo_backend.sqlite.ThreadedSqliteStorage",
+}
+USERNAME = "kisee-benchmark"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def populate(database: str, rows: int) -> None:
+    """Fill user_in_group with other users' memberships, so that each
+    token needs a sizeable scan while its response stays small.
+    """
+    storage = DemoSqliteStorage({"file": database})
+    await storage.__aenter__()
+    try:
+        with storage.connection:
+            storage.connection.executemany(
+                "INSERT INTO user_in_group(user, group_name) VALUES (?, ?)",
+                ((f"kisee-user-{i % 1000}", f"group-{i % 500}") for i in range(rows)),
+            )
+            storage.connection.execute(
+                "INSERT INTO users(name) VALUES (?)", (USERNAME,)
+            )
+            storage.connection.executemany(
+                "INSERT INTO groups(name) VALUES (?)",
+                ((f"group-{i}",) for i in range(500)),
+            )
+            storage.connection.executemany(
+                "INSERT INTO user_in_group(user, group_name) VALUES (?, ?)",
+                ((USERNAME, f"group-{i}") for i in range(5)),
+            )
+    finally:
+        await storage.__aexit__(None, None, None)
+
+
+async def ticker(lags: List[float], stop: asyncio.Event) -> None:
+    """Record how late the loop wakes us up."""
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - before - 0.001)
+
+
+async def run_backend(args, backend: str, database: str) -> Dict[str, float]:
+    """Benchmark a single storage backend."""
+    settings = load_conf(args.settings)
+    settings["storage_backend"] = {
+        "class": BACKENDS[backend],
+        "options": {"file": database, "workers": args.workers},
+    }
+    refresh_token = jwt.encode(
+        {"iss": "benchmark", "sub": USERNAME, "refresh_token": True},
+        settings["private_key"],
+        algorithm=settings["algorithm"],
+    )
+    await populate(database, args.rows)
+    app = identification_app(settings)
+    server = TestServer(app)
+    await server.start_server()
+    lags: List[float] = []
+    stop = asyncio.Event()
+    remaining = args.requests
+
+    async def client(session):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            async with session.post(
+                server.make_url("/tokens/?refresh"),
+                headers={"Authorization": f"Bearer {refresh_token}"},
+            ) as response:
+                assert response.status == 201, await response.text()
+                await response.read()
+
+    try:
+        async with ClientSession() as session:
+            tick = asyncio.ensure_future(ticker(lags, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*[client(session) for _ in range(args.concurrency)])
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await tick
+    finally:
+        await server.close()
+    return {
+        "tokens_per_second": args.requests / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": max(lags) * 1000,
+    }
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--settings", default="tests/test-settings.toml")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--backend", choices=sorted(BACKENDS), action="append", dest="backends"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for backend in args.backends or sorted(BACKENDS):
+            results = loop.run_until_complete(
+                run_backend(args, backend, os.path.join(tmpdir, f"{backend}.sqlite"))
+            )
+            print(
+                f"{backend:>10}: {results['tokens_per_second']:8.1f} tokens/s, "
+                f"loop lag p50={results['lag_p50_ms']:.2f}ms "
+                f"p99={results['lag_p99_ms']:.2f}ms "
+                f"max={results['lag_max_ms']:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
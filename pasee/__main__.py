@@ -2,6 +2,8 @@
 """
 
 import argparse
+import asyncio
+import logging
 import os
 import sys
 from typing import Optional, Dict
@@ -15,9 +17,16 @@ try:
 except ImportError:
     sentry_sdk = None
 
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None  # type: ignore
+
 import pasee
-from pasee import MissingSettings
-from pasee.pasee import identification_app
+from pasee import MissingSettings, workers
+from pasee.pasee import identification_app, start_server
+
+logger = logging.getLogger(__name__)
 
 
 def pasee_arg_parser() -> argparse.ArgumentParser:
@@ -35,6 +44,16 @@ def pasee_arg_parser() -> argparse.ArgumentParser:
     )
     parser.add_argument("--host", help="Hostname to bind to.")
     parser.add_argument("--port", help="Port to bind to.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes, sharing the listening socket.",
+    )
+    parser.add_argument(
+        "--event-loop",
+        choices=["asyncio", "uvloop"],
+        help="Event loop implementation, uvloop being used only if installed.",
+    )
     return parser
 
 
@@ -87,6 +106,37 @@ def load_conf(
     return settings
 
 
+def install_event_loop(name: str) -> str:
+    """Use the given event loop implementation, giving the one in use."""
+    if name == "uvloop":
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return "uvloop"
+        logger.warning("uvloop is not installed, using the asyncio event loop")
+    return "asyncio"
+
+
+def serve(settings, sock=None):  # pragma: no cover
+    """Run the application until SIGINT or SIGTERM, on the given listening
+    socket if any.
+    """
+    install_event_loop(settings.get("event_loop", "asyncio"))
+    if sentry_sdk:
+        sentry_sdk.init(settings.get("SENTRY_DSN"), integrations=[AioHttpIntegration()])
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    runner = loop.run_until_complete(
+        start_server(identification_app(settings), settings, sock=sock)
+    )
+    try:
+        loop.run_forever()
+    except (web.GracefulExit, KeyboardInterrupt):
+        pass
+    finally:
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
 def main():  # pragma: no cover
     """Command line entry point."""
     parser = pasee_arg_parser()
@@ -97,10 +147,22 @@ def main():  # pragma: no cover
         print(err, file=sys.stderr)
         parser.print_help()
         sys.exit(1)
-    if sentry_sdk:
-        sentry_sdk.init(settings.get("SENTRY_DSN"), integrations=[AioHttpIntegration()])
-    app = identification_app(settings)
-    web.run_app(app, host=app["settings"]["host"], port=app["settings"]["port"])
+    if args.event_loop:
+        settings["event_loop"] = args.event_loop
+    worker_count = args.workers or settings.get("workers", 1)
+    if worker_count == 1:
+        serve(settings)
+        return
+    sock = workers.listen(
+        settings["host"],
+        int(settings["port"]),
+        backlog=settings.get("server", {}).get("backlog", 128),
+    )
+    workers.Supervisor(
+        lambda index: serve(settings, sock=sock),
+        worker_count,
+        shutdown_timeout=settings.get("shutdown_timeout", 60),
+    ).run()
 
 
 if __name__ == "__main__":
@@ -2,57 +2,74 @@
 """
 
 import logging
-from typing import List, Tuple
+from typing import AsyncGenerator, List, Optional, Tuple
 
 from aiohttp import web
 
-from pasee import utils
-from pasee.vendor import coreapi
-from pasee.serializers import serialize
+from pasee import pagination, utils
+from pasee.serializers import Document, Error, Field, Link
+from pasee.serializers import NDJSON, serialize, stream_ndjson
 from pasee.groups.utils import (
     is_authorized_for_group,
     is_authorized_for_group_create,
 )
 from pasee import Unauthorized
+from pasee.storage_interface import ALREADY_MEMBER, GROUP_NOT_FOUND, NOT_MEMBER
 
 logger = logging.getLogger(__name__)
 
+MAX_MEMBERS_PER_PATCH = 10000
+MEMBERS_PER_PAGE = 100
+MEMBERS_PER_CHUNK = 1000
 
-async def _get_groups(request: web.Request) -> Tuple[List[coreapi.Error], List]:
+
+def _groups_listing(request: web.Request) -> str:
+    """Name of the listing of groups, for cursors."""
+    user = request.rel_url.query.get("user")
+    return f"groups_of_user:{user}" if user else "groups"
+
+
+async def _get_groups(
+    request: web.Request,
+) -> Tuple[List[Error], List[str], Optional[int]]:
+    """Groups (of user if given), and their approximate count."""
+    storage_backend = utils.storage_backend(request)
     try:
         if utils.is_root(request):
             user = request.rel_url.query.get("user")
-            last_element = request.rel_url.query.get("last_element", "")
+            last_element = pagination.page_start(
+                request, _groups_listing(request), "last_element"
+            )
+            page_size = pagination.page_size(request)
             if not user:
-                groups = await request.app["storage_backend"].get_groups(last_element)
-            else:
-                groups = await request.app["storage_backend"].get_groups_of_user(
-                    user, last_element
-                )
-            return [], groups
+                groups = await storage_backend.get_groups(last_element, page_size)
+                count = await storage_backend.approximate_count("groups")
+                return [], groups, count
+            groups = await storage_backend.get_groups_of_user(
+                user, last_element, page_size
+            )
+            return [], groups, None
     except Unauthorized as err:
-        return [coreapi.Error(content={"reason": err.reason})], []
-    return [], []
+        return [Error(content={"reason": err.reason})], [], None
+    return [], [], None
 
 
 async def get_groups(request: web.Request) -> web.Response:
     """Handlers for GET /groups/"""
     hostname = request.app["settings"]["hostname"]
-    errors, groups = await _get_groups(request)
+    errors, groups, count = await _get_groups(request)
     content = {
         "groups": [
-            coreapi.Document(
-                url=f"{hostname}/groups/{group}/", content={"group": group}
-            )
+            Document(url=f"{hostname}/groups/{group}/", content={"group": group})
             for group in groups
         ],
-        "create_group": coreapi.Link(
+        "create_group": Link(
             action="post",
             title="Create a group",
             description="A method to create a group by a staff member",
-            fields=[coreapi.Field(name="group", required=True)],
+            fields=[Field(name="group", required=True)],
         ),
-        "get_groups_of_user": coreapi.Link(
+        "get_groups_of_user": Link(
             action="get",
             title="Get groups of user",
             description="Get list of groups of a user",
@@ -60,13 +77,15 @@ async def get_groups(request: web.Request) -> web.Response:
         ),
         "errors": errors,
     }
-    if groups:
-        content["next"] = coreapi.Link(
-            url=f"{hostname}/groups/?last_element={groups[-1]}"
+    if count is not None:
+        content["approximate_count"] = count
+    if len(groups) == pagination.page_size(request):
+        content["next"] = pagination.next_link(
+            request, _groups_listing(request), groups[-1]
         )
     return serialize(
         request,
-        coreapi.Document(
+        Document(
             url=f"{hostname}/groups/",
             title="Groups of Identity Manager",
             content=content,
@@ -77,8 +96,8 @@ async def get_groups(request: web.Request) -> web.Response:
 
 async def post_groups(request: web.Request) -> web.Response:
     """Handler for POST /groups/"""
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
-    input_data = await request.json()
+    claims = utils.request_claims(request)
+    input_data = await utils.request_json(request)
     if "group" not in input_data:
         raise web.HTTPBadRequest(reason="Missing group")
 
@@ -87,7 +106,7 @@ async def post_groups(request: web.Request) -> web.Response:
     if not is_authorized_for_group_create(claims["groups"], group_name):
         raise web.HTTPForbidden(reason="Not authorized to create group")
 
-    storage_backend = request.app["storage_backend"]
+    storage_backend = utils.storage_backend(request)
     staff_group_name = f"{group_name}.staff"
 
     if await storage_backend.group_exists(group_name):
@@ -101,11 +120,11 @@ async def post_groups(request: web.Request) -> web.Response:
     return web.Response(status=201, headers={"Location": location})
 
 
-async def get_group(request: web.Request) -> web.Response:
+async def get_group(request: web.Request) -> web.StreamResponse:
     """Handler for GET /groups/{group_uid}"""
     hostname = request.app["settings"]["hostname"]
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
-    storage_backend = request.app["storage_backend"]
+    claims = utils.request_claims(request)
+    storage_backend = utils.storage_backend(request)
     group = request.match_info["group_uid"]
 
     if not is_authorized_for_group(claims["groups"], group):
@@ -114,64 +133,149 @@ async def get_group(request: web.Request) -> web.Response:
     if not await storage_backend.group_exists(group):
         raise web.HTTPNotFound(reason="Group does not exist")
 
-    members = await storage_backend.get_members_of_group(group)
+    if NDJSON in request.headers.get("Accept", ""):
+        return await stream_ndjson(
+            request,
+            _members(request, group),
+            MEMBERS_PER_CHUNK,
+            headers={"Vary": "Origin, Accept"},
+        )
+
+    listing = f"members_of_group:{group}"
+    page_size = pagination.page_size(request, MEMBERS_PER_PAGE)
+    members = await storage_backend.get_members_of_group(
+        group, pagination.page_start(request, listing, "last_element"), page_size
+    )
+    content = {
+        "members": [
+            Document(url=f"{hostname}/users/{member}", content={"username": member})
+            for member in members
+        ],
+        "add_member": Link(
+            action="post",
+            title="Add a member to group",
+            description="A method to add a member to group",
+            fields=[Field(name="username", required=True)],
+        ),
+        "change_members": Link(
+            action="patch",
+            title="Add and remove members of group",
+            description="Add and remove many members at once, "
+            "giving lists of usernames",
+            fields=[Field(name="add"), Field(name="remove")],
+        ),
+    }
+    if len(members) == page_size:
+        content["next"] = pagination.next_link(request, listing, members[-1])
     return serialize(
         request,
-        coreapi.Document(
+        Document(
             url=f"{hostname}/groups/{{group}}/",
             title=f"{group} group management interface",
-            content={
-                "members": [
-                    coreapi.Document(
-                        url=f"{hostname}/users/{member}", content={"username": member}
-                    )
-                    for member in members
-                ],
-                "add_member": coreapi.Link(
-                    action="post",
-                    title="Add a member to group",
-                    description="A method to add a member to group",
-                    fields=[coreapi.Field(name="username", required=True)],
-                ),
-            },
+            content=content,
         ),
-        headers={"Vary": "Origin"},
+        headers={"Vary": "Origin, Accept"},
     )
 
 
+async def _members(request: web.Request, group: str) -> AsyncGenerator[dict, None]:
+    members = utils.storage_backend(request).iter_members_of_group(group)
+    try:
+        async for member in members:  # pragma: no branch
+            yield {"username": member}
+    finally:
+        await members.aclose()
+
+
 async def post_group(request: web.Request) -> web.Response:
     """Handler for POST /groups/{group_id}/
     add a user to {group_id}
     """
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
-    input_data = await request.json()
-    storage_backend = request.app["storage_backend"]
+    claims = utils.request_claims(request)
+    input_data = await utils.request_json(request)
+    storage_backend = utils.storage_backend(request)
     group = request.match_info["group_uid"]
 
     if not is_authorized_for_group(claims["groups"], group):
         raise web.HTTPForbidden(reason="Not authorized to manage group")
 
-    if not await storage_backend.group_exists(group):
-        raise web.HTTPNotFound(reason="Group does not exist")
-
     if "username" not in input_data:
         raise web.HTTPBadRequest(reason="Missing username in request body")
-    username = input_data["username"]
-    if not await storage_backend.user_exists(username):
-        await request.app["storage_backend"].create_user(username)
-    if await storage_backend.is_user_in_group(username, group):
-        raise web.HTTPBadRequest(reason="User already in group")
 
-    await storage_backend.add_member_to_group(username, group)
+    status = await storage_backend.add_member_to_existing_group(
+        input_data["username"], group
+    )
+    if status == GROUP_NOT_FOUND:
+        raise web.HTTPNotFound(reason="Group does not exist")
+    if status == ALREADY_MEMBER:
+        raise web.HTTPBadRequest(reason="User already in group")
     return web.Response(status=201)
 
 
+def _usernames(input_data: dict, key: str) -> List[str]:
+    if not isinstance(input_data, dict):
+        raise web.HTTPBadRequest(reason="Request body should be a JSON object")
+    usernames = input_data.get(key, [])
+    if not isinstance(usernames, list) or not all(
+        isinstance(username, str) for username in usernames
+    ):
+        raise web.HTTPBadRequest(reason=f"{key} should be a list of usernames")
+    return usernames
+
+
+async def patch_group(request: web.Request) -> web.Response:
+    """Handler for PATCH /groups/{group_id}/
+    add and remove many members of {group_id} at once
+    """
+    claims = utils.request_claims(request)
+    input_data = await utils.request_json(request)
+    storage_backend = utils.storage_backend(request)
+    group = request.match_info["group_uid"]
+    hostname = request.app["settings"]["hostname"]
+
+    if not is_authorized_for_group(claims["groups"], group):
+        raise web.HTTPForbidden(reason="Not authorized to manage group")
+
+    if not await storage_backend.group_exists(group):
+        raise web.HTTPNotFound(reason="Group does not exist")
+
+    to_add = _usernames(input_data, "add")
+    to_remove = _usernames(input_data, "remove")
+    if not to_add and not to_remove:
+        raise web.HTTPBadRequest(reason="Missing add or remove in request body")
+    if len(to_add) + len(to_remove) > MAX_MEMBERS_PER_PATCH:
+        raise web.HTTPRequestEntityTooLarge(
+            max_size=MAX_MEMBERS_PER_PATCH,
+            actual_size=len(to_add) + len(to_remove),
+            reason=f"At most {MAX_MEMBERS_PER_PATCH} members can be changed at once",
+        )
+    if set(to_add) & set(to_remove):
+        raise web.HTTPBadRequest(reason="Can't both add and remove a member")
+
+    members = {}
+    if to_add:
+        members.update(await storage_backend.add_members_to_group(to_add, group))
+    if to_remove:
+        members.update(
+            await storage_backend.remove_members_from_group(to_remove, group)
+        )
+    return serialize(
+        request,
+        Document(
+            url=f"{hostname}/groups/{group}/",
+            title=f"{group} members changes",
+            content={"members": members},
+        ),
+        headers={"Vary": "Origin"},
+    )
+
+
 async def delete_group(request: web.Request) -> web.Response:
     """Handler for POST /groups/{group_id}/
     add a user to {group_id}
     """
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
-    storage_backend = request.app["storage_backend"]
+    claims = utils.request_claims(request)
+    storage_backend = utils.storage_backend(request)
     group = request.match_info["group_uid"]
 
     if not is_authorized_for_group(claims["groups"], "staff"):
@@ -187,16 +291,16 @@ async def delete_group(request: web.Request) -> web.Response:
 
 async def delete_group_member(request: web.Request) -> web.Response:
     """Delete group member of group"""
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
-    storage_backend = request.app["storage_backend"]
+    claims = utils.request_claims(request)
+    storage_backend = utils.storage_backend(request)
     group = request.match_info["group_uid"]
     username = request.match_info["username"]
 
-    if not await storage_backend.group_exists(group):
-        raise web.HTTPNotFound(reason="Group does not exist")
     if not is_authorized_for_group(claims["groups"], group):
         raise web.HTTPForbidden(reason="Not authorized to manage group")
-    if not await storage_backend.is_user_in_group(username, group):
+    status = await storage_backend.remove_member_from_existing_group(username, group)
+    if status == GROUP_NOT_FOUND:
+        raise web.HTTPNotFound(reason="Group does not exist")
+    if status == NOT_MEMBER:
         raise web.HTTPNotFound(reason="User does not exist in group")
-    await storage_backend.delete_member_in_group(username, group)
     return web.Response(status=204)
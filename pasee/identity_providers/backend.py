@@ -1,7 +1,9 @@
 """Abstract class representing an Identity provider
 """
 from abc import ABC, abstractmethod
-from typing import Optional, Mapping, MutableMapping, Union, Any
+from typing import Dict, Optional, Mapping, MutableMapping, Union, Any
+
+import aiohttp
 
 Claims = MutableMapping[str, Union[Any]]
 LoginCredentials = Mapping[str, str]
@@ -12,13 +14,62 @@ BACKENDS = {
 }
 
 
+class _HTTPSession:
+    """Async context manager giving the shared HTTP session if any, or a
+    short-lived one.
+    """
+
+    def __init__(self, session: Optional[aiohttp.ClientSession]) -> None:
+        self.session = session
+        self.owned_session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> aiohttp.ClientSession:
+        if self.session is not None:
+            return self.session
+        self.owned_session = aiohttp.ClientSession()
+        return self.owned_session
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.owned_session is not None:
+            await self.owned_session.close()
+
+
 class IdentityProviderBackend(ABC):
-    """Abstract class for representing an Identity provider backend"""
+    """Abstract class for representing an Identity provider backend
+
+    session is the HTTP client shared by all identity providers, per
+    identity provider timeouts can be given in settings as timeout
+    (total, in seconds) and connect_timeout, the missing one being the
+    one of the session.
+    """
 
-    def __init__(self, settings, **kwargs) -> None:
+    def __init__(
+        self, settings, session: Optional[aiohttp.ClientSession] = None, **kwargs
+    ) -> None:
         self.settings = settings
+        self.session = session
+        self.request_options: Dict[str, Any] = {}
+        if "timeout" in settings or "connect_timeout" in settings:
+            default = session.timeout if session is not None else None
+            if not isinstance(default, aiohttp.ClientTimeout):
+                default = aiohttp.client.DEFAULT_TIMEOUT
+            self.request_options["timeout"] = aiohttp.ClientTimeout(
+                total=settings.get("timeout", default.total),
+                connect=settings.get("connect_timeout", default.connect),
+                sock_read=default.sock_read,
+                sock_connect=default.sock_connect,
+            )
         super().__init__(**kwargs)  # type: ignore # mypy issue 4335
 
+    def http_session(self) -> _HTTPSession:
+        """To be used as `async with self.http_session() as session:`."""
+        return _HTTPSession(self.session)
+
+    async def warm_up(self) -> None:
+        """Called once at startup, to prepare what can be prepared before
+        the first login (endpoints discovery, ...).
+        """
+
     @abstractmethod
     async def authenticate_user(self, data: LoginCredentials, step: int = 1) -> Claims:
         """Authenticate user"""
@@ -1,22 +1,42 @@
 """Identity provider for Kisee
 """
 import json
+import logging
 from typing import Optional, Dict
 
 import aiohttp
 from aiohttp import web
 import jwt
 
+from pasee import keys
 from pasee.identity_providers.backend import IdentityProviderBackend
 from pasee.identity_providers.backend import Claims, LoginCredentials
 
+logger = logging.getLogger(__name__)
+
+
+def load_public_keys(public_keys) -> Dict[str, keys.PublicKey]:
+    """Load public keys, indexed by kid.
+
+    public_keys is either a list of PEM, each one identified by its JWK
+    thumbprint, or a table of PEM by kid.
+    """
+    if isinstance(public_keys, dict):
+        return {kid: keys.load_public_key(pem) for kid, pem in public_keys.items()}
+    loaded_keys = [keys.load_public_key(pem) for pem in public_keys]
+    return {keys.key_id(public_key): public_key for public_key in loaded_keys}
+
 
 class KiseeIdentityProvider(IdentityProviderBackend):
     """Kisee Identity Provider"""
 
     def __init__(self, settings, **kwargs) -> None:
         super().__init__(settings, **kwargs)
-        self.public_keys = self.settings["settings"]["public_keys"]
+        public_keys = self.settings["settings"]["public_keys"]
+        self.public_keys = load_public_keys(public_keys)
+        # Kids of a list of keys are their thumbprints, which Kisee may
+        # not use: tokens with an unknown kid then try each key in turn.
+        self.kids_are_configured = isinstance(public_keys, dict)
         self.endpoint = self.settings["endpoint"]
         self.name = self.settings["name"]
         self.resource_to_endpoint: Dict = dict()
@@ -24,7 +44,7 @@ class KiseeIdentityProvider(IdentityProviderBackend):
     async def _identify_to_kisee(self, data: LoginCredentials):
         """Async request to identify to kisee"""
         create_token_endpoint = await self.get_endpoint("jwt")
-        async with aiohttp.ClientSession() as session:
+        async with self.http_session() as session:
             async with session.post(
                 create_token_endpoint,
                 headers={
@@ -32,6 +52,7 @@ class KiseeIdentityProvider(IdentityProviderBackend):
                     "Accept": "application/vnd.coreapi+json",
                 },
                 json=data,
+                **self.request_options,
             ) as response:
 
                 if response.status == 403:
@@ -47,14 +68,27 @@ class KiseeIdentityProvider(IdentityProviderBackend):
         return kisee_response
 
     def _decode_token(self, token: str):
-        """Decode token with public keys."""
-        for public_key in self.public_keys:
+        """Decode token with the public key designated by its kid header,
+        or with each public key in turn for tokens without kid (or with
+        an unknown one, unless kids are configured).
+        """
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.DecodeError as err:
+            raise web.HTTPUnauthorized(reason="Invalid token from kisee") from err
+        if kid in self.public_keys:
+            candidates = [self.public_keys[kid]]
+        elif kid is None or not self.kids_are_configured:
+            candidates = list(self.public_keys.values())
+        else:
+            candidates = []
+        for public_key in candidates:
             try:
                 decoded = jwt.decode(token, public_key, algorithms=["ES256"])
                 return decoded
-            except (ValueError, jwt.DecodeError):
+            except (ValueError, jwt.InvalidTokenError):
                 pass
-        raise web.HTTPInternalServerError()
+        raise web.HTTPUnauthorized(reason="Invalid token from kisee")
 
     async def authenticate_user(self, data: LoginCredentials, step: int = 1) -> Claims:
         if not all(key in data.keys() for key in {"login", "password"}):
@@ -72,6 +106,32 @@ class KiseeIdentityProvider(IdentityProviderBackend):
         decoded["sub"] = f"{self.name}-{decoded['sub']}"
         return decoded
 
+    async def _discover_endpoints(self):
+        """Fetch the json-home of Kisee, remembering all its resources."""
+        async with self.http_session() as session:
+            try:
+                async with session.get(
+                    self.endpoint,
+                    headers={"Accept": "application/json-home"},
+                    **self.request_options,
+                ) as response:
+                    root = await response.json()
+            except aiohttp.client_exceptions.ClientConnectorError as err:
+                raise web.HTTPServiceUnavailable(reason="kisee not responding") from err
+        self.resource_to_endpoint.update(
+            {
+                name: resource["href"]
+                for name, resource in root["resources"].items()
+                if "href" in resource
+            }
+        )
+
+    async def warm_up(self) -> None:
+        try:
+            await self._discover_endpoints()
+        except (web.HTTPException, aiohttp.ClientError, ValueError, KeyError) as err:
+            logger.warning("Can't discover %s endpoints: %r", self.name, err)
+
     async def get_endpoint(self, resource: Optional[str] = None):
 
         if not resource:
@@ -80,19 +140,8 @@ class KiseeIdentityProvider(IdentityProviderBackend):
         if resource == "register_user":
             resource = "users"
 
-        if resource in self.resource_to_endpoint:
-            return self.resource_to_endpoint[resource]
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    self.endpoint, headers={"Accept": "application/json-home"}
-                ) as response:
-                    root = await response.json()
-            except aiohttp.client_exceptions.ClientConnectorError as err:
-                raise web.HTTPServiceUnavailable(reason="kisee not responding") from err
-
-        self.resource_to_endpoint[resource] = root["resources"][resource]["href"]
+        if resource not in self.resource_to_endpoint:
+            await self._discover_endpoints()
         return self.resource_to_endpoint[resource]
 
     def get_name(self):
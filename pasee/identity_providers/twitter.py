@@ -18,8 +18,15 @@ class TwitterIdentityProvider(IdentityProviderBackend):
         self.consumer_key = self.settings["settings"]["consumer_key"]
         self.consumer_secret = self.settings["settings"]["consumer_secret"]
         self.callback_url = self.settings["settings"]["callback_url"]
-        self.client = TwitterClient(
-            consumer_key=self.consumer_key, consumer_secret=self.consumer_secret
+
+    def _client(self, **kwargs) -> TwitterClient:
+        """TwitterClient instances hold the state of an OAuth flow, so
+        each flow needs its own.
+        """
+        return TwitterClient(
+            consumer_key=self.consumer_key,
+            consumer_secret=self.consumer_secret,
+            **kwargs,
         )
 
     async def authenticate_user(self, data: LoginCredentials, step: int = 1) -> Claims:
@@ -27,14 +34,15 @@ class TwitterIdentityProvider(IdentityProviderBackend):
         for identity verification
         """
         if step == 1:
-            request_token, _, data = await self.client.get_request_token(
+            client = self._client()
+            request_token, _, data = await client.get_request_token(
                 oauth_callback=self.callback_url
             )
-            authorize_url = self.client.get_authorize_url(request_token)
+            authorize_url = client.get_authorize_url(request_token)
             return {"authorize_url": authorize_url}
         elif step == 2:
-            self.client.oauth_token = data["oauth_token"]
-            oauth_token, _, oauth_data = await self.client.get_access_token(
+            client = self._client(oauth_token=data["oauth_token"])
+            oauth_token, _, oauth_data = await client.get_access_token(
                 data["oauth_verifier"], request_token=data["oauth_token"]
             )
             return {"access_token": oauth_token, "sub": oauth_data["user_id"]}
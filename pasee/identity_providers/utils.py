@@ -1,11 +1,27 @@
 """Utils for handling identity providers
 """
+from typing import Dict, Mapping, Optional
+
+from pasee.identity_providers.backend import IdentityProviderBackend
 from pasee.utils import import_class
 
 
-def get_identity_provider_with_capability(settings, capability):
+def build_identity_providers(settings, **kwargs) -> Dict[str, IdentityProviderBackend]:
+    """Instantiate each configured identity provider, by name.
+
+    kwargs are given to each identity provider (like session).
+    """
+    return {
+        idp["name"]: import_class(idp["implementation"])(idp, **kwargs)
+        for idp in settings["identity_providers"]
+    }
+
+
+def get_identity_provider_with_capability(
+    identity_providers: Mapping[str, IdentityProviderBackend], capability
+) -> Optional[IdentityProviderBackend]:
     """Returns an identity provider with capability passed in argument"""
-    for idp in settings["identity_providers"]:
-        if capability in idp.get("capabilities", set()):
-            return import_class(idp["implementation"])(idp)
+    for identity_provider in identity_providers.values():
+        if capability in identity_provider.settings.get("capabilities", set()):
+            return identity_provider
     return None
@@ -0,0 +1,97 @@
+"""Loading of PEM encoded keys, and their identification as JSON Web Keys.
+
+Parsing a PEM is way slower than using an already loaded key, so keys
+are loaded once and handed as objects to PyJWT.
+"""
+from base64 import urlsafe_b64encode
+from functools import lru_cache
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+# Names of elliptic curves, as used in the "crv" member of JSON Web Keys.
+CURVES = {
+    "secp256r1": "P-256",
+    "secp384r1": "P-384",
+    "secp521r1": "P-521",
+    "secp256k1": "secp256k1",
+}
+
+# Loaded keys, as accepted by PyJWT in place of PEM strings (PyJWT type
+# hints only mention strings).
+PrivateKey = Any
+PublicKey = Any
+
+
+@lru_cache(maxsize=None)
+def load_private_key(pem: str) -> PrivateKey:
+    """Load a PEM encoded, unencrypted, private key (loaded keys are cached)."""
+    return serialization.load_pem_private_key(pem.strip().encode(), password=None)
+
+
+@lru_cache(maxsize=None)
+def load_public_key(pem: str) -> PublicKey:
+    """Load a PEM encoded public key (loaded keys are cached)."""
+    return serialization.load_pem_public_key(pem.strip().encode())
+
+
+def _b64url(data: bytes) -> str:
+    """Base64url encoding without padding, as used by JOSE."""
+    return urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def public_jwk(public_key: ec.EllipticCurvePublicKey) -> Dict[str, str]:
+    """The public key as a JSON Web Key (RFC 7517, RFC 7518 section 6.2)."""
+    numbers = public_key.public_numbers()
+    length = (public_key.curve.key_size + 7) // 8
+    return {
+        "kty": "EC",
+        "crv": CURVES[public_key.curve.name],
+        "x": _b64url(numbers.x.to_bytes(length, "big")),
+        "y": _b64url(numbers.y.to_bytes(length, "big")),
+    }
+
+
+def key_id(public_key: ec.EllipticCurvePublicKey) -> str:
+    """JWK thumbprint of the key (RFC 7638), used as its kid."""
+    jwk = json.dumps(public_jwk(public_key), sort_keys=True, separators=(",", ":"))
+    return _b64url(hashlib.sha256(jwk.encode()).digest())
+
+
+@lru_cache(maxsize=None)
+def signing_key_id(private_key: PrivateKey) -> str:
+    """kid of the tokens signed using private_key (loaded, or PEM)."""
+    if isinstance(private_key, str):
+        private_key = serialization.load_pem_private_key(
+            private_key.strip().encode(), password=None
+        )
+    return key_id(private_key.public_key())
+
+
+def published_public_keys(settings) -> Tuple[str, ...]:
+    """PEM of the public key, followed by the additional_public_keys
+    published while rotating keys.
+    """
+    return (settings["public_key"], *settings.get("additional_public_keys", ()))
+
+
+@lru_cache(maxsize=None)
+def public_keys_by_kid(pems: Tuple[str, ...]) -> Dict[str, PublicKey]:
+    """Loaded public keys, indexed by their kid."""
+    loaded_keys: List[PublicKey] = [
+        serialization.load_pem_public_key(pem.strip().encode()) for pem in pems
+    ]
+    return {key_id(public_key): public_key for public_key in loaded_keys}
+
+
+def jwks(pems: Tuple[str, ...]) -> Dict[str, List[Dict[str, str]]]:
+    """The public keys as a JSON Web Key Set (RFC 7517 section 5)."""
+    return {
+        "keys": [
+            {**public_jwk(public_key), "kid": kid, "use": "sig"}
+            for kid, public_key in public_keys_by_kid(pems).items()
+        ]
+    }
@@ -0,0 +1,173 @@
+"""Metrics, exposed on /metrics using the Prometheus text format:
+https://prometheus.io/docs/instrumenting/exposition_formats/
+
+Kept in memory by each process, using plain dicts indexed by label
+values, so recording is cheap enough to be done for each request.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+Labels = Tuple[str, ...]
+
+# Request latencies, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric, with a value per label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(suffix, formatted labels, value) of each sample."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """Lines of the text format for this metric."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        """Add amount to the value for the given label values."""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield "", _format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    """A value that goes up and down."""
+
+    type = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        """Subtract amount from the value for the given label values."""
+        self.inc(labels, -amount)
+
+    def set(self, labels: Labels, value: float) -> None:
+        """Set the value for the given label values."""
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    """Observed values counted in buckets, with their sum."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Labels = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Per label values: count of each bucket (not cumulative, the
+        # last one being +Inf), and sum.
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        """Record a value for the given label values."""
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self):
+        label_names = (*self.labels, "le")
+        for labels, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(
+                    label_names, (*labels, str(bound))
+                ), cumulative
+            formatted = _format_labels(self.labels, labels)
+            yield "_sum", formatted, self.sums[labels]
+            yield "_count", formatted, cumulative
+
+
+class Metrics:
+    """Metrics of a Pasee process."""
+
+    def __init__(self) -> None:
+        self.requests = Counter(
+            "pasee_http_requests_total",
+            "HTTP requests, by route, method and status.",
+            ("route", "method", "status"),
+        )
+        self.request_duration = Histogram(
+            "pasee_http_request_duration_seconds",
+            "Time spent processing HTTP requests, by route, method and status.",
+            ("route", "method", "status"),
+        )
+        self.requests_in_flight = Gauge(
+            "pasee_http_requests_in_flight",
+            "HTTP requests being processed, by route.",
+            ("route",),
+        )
+        self.storage_call_duration = Histogram(
+            "pasee_storage_call_duration_seconds",
+            "Time spent in storage backend calls, by method (see "
+            "[storage_backend.instrumentation]).",
+            ("method",),
+        )
+        self.tokens_issued = Counter(
+            "pasee_tokens_issued_total",
+            "Access and refresh token pairs issued, by identity provider and "
+            "grant (login or refresh).",
+            ("identity_provider", "grant"),
+        )
+
+    def render(self) -> str:
+        """All metrics in the text format."""
+        lines: List[str] = []
+        for metric in (
+            self.requests,
+            self.request_duration,
+            self.requests_in_flight,
+            self.tokens_issued,
+            self.storage_call_duration,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -1,27 +1,64 @@
 """middleswares for the pasee server
 """
 
-import json
+import asyncio
+import time
 from typing import Callable
 
 from aiohttp import web
 
-from pasee import Unauthorized, Unauthenticated
+from pasee import Unauthorized, Unauthenticated, utils
 from pasee.serializers import serialize
 
 
+@web.middleware
+async def record_metrics(request: web.Request, handler: Callable):
+    """Count and time requests, by route name (or path when unnamed),
+    method and status (see pasee.metrics).
+    """
+    metrics = request.app["metrics"]
+    route = request.match_info.route
+    if route.name:
+        route_name = route.name
+    elif route.resource is not None:
+        route_name = route.resource.canonical
+    else:
+        route_name = "unmatched"
+    metrics.requests_in_flight.inc((route_name,))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as err:
+        status = err.status
+        raise
+    finally:
+        labels = (route_name, request.method, str(status))
+        metrics.request_duration.observe(labels, time.perf_counter() - start)
+        metrics.requests.inc(labels)
+        metrics.requests_in_flight.dec((route_name,))
+
+
+@web.middleware
+async def shield_from_cancellation(request: web.Request, handler: Callable):
+    """Let handlers run to completion when clients disconnect, instead
+    of being cancelled (what handler_cancellation does in aiohttp 3.9).
+    """
+    return await asyncio.shield(handler(request))
+
+
 @web.middleware
 async def verify_input_body_is_json(
     request: web.Request, handler: Callable
 ) -> Callable:
     """
-    Middleware to verify that input body is of json format
+    Middleware to verify that input body is of json format, parsing it
+    once for the handlers (see utils.request_json).
     """
-    if request.has_body:
-        try:
-            await request.json()
-        except json.decoder.JSONDecodeError as err:
-            raise web.HTTPBadRequest(reason="Malformed JSON.") from err
+    if request.body_exists:
+        await utils.request_json(request)
     return await handler(request)
 
 
@@ -61,9 +98,11 @@ SECURITY_HEADERS = {
 }
 
 
-@web.middleware
-async def security_headers(request, handler):
-    """Add some security headers like CSP, Referrer-Policy and so on."""
-    response = await handler(request)
+async def security_headers(request: web.Request, response: web.StreamResponse) -> None:
+    """Add some security headers like CSP, Referrer-Policy and so on.
+
+    Used as an on_response_prepare signal, so streamed responses,
+    prepared by their handler, get them too.
+    """
+    del request
     response.headers.update(SECURITY_HEADERS)
-    return response
@@ -0,0 +1,90 @@
+"""Pagination of listings, using opaque signed cursors.
+
+A cursor holds the listing it comes from and the last element of the
+page it follows. It is signed so clients can only follow next links,
+leaving us free to change what's inside.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import hashlib
+import hmac
+import json
+
+from aiohttp import web
+
+from pasee.serializers import Link
+from pasee.storage_interface import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+def _b64encode(data: bytes) -> str:
+    return urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(settings, payload: bytes) -> bytes:
+    """Signature of payload, keyed from the private key so all processes
+    of a deployment agree on it.
+    """
+    key = hashlib.sha256(b"pasee-cursor:" + settings["private_key"].encode()).digest()
+    return hmac.new(key, payload, hashlib.sha256).digest()[:16]
+
+
+def encode_cursor(settings, listing: str, last_element: str) -> str:
+    """Cursor designating what follows last_element in listing."""
+    payload = json.dumps([listing, last_element], separators=(",", ":")).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_signature(settings, payload))}"
+
+
+def decode_cursor(settings, listing: str, cursor: str) -> str:
+    """Last element of the previous page, raise HTTPBadRequest if the
+    cursor was not given by us for this listing.
+    """
+    try:
+        payload, signature = (_b64decode(part) for part in cursor.split("."))
+        if not hmac.compare_digest(signature, _signature(settings, payload)):
+            raise ValueError("Bad signature")
+        cursor_listing, last_element = json.loads(payload)
+    except (ValueError, binascii.Error) as err:
+        raise web.HTTPBadRequest(reason="Invalid cursor") from err
+    if cursor_listing != listing:
+        raise web.HTTPBadRequest(reason="Invalid cursor")
+    return last_element
+
+
+def page_start(request: web.Request, listing: str, legacy_parameter: str) -> str:
+    """Last element of the previous page, from the cursor query string
+    parameter, or from legacy_parameter (last_element, after) giving
+    it in clear.
+    """
+    cursor = request.rel_url.query.get("cursor")
+    if cursor is not None:
+        return decode_cursor(request.app["settings"], listing, cursor)
+    return request.rel_url.query.get(legacy_parameter, "")
+
+
+def page_size(request: web.Request, default: int = DEFAULT_PAGE_SIZE) -> int:
+    """The page_size query string parameter, at most MAX_PAGE_SIZE."""
+    try:
+        size = int(request.rel_url.query.get("page_size", default))
+    except ValueError as err:
+        raise web.HTTPBadRequest(reason="page_size should be an integer") from err
+    if size < 1:
+        raise web.HTTPBadRequest(reason="page_size should be positive")
+    return min(size, MAX_PAGE_SIZE)
+
+
+def next_link(request: web.Request, listing: str, last_element: str) -> Link:
+    """Link to the page following last_element, keeping other query
+    string parameters.
+    """
+    query = {
+        key: value
+        for key, value in request.rel_url.query.items()
+        if key not in ("cursor", "after", "last_element")
+    }
+    query["cursor"] = encode_cursor(request.app["settings"], listing, last_element)
+    url = request.rel_url.with_query(query)
+    return Link(url=f"{request.app['settings']['hostname']}{url}")
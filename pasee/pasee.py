@@ -1,24 +1,109 @@
 """Pasee main module.
 """
 
+import asyncio
+import contextlib
 import logging
+from typing import Optional
 
+import aiohttp
 from aiohttp import web
+from aiohttp.log import access_logger
 import aiohttp_cors
 
 from pasee.middlewares import (
+    record_metrics,
+    shield_from_cancellation,
     verify_input_body_is_json,
     transform_unauthorized,
     coreapi_error_middleware,
     security_headers,
 )
-from pasee import views
+from pasee import keys, views
 from pasee.groups import views as group_views
+from pasee.identity_providers.utils import build_identity_providers
+from pasee.metrics import Metrics
 from pasee.tokens import views as token_views
 from pasee.users import views as user_views
-from pasee.utils import import_class
+from pasee.storage_backend.cache import CachedStorage
+from pasee.storage_backend.instrumentation import InstrumentedStorage
+from pasee.storage_interface import StorageBackend
+from pasee.utils import ClaimsCache, import_class
 
 logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Bigger request bodies are refused (413) before being parsed.
+DEFAULT_MAX_BODY_SIZE = 1024 ** 2
+
+
+def build_storage_backend(
+    storage_settings, metrics: Optional[Metrics] = None
+) -> StorageBackend:
+    """Instantiate the configured storage backend, instrumented if a
+    [storage_backend.instrumentation] section is given (recording in
+    metrics), and wrapped in a cache if a [storage_backend.cache]
+    section is given.
+    """
+    storage_backend = import_class(storage_settings["class"])(
+        storage_settings["options"]
+    )
+    if "instrumentation" in storage_settings:
+        storage_backend = InstrumentedStorage(
+            storage_backend, storage_settings["instrumentation"], metrics=metrics
+        )
+    if "cache" in storage_settings:
+        storage_backend = CachedStorage(storage_backend, storage_settings["cache"])
+    return storage_backend
+
+
+def build_http_client(http_settings) -> aiohttp.ClientSession:
+    """HTTP client shared by identity providers, so connections to them
+    are kept alive and reused across logins.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=http_settings.get("limit", 100),
+            limit_per_host=http_settings.get("limit_per_host", 0),
+            keepalive_timeout=http_settings.get("keepalive_timeout", 15),
+        ),
+        timeout=aiohttp.ClientTimeout(
+            total=http_settings.get("timeout", 30),
+            connect=http_settings.get("connect_timeout"),
+        ),
+    )
+
+
+async def start_server(
+    app: web.Application, settings, sock=None, handle_signals: bool = True
+) -> web.AppRunner:
+    """Serve app on the given listening socket, or on the configured host
+    and port, tuned by the [server] section. SIGINT and SIGTERM raise
+    GracefulExit if handle_signals is true.
+    """
+    server_settings = settings.get("server", {})
+    runner = web.AppRunner(
+        app,
+        handle_signals=handle_signals,
+        access_log=access_logger if server_settings.get("access_log", True) else None,
+        keepalive_timeout=server_settings.get("keepalive_timeout", 75.0),
+    )
+    await runner.setup()
+    shutdown_timeout = settings.get("shutdown_timeout", 60.0)
+    site: web.BaseSite
+    if sock is not None:
+        site = web.SockSite(runner, sock, shutdown_timeout=shutdown_timeout)
+    else:
+        site = web.TCPSite(
+            runner,
+            settings["host"],
+            settings["port"],
+            shutdown_timeout=shutdown_timeout,
+            backlog=server_settings.get("backlog", 128),
+        )
+    await site.start()
+    logger.info("Serving on %s", site.name)
+    return runner
 
 
 def identification_app(
@@ -26,19 +111,36 @@ def identification_app(
 ):
     """Identification provider entry point: builds and run a webserver."""
 
+    middlewares = [
+        record_metrics,
+        verify_input_body_is_json,
+        transform_unauthorized,
+        coreapi_error_middleware,
+    ]
+    if not settings.get("server", {}).get("handler_cancellation", True):
+        middlewares.insert(1, shield_from_cancellation)
     app = web.Application(
-        middlewares=[
-            verify_input_body_is_json,
-            transform_unauthorized,
-            coreapi_error_middleware,
-            security_headers,
-        ]
+        middlewares=middlewares,
+        client_max_size=settings.get("max_body_size", DEFAULT_MAX_BODY_SIZE),
     )
 
+    app.on_response_prepare.append(security_headers)
     app["settings"] = settings
-    app["storage_backend"] = import_class(settings["storage_backend"]["class"])(
-        settings["storage_backend"]["options"]
+    # Parsing keys is costly, load them once (they are cached by pasee.keys).
+    keys.load_private_key(settings["private_key"])
+    keys.load_public_key(settings["public_key"])
+    app["metrics"] = Metrics()
+    app["storage_backend"] = build_storage_backend(
+        settings["storage_backend"], app["metrics"]
     )
+    app["claims_cache"] = ClaimsCache(**settings.get("claims_cache", {}))
+    # Responses only depending on settings are rendered once, by route name.
+    app["precomputed"] = {
+        "get_root": views.render_root(settings),
+        "get_public_key": views.render_public_key(settings),
+        "get_jwks": views.render_jwks(settings),
+        "get_tokens": token_views.render_tokens(settings),
+    }
 
     async def on_startup_wrapper(app):
         """Wrapper to call __aenter__."""
@@ -48,13 +150,50 @@ def identification_app(
         """Wrapper to call __exit__."""
         await app["storage_backend"].__aexit__(None, None, None)
 
+    async def on_startup_http_client(app):
+        """The session has to be created from within the event loop."""
+        app["http_client"] = build_http_client(settings.get("http_client", {}))
+
+    async def on_cleanup_http_client(app):
+        await app["http_client"].close()
+
+    async def on_startup_identity_providers(app):
+        """Identity providers are built once, and warmed up in background
+        so a slow identity provider does not delay startup.
+        """
+        app["identity_providers"] = build_identity_providers(
+            settings, session=app["http_client"]
+        )
+        app["identity_providers_warm_up"] = asyncio.ensure_future(
+            asyncio.gather(
+                *[
+                    identity_provider.warm_up()
+                    for identity_provider in app["identity_providers"].values()
+                ],
+                return_exceptions=True,
+            )
+        )
+
+    async def on_cleanup_identity_providers(app):
+        app["identity_providers_warm_up"].cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await app["identity_providers_warm_up"]
+
     app.on_startup.append(on_startup_wrapper)
+    app.on_startup.append(on_startup_http_client)
+    app.on_startup.append(on_startup_identity_providers)
     app.on_cleanup.append(on_cleanup_wrapper)
+    app.on_cleanup.append(on_cleanup_identity_providers)
+    app.on_cleanup.append(on_cleanup_http_client)
 
     app.add_routes(
         [
             web.get("/", views.get_root, name="get_root"),
             web.get("/public-key/", views.get_public_key, name="get_public_key"),
+            web.get("/.well-known/jwks.json", views.get_jwks, name="get_jwks"),
+            web.get("/stats/", views.get_stats, name="get_stats"),
+            web.get("/metrics", views.get_metrics, name="get_metrics"),
+            web.get("/memberships/", views.get_memberships, name="get_memberships"),
             web.get("/tokens/", token_views.get_tokens, name="get_tokens"),
             web.post("/tokens/", token_views.post_token, name="post_tokens"),
             web.get("/users/", user_views.get_users),
@@ -66,6 +205,7 @@ def identification_app(
             web.get("/groups/{group_uid}/", group_views.get_group),
             web.delete("/groups/{group_uid}/", group_views.delete_group),
             web.post("/groups/{group_uid}/", group_views.post_group),
+            web.patch("/groups/{group_uid}/", group_views.patch_group),
             web.delete(
                 "/groups/{group_uid}/{username}/", group_views.delete_group_member
             ),
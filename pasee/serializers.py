@@ -1,21 +1,298 @@
 """Serialisers using coreapi, the idea is to (in the future) provide
 various representations of our resources like mason, json-ld, hal, ...
 
+Documents are built using the Document, Link, Field and Error classes
+below, mirroring the coreapi ones without their immutable containers,
+and encoded directly to Core JSON, giving the same bytes as
+coreapi.codecs.CoreJSONCodec. orjson is used if installed.
 """
+from functools import lru_cache
+import hashlib
+import json
+from typing import Any, AsyncGenerator, Dict, Iterable, Optional, Union
+from urllib.parse import urlsplit
+
 from aiohttp import web
 
-from pasee.vendor import coreapi
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+COREJSON = "application/vnd.coreapi+json"
+NDJSON = "application/x-ndjson"
+
+
+class Field:
+    """A field of a Link, like coreapi.Field."""
+
+    __slots__ = ("name", "required", "location")
+
+    def __init__(self, name: str, required: bool = False, location: str = "") -> None:
+        self.name = name
+        self.required = required
+        self.location = location
+
+
+class Link:
+    """An action the client may perform, like coreapi.Link."""
+
+    __slots__ = (
+        "url",
+        "action",
+        "encoding",
+        "transform",
+        "title",
+        "description",
+        "fields",
+    )
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str = "",
+        action: str = "",
+        encoding: str = "",
+        transform: str = "",
+        title: str = "",
+        description: str = "",
+        fields: Iterable[Field] = (),
+    ) -> None:
+        self.url = url
+        self.action = action
+        self.encoding = encoding
+        self.transform = transform
+        self.title = title
+        self.description = description
+        self.fields = fields
+
+
+class Document:
+    """A document, like coreapi.Document, its content being a plain dict."""
+
+    __slots__ = ("url", "title", "description", "content")
+
+    def __init__(
+        self,
+        url: str = "",
+        title: str = "",
+        description: str = "",
+        content: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.url = url
+        self.title = title
+        self.description = description
+        self.content = {} if content is None else content
+
+
+class Error:
+    """An error, like coreapi.Error, its content being a plain dict."""
+
+    __slots__ = ("title", "content")
+
+    def __init__(self, title: str = "", content: Optional[Dict[str, Any]] = None):
+        self.title = title
+        self.content = {} if content is None else content
+
+
+_ACTION_PRIORITIES = {"get": 0, "post": 1, "put": 2, "patch": 3, "delete": 4}
+
+
+def _key_sorting(item):
+    """Attributes first, alphabetically, then links by URL and action."""
+    key, value = item
+    if isinstance(value, Link):
+        return (1, (value.url, _ACTION_PRIORITIES.get(value.action, 5)))
+    return (0, key)
+
+
+def _escape_key(key: str) -> str:
+    """The '_type' and '_meta' keys are reserved, prefix them with '_'."""
+    if key.startswith("_") and key.lstrip("_") in ("type", "meta"):
+        return "_" + key
+    return key
+
+
+@lru_cache(maxsize=1024)
+def _prefix(url: str) -> str:
+    return "%s://%s" % urlsplit(url)[0:2]
+
+
+def _relative_url(base_url: Optional[str], url: str) -> str:
+    """The URL, relative to base_url when on the same host."""
+    if url == base_url:
+        return ""
+    if not base_url or not url:
+        return url
+    url_prefix = _prefix(url)
+    if url_prefix == _prefix(base_url) and url_prefix != "://":
+        return url.replace(url_prefix, "", 1)
+    return url
+
+
+def _items(content: Dict[str, Any], base_url: Optional[str]) -> Dict[str, Any]:
+    return {
+        _escape_key(key): to_primitive(value, base_url)
+        for key, value in sorted(content.items(), key=_key_sorting)
+    }
+
+
+def _document(node: Document, base_url: Optional[str]) -> Dict[str, Any]:
+    url = _relative_url(base_url, node.url)
+    document: Dict[str, Any] = {"_type": "document"}
+    meta = {}
+    if url:
+        meta["url"] = url
+    if node.title:
+        meta["title"] = node.title
+    if node.description:
+        meta["description"] = node.description
+    if meta:
+        document["_meta"] = meta
+    document.update(_items(node.content, url))
+    return document
+
+
+def _error(node: Error, base_url: Optional[str]) -> Dict[str, Any]:
+    error: Dict[str, Any] = {"_type": "error"}
+    if node.title:
+        error["_meta"] = {"title": node.title}
+    error.update(_items(node.content, base_url))
+    return error
+
+
+def _link(node: Link, base_url: Optional[str]) -> Dict[str, Any]:
+    link: Dict[str, Any] = {"_type": "link"}
+    url = _relative_url(base_url, node.url)
+    if url:
+        link["url"] = url
+    for attribute in ("action", "encoding", "transform", "title", "description"):
+        if getattr(node, attribute):
+            link[attribute] = getattr(node, attribute)
+    if node.fields:
+        link["fields"] = [_field(field) for field in node.fields]
+    return link
+
+
+def to_primitive(node: Any, base_url: Optional[str] = None) -> Any:
+    """Convert a node to what its Core JSON representation is made of."""
+    if isinstance(node, Document):
+        return _document(node, base_url)
+    if isinstance(node, Error):
+        return _error(node, base_url)
+    if isinstance(node, Link):
+        return _link(node, base_url)
+    if isinstance(node, dict):
+        return _items(node, base_url)
+    if isinstance(node, list):
+        return [to_primitive(value) for value in node]
+    return node
+
+
+def _field(field: Field) -> Dict[str, Any]:
+    # coreapi.Field stores its name in a tuple, hence the list.
+    primitive: Dict[str, Any] = {"name": [field.name]}
+    if field.required:
+        primitive["required"] = field.required
+    if field.location:
+        primitive["location"] = field.location
+    return primitive
+
+
+def json_dumps(data: Any) -> bytes:
+    """Compact JSON, as written by CoreJSONCodec."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+if orjson is not None:
+    dumps = orjson.dumps  # pylint: disable=no-member
+else:  # pragma: no cover
+    dumps = json_dumps
+
+
+def encode(document: Union[Document, Error, Dict[str, Any]]) -> bytes:
+    """The document in Core JSON, plain dicts being already Core JSON
+    primitives (as built by coreapi_error_middleware).
+    """
+    if isinstance(document, dict):
+        return dumps(document)
+    return dumps(to_primitive(document))
 
 
 def serialize(
-    request: web.Request, document: coreapi.Document, status=200, headers=None
+    request: web.Request, document: Document, status=200, headers=None
 ) -> web.Response:
     """Serialize the given document according to the Accept header of the
     given request.
     """
     del request
-    codec = coreapi.utils.negotiate_encoder([coreapi.codecs.CoreJSONCodec()], None)
-    content = codec.dump(document)
     return web.Response(
-        body=content, content_type=codec.media_type, headers=headers, status=status
+        body=encode(document), content_type=COREJSON, headers=headers, status=status
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of If-None-Match against etag (RFC 7232 3.2)."""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().replace("W/", "", 1) == etag
+        for candidate in if_none_match.split(",")
     )
+
+
+class Precomputed:
+    """A response rendered once, at startup, served with a strong ETag
+    and answering 304 Not Modified to matching If-None-Match.
+    """
+
+    __slots__ = ("body", "content_type", "headers")
+
+    def __init__(
+        self, body: bytes, content_type: str, cache_control: str = "no-cache"
+    ) -> None:
+        self.body = body
+        self.content_type = content_type
+        self.headers = {
+            "ETag": '"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            "Cache-Control": cache_control,
+            "Vary": "Origin",
+        }
+
+    def response(self, request: web.Request) -> web.Response:
+        """The response to request, empty if the client has it already."""
+        if _etag_matches(request.headers.get("If-None-Match"), self.headers["ETag"]):
+            return web.Response(status=304, headers=self.headers)
+        return web.Response(
+            body=self.body, content_type=self.content_type, headers=self.headers
+        )
+
+
+async def stream_ndjson(
+    request: web.Request,
+    objects: AsyncGenerator[Any, None],
+    objects_per_chunk: int = 1000,
+    headers=None,
+) -> web.StreamResponse:
+    """Write objects as they come, one JSON document per line, using
+    chunked transfer encoding so memory use does not depend on their
+    number. Compressed using gzip if the client accepts it.
+    """
+    response = web.StreamResponse(headers={**(headers or {}), "Content-Type": NDJSON})
+    response.enable_chunked_encoding()
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.enable_compression(web.ContentCoding.gzip)
+    await response.prepare(request)
+    lines = []
+    try:
+        async for obj in objects:  # pragma: no branch
+            lines.append(json.dumps(obj) + "\n")
+            if len(lines) == objects_per_chunk:
+                await response.write("".join(lines).encode())
+                lines = []
+    finally:
+        await objects.aclose()
+    await response.write("".join(lines).encode())
+    await response.write_eof()
+    return response
@@ -0,0 +1,170 @@
+"""In-process cache of user authorizations, wrapping any storage backend.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+import time
+
+from pasee.storage_interface import Memberships, StorageBackend, StorageBackendProxy
+
+
+class CachedStorage(StorageBackendProxy):
+    """Cache get_authorizations_for_user and
+    ensure_user_and_get_authorizations results, keyed by username.
+
+    Entries are evicted in LRU order when more than max_size users are
+    cached, and expire after ttl seconds. Membership mutations going
+    through this instance invalidate the affected entries, mutations
+    done by other processes are only seen after ttl seconds.
+
+    Options:
+    - max_size: Number of users to keep, defaults to 10000.
+    - ttl: Time to live of an entry in seconds, defaults to 60.
+    """
+
+    def __init__(self, backend: StorageBackend, options: dict, **kwargs) -> None:
+        super().__init__(backend, options, **kwargs)
+        self.max_size = options.get("max_size", 10000)
+        self.ttl = options.get("ttl", 60)
+        self.entries: OrderedDict[str, Tuple[float, List[str], bool]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Bumped on each invalidation (done once the mutation is over),
+        # so a lookup racing with a mutation does not store what it
+        # read before the mutation.
+        self.generation = 0
+
+    def invalidate_user(self, user: str) -> None:
+        """Forget what we know about the given user."""
+        self.generation += 1
+        self.entries.pop(user, None)
+
+    def invalidate_group(self, group: str) -> None:
+        """Forget what we know about members of the given group."""
+        self.generation += 1
+        for user, (_, groups, _) in list(self.entries.items()):
+            if group in groups:
+                del self.entries[user]
+
+    async def _authorizations(self, user: str, ensure_user: bool) -> List[str]:
+        """Cached groups of user.
+
+        Entries remember if they were fetched by
+        ensure_user_and_get_authorizations, only those tell that the
+        user exists.
+        """
+        entry = self.entries.get(user)
+        if (
+            entry is not None
+            and entry[0] > time.monotonic()
+            and (entry[2] or not ensure_user)
+        ):
+            self.hits += 1
+            self.entries.move_to_end(user)
+            return list(entry[1])
+        self.misses += 1
+        generation = self.generation
+        if ensure_user:
+            groups = await self.backend.ensure_user_and_get_authorizations(user)
+        else:
+            groups = await self.backend.get_authorizations_for_user(user)
+        if generation == self.generation:
+            self.entries[user] = (
+                time.monotonic() + self.ttl,
+                list(groups),
+                ensure_user,
+            )
+            self.entries.move_to_end(user)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return groups
+
+    async def get_authorizations_for_user(self, user) -> List[str]:
+        return await self._authorizations(user, ensure_user=False)
+
+    async def ensure_user_and_get_authorizations(self, user: str) -> List[str]:
+        return await self._authorizations(user, ensure_user=True)
+
+    async def delete_group(self, group: str):
+        try:
+            return await self.backend.delete_group(group)
+        finally:
+            self.invalidate_group(group)
+
+    async def delete_user(self, username):
+        try:
+            return await self.backend.delete_user(username)
+        finally:
+            self.invalidate_user(username)
+
+    async def add_member_to_group(self, member, group) -> bool:
+        try:
+            return await self.backend.add_member_to_group(member, group)
+        finally:
+            self.invalidate_user(member)
+
+    async def delete_member_in_group(self, member, group):
+        try:
+            return await self.backend.delete_member_in_group(member, group)
+        finally:
+            self.invalidate_user(member)
+
+    async def delete_members_in_group(self, group):
+        try:
+            return await self.backend.delete_members_in_group(group)
+        finally:
+            self.invalidate_group(group)
+
+    async def add_members_to_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        members = list(members)
+        try:
+            return await self.backend.add_members_to_group(members, group)
+        finally:
+            for member in members:
+                self.invalidate_user(member)
+
+    async def remove_members_from_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        members = list(members)
+        try:
+            return await self.backend.remove_members_from_group(members, group)
+        finally:
+            for member in members:
+                self.invalidate_user(member)
+
+    async def add_member_to_existing_group(self, member: str, group: str) -> str:
+        try:
+            return await self.backend.add_member_to_existing_group(member, group)
+        finally:
+            self.invalidate_user(member)
+
+    async def remove_member_from_existing_group(self, member: str, group: str) -> str:
+        try:
+            return await self.backend.remove_member_from_existing_group(member, group)
+        finally:
+            self.invalidate_user(member)
+
+    async def bulk_load(
+        self, users: Iterable[str], groups: Iterable[str], memberships: Memberships
+    ) -> None:
+        try:
+            await self.backend.bulk_load(users, groups, memberships)
+        finally:
+            self.generation += 1
+            self.entries.clear()
+
+    def primary(self) -> StorageBackend:
+        """Reads skip the cache and go to the primary, writes still go
+        through the cache so it gets invalidated.
+        """
+        return StorageBackendProxy(self, self.options, reader=self.backend.primary())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.backend.stats(),
+            "authorizations_cache_hits": self.hits,
+            "authorizations_cache_misses": self.misses,
+            "authorizations_cache_size": len(self.entries),
+        }
@@ -1,53 +1,461 @@
 """sqlite
 """
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Callable, Dict, Iterable, List, Optional, Set
+from typing import TypeVar
+import asyncio
+import itertools
 import logging
 import sqlite3
+import threading
 
-from pasee.storage_interface import StorageBackend
+from pasee.storage_interface import StorageBackend, DEFAULT_PAGE_SIZE, Memberships
+from pasee.storage_interface import MEMBER_ADDED, ALREADY_MEMBER
+from pasee.storage_interface import MEMBER_REMOVED, NOT_MEMBER, GROUP_NOT_FOUND
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")  # pylint: disable=invalid-name
 
-class DemoSqliteStorage(StorageBackend):
-    """Exposing a simple backend that fetch authorizations from a dictionary."""
+# Users per query when looking up many users, older sqlite versions
+# accepting at most 999 parameters per query.
+MAX_QUERY_USERS = 500
 
-    def __init__(self, options: dict, **kwargs) -> None:
-        super().__init__(options, **kwargs)
-        self.file = options["file"]
-        self.connection = None
 
-    async def __aenter__(self):
-        self.connection = sqlite3.connect(self.file)
-        cursor = self.connection.cursor()
+def _create_schema(connection: sqlite3.Connection) -> None:
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users(
+            name TEXT PRIMARY KEY,
+            is_banned BOOLEAN DEFAULT FALSE
 
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users(
-                name TEXT PRIMARY KEY,
-                is_banned BOOLEAN DEFAULT FALSE
+        );
+        """
+    )
+    cursor.execute("CREATE TABLE IF NOT EXISTS groups(name TEXT PRIMARY KEY);")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_in_group(
+            id INTEGER PRIMARY KEY,
+            user TEXT,
+            group_name TEXT
+        );
+        """
+    )
 
-            );
-            """
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS group_name_index
+        on groups (name);
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS user_in_group_group_name_user_index
+        on user_in_group (group_name, user);
+        """
+    )
+
+
+def _get_authorizations_for_user(
+    connection: sqlite3.Connection, user: str
+) -> List[str]:
+    results = connection.execute(
+        """
+        SELECT groups.name
+        FROM groups
+        JOIN user_in_group
+            ON groups.name = user_in_group.group_name
+        WHERE
+            user_in_group.user = :user
+        ORDER BY name ASC
+        """,
+        {"user": user},
+    )
+    return [elem[0] for elem in results]
+
+
+def _create_group(connection: sqlite3.Connection, group_name: str) -> None:
+    with connection:
+        connection.execute(
+            "INSERT INTO groups (name) VALUES (:group_name)", {"group_name": group_name}
+        )
+
+
+def _get_groups(
+    connection: sqlite3.Connection, last_element: str, page_size: int
+) -> List[str]:
+    results = connection.execute(
+        """
+        SELECT name
+        FROM groups
+        WHERE name > :last_element
+        ORDER BY name ASC
+        LIMIT :page_size
+        """,
+        {"last_element": last_element, "page_size": page_size},
+    )
+    return [group[0] for group in results]
+
+
+def _get_groups_of_user(
+    connection: sqlite3.Connection, user: str, last_element: str, page_size: int
+) -> List[str]:
+    results = connection.execute(
+        """
+        SELECT groups.name
+        FROM groups
+        JOIN user_in_group
+            ON groups.name = user_in_group.group_name
+        WHERE
+            user_in_group.user = :user
+            AND groups.name > :last_element
+        ORDER BY groups.name ASC
+        LIMIT :page_size
+        """,
+        {"user": user, "last_element": last_element, "page_size": page_size},
+    )
+    return [group[0] for group in results]
+
+
+def _delete_group(connection: sqlite3.Connection, group: str) -> None:
+    with connection:
+        connection.execute(
+            "DELETE FROM user_in_group WHERE group_name = :group", {"group": group}
+        )
+        connection.execute("DELETE FROM groups WHERE name = :group", {"group": group})
+
+
+def _get_users(
+    connection: sqlite3.Connection, last_element: str, page_size: int
+) -> List[str]:
+    results = connection.execute(
+        "SELECT * FROM users WHERE name > :name ORDER BY name ASC LIMIT :page_size",
+        {"name": last_element, "page_size": page_size},
+    )
+    return [elem[0] for elem in results]
+
+
+def _get_memberships(
+    connection: sqlite3.Connection, last_element: str, page_size: int
+) -> List[Dict[str, Any]]:
+    results = connection.execute(
+        """
+        SELECT users.name, users.is_banned, groups.name
+        FROM (
+            SELECT name, is_banned
+            FROM users
+            WHERE name > :last_element
+            ORDER BY name ASC
+            LIMIT :page_size
+        ) AS users
+        LEFT JOIN user_in_group ON user_in_group.user = users.name
+        LEFT JOIN groups ON groups.name = user_in_group.group_name
+        ORDER BY users.name ASC, groups.name ASC
+        """,
+        {"last_element": last_element, "page_size": page_size},
+    )
+    memberships: List[Dict[str, Any]] = []
+    for username, is_banned, group in results:
+        if not memberships or memberships[-1]["username"] != username:
+            memberships.append(
+                {"username": username, "is_banned": bool(is_banned), "groups": []}
+            )
+        if group is not None:
+            memberships[-1]["groups"].append(group)
+    return memberships
+
+
+def _count(connection: sqlite3.Connection, table: str) -> int:
+    query = {
+        "users": "SELECT count(*) FROM users",
+        "groups": "SELECT count(*) FROM groups",
+    }[table]
+    return connection.execute(query).fetchone()[0]
+
+
+def _get_user(connection: sqlite3.Connection, username: str) -> Optional[dict]:
+    result = connection.execute(
+        """
+        SELECT name, is_banned
+        FROM users
+        WHERE name = :username
+        """,
+        {"username": username},
+    ).fetchone()
+    if not result:
+        return None
+    return {"username": result[0], "is_banned": result[1]}
+
+
+def _get_members_of_group(
+    connection: sqlite3.Connection,
+    group: str,
+    last_element: str = "",
+    page_size: Optional[int] = None,
+) -> List[str]:
+    results = connection.execute(
+        """
+        SELECT user
+        FROM user_in_group
+        WHERE group_name = :group
+        AND user > :last_element
+        ORDER BY user ASC
+        LIMIT :page_size
+        """,
+        {
+            "group": group,
+            "last_element": last_element,
+            "page_size": -1 if page_size is None else page_size,
+        },
+    )
+    return [member[0] for member in results]
+
+
+def _group_exists(connection: sqlite3.Connection, group: str) -> bool:
+    result = connection.execute(
+        "SELECT 1 FROM groups WHERE name = :group", {"group": group}
+    ).fetchone()
+    return bool(result)
+
+
+def _create_user(connection: sqlite3.Connection, username: str) -> None:
+    with connection:
+        connection.execute(
+            "INSERT INTO users(name) VALUES(:username)", {"username": username}
         )
-        cursor.execute("CREATE TABLE IF NOT EXISTS groups(name TEXT PRIMARY KEY);")
-        cursor.execute(
+
+
+def _delete_user(connection: sqlite3.Connection, username: str) -> None:
+    with connection:
+        connection.execute(
+            "DELETE FROM user_in_group WHERE user = :username", {"username": username}
+        )
+        connection.execute(
+            "DELETE FROM users WHERE name = :username", {"username": username}
+        )
+
+
+def _user_exists(connection: sqlite3.Connection, user: str) -> bool:
+    result = connection.execute(
+        "SELECT 1 FROM users WHERE name = :user", {"user": user}
+    ).fetchone()
+    return bool(result)
+
+
+def _is_user_in_group(connection: sqlite3.Connection, user: str, group: str) -> bool:
+    result = connection.execute(
+        """
+            SELECT 1
+            FROM user_in_group
+            WHERE
+                user = :user
+            AND group_name = :group
+        """,
+        {"user": user, "group": group},
+    ).fetchone()
+    return bool(result)
+
+
+def _add_member_to_group(
+    connection: sqlite3.Connection, member: str, group: str
+) -> None:
+    with connection:
+        connection.execute(
             """
-            CREATE TABLE IF NOT EXISTS user_in_group(
-                id INTEGER PRIMARY KEY,
-                user TEXT,
-                group_name TEXT
-            );
+            INSERT INTO user_in_group(
+                user, group_name
+            ) VALUES (
+                :user, :group
+            )
+            """,
+            {"user": member, "group": group},
+        )
+
+
+def _delete_member_in_group(
+    connection: sqlite3.Connection, member: str, group: str
+) -> None:
+    with connection:
+        connection.execute(
             """
+            DELETE FROM user_in_group
+            WHERE
+                user = :user
+            AND group_name = :group
+            """,
+            {"user": member, "group": group},
         )
 
-        cursor.execute(
+
+def _delete_members_in_group(connection: sqlite3.Connection, group: str) -> None:
+    with connection:
+        connection.execute(
             """
-            CREATE UNIQUE INDEX IF NOT EXISTS group_name_index
-            on groups (name);
+            DELETE FROM user_in_group
+            WHERE group_name = :group
+            """,
+            {"group": group},
+        )
+
+
+def _members_among(
+    connection: sqlite3.Connection, users: List[str], group: str
+) -> Set[str]:
+    """The given users being members of group, queried by chunks of
+    users to stay below the sqlite limit on query parameters.
+    """
+    members: Set[str] = set()
+    for start in range(0, len(users), MAX_QUERY_USERS):
+        chunk = users[start : start + MAX_QUERY_USERS]  # noqa: E203
+        placeholders = ", ".join("?" * len(chunk))
+        results = connection.execute(
+            "SELECT user FROM user_in_group "  # nosec (only placeholders added)
+            f"WHERE group_name = ? AND user IN ({placeholders})",
+            (group, *chunk),
+        )
+        members.update(result[0] for result in results)
+    return members
+
+
+def _add_members_to_group(
+    connection: sqlite3.Connection, members: Iterable[str], group: str
+) -> Dict[str, str]:
+    members = list(dict.fromkeys(members))
+    with connection:
+        current_members = _members_among(connection, members, group)
+        connection.executemany(
+            "INSERT OR IGNORE INTO users(name) VALUES(?)",
+            ((member,) for member in members),
+        )
+        connection.executemany(
+            "INSERT INTO user_in_group(user, group_name) VALUES (?, ?)",
+            ((member, group) for member in members if member not in current_members),
+        )
+    return {
+        member: ALREADY_MEMBER if member in current_members else MEMBER_ADDED
+        for member in members
+    }
+
+
+def _remove_members_from_group(
+    connection: sqlite3.Connection, members: Iterable[str], group: str
+) -> Dict[str, str]:
+    members = list(dict.fromkeys(members))
+    with connection:
+        current_members = _members_among(connection, members, group)
+        connection.executemany(
+            "DELETE FROM user_in_group WHERE user = ? AND group_name = ?",
+            ((member, group) for member in members if member in current_members),
+        )
+    return {
+        member: MEMBER_REMOVED if member in current_members else NOT_MEMBER
+        for member in members
+    }
+
+
+def _ensure_user_and_get_authorizations(
+    connection: sqlite3.Connection, user: str
+) -> List[str]:
+    with connection:
+        connection.execute(
+            "INSERT OR IGNORE INTO users(name) VALUES(:user)", {"user": user}
+        )
+    return _get_authorizations_for_user(connection, user)
+
+
+def _add_member_to_existing_group(
+    connection: sqlite3.Connection, member: str, group: str
+) -> str:
+    with connection:
+        if not _group_exists(connection, group):
+            return GROUP_NOT_FOUND
+        if _is_user_in_group(connection, member, group):
+            return ALREADY_MEMBER
+        connection.execute(
+            "INSERT OR IGNORE INTO users(name) VALUES(:user)", {"user": member}
+        )
+        _add_member_to_group(connection, member, group)
+    return MEMBER_ADDED
+
+
+def _remove_member_from_existing_group(
+    connection: sqlite3.Connection, member: str, group: str
+) -> str:
+    with connection:
+        if not _group_exists(connection, group):
+            return GROUP_NOT_FOUND
+        if not _is_user_in_group(connection, member, group):
+            return NOT_MEMBER
+        _delete_member_in_group(connection, member, group)
+    return MEMBER_REMOVED
+
+
+def _bulk_load(
+    connection: sqlite3.Connection,
+    users: Iterable[str],
+    groups: Iterable[str],
+    memberships: Memberships,
+) -> None:
+    memberships = list(memberships)
+    with connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO users(name) VALUES(?)",
+            (
+                (user,)
+                for user in itertools.chain(users, (user for user, _ in memberships))
+            ),
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO groups(name) VALUES(?)",
+            ((group,) for group in groups),
+        )
+        connection.executemany(
             """
+            INSERT INTO user_in_group(user, group_name)
+            SELECT :user, :group
+            WHERE EXISTS (SELECT 1 FROM groups WHERE name = :group)
+            AND NOT EXISTS (
+                SELECT 1 FROM user_in_group
+                WHERE group_name = :group AND user = :user
+            )
+            """,
+            ({"user": user, "group": group} for user, group in memberships),
+        )
+
+
+def _ban_user(connection: sqlite3.Connection, username: str, ban: bool) -> None:
+    with connection:
+        connection.execute(
+            "UPDATE users SET is_banned = :ban WHERE name = :username",
+            {"username": username, "ban": ban},
         )
 
+
+class DemoSqliteStorage(StorageBackend):  # pylint: disable=too-many-public-methods
+    """Exposing a simple backend that fetch authorizations from a dictionary."""
+
+    def __init__(self, options: dict, **kwargs) -> None:
+        super().__init__(options, **kwargs)
+        self.file = options["file"]
+        self.connection = None
+
+    @property
+    def closed(self) -> bool:
+        """True if the storage is not (or no longer) used in a context manager."""
+        return self.connection is None
+
+    async def _run(self, query: Callable[..., T], *args: Any) -> T:
+        """Run a query function, giving it a connection as first argument."""
+        if self.connection is None:
+            raise RuntimeError("This class should be used in a context manager.")
+        return query(self.connection, *args)
+
+    async def __aenter__(self):
+        self.connection = sqlite3.connect(self.file)
+        await self._run(_create_schema)
+
     async def __aexit__(self, exc_type, exc_value, traceback):
         self.connection.close()
 
@@ -63,242 +471,188 @@ class DemoSqliteStorage(StorageBackend):
             group_name TEXT
         );"
         """
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-
-        results = cursor.execute(
-            """
-            SELECT groups.name
-            FROM groups
-            JOIN user_in_group
-                ON groups.name = user_in_group.group_name
-            WHERE
-                user_in_group.user = :user
-            ORDER BY name ASC
-            """,
-            {"user": user},
-        )
-        return [elem[0] for elem in results]
+        return await self._run(_get_authorizations_for_user, user)
 
     async def create_group(self, group_name):
         """Staff member adds group method"""
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-
-        cursor.execute(
-            "INSERT INTO groups (name) VALUES (:group_name)", {"group_name": group_name}
-        )
-        self.connection.commit()
+        await self._run(_create_group, group_name)
 
-    async def get_groups(self, last_element: str = "") -> List[str]:
+    async def get_groups(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
         """Get groups paginated by group name in alphabetical order
-        List of groups is returned by page of 20
+        List of groups is returned by page of page_size
         last_element is the last know element returned in previous page
         So passing the last element to this function will retrieve the next page
         """
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        results = cursor.execute(
-            """
-            SELECT name
-            FROM groups
-            WHERE name > :last_element
-            ORDER BY name ASC
-            LIMIT 20
-            """,
-            {"last_element": last_element},
-        )
-        groups = [group[0] for group in results]
-        cursor.close()
-        return groups
+        return await self._run(_get_groups, last_element, page_size)
 
-    async def get_groups_of_user(self, user: str, last_element: str = "") -> List[str]:
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-
-        cursor = self.connection.cursor()
-        results = cursor.execute(
-            """
-            SELECT groups.name
-            FROM groups
-            JOIN user_in_group
-                ON groups.name = user_in_group.group_name
-            WHERE
-                user_in_group.user = :user
-                AND groups.name > :last_element
-            ORDER BY groups.name ASC
-            LIMIT 20
-            """,
-            {"user": user, "last_element": last_element},
-        )
-        groups = [group[0] for group in results]
-        cursor.close()
-        return groups
+    async def get_groups_of_user(
+        self, user: str, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        return await self._run(_get_groups_of_user, user, last_element, page_size)
 
     async def delete_group(self, group: str):
         """Delete group"""
-        await self.delete_members_in_group(group)
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        cursor.execute("DELETE FROM groups WHERE name = :group", {"group": group})
-        self.connection.commit()
+        await self._run(_delete_group, group)
 
-    async def get_users(self, last_element: str = ""):
+    async def get_users(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
         """Get users"""
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        results = cursor.execute(
-            "SELECT * FROM users WHERE name > :name ORDER BY name ASC LIMIT 50",
-            {"name": last_element},
-        )
-        return [elem[0] for elem in results]
+        return await self._run(_get_users, last_element, page_size)
 
-    async def get_user(self, username: str = ""):
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
+    async def iter_memberships(
+        self, page_size: int = 1000
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Iterate over users with their groups, by pages of page_size
+        users, each page read using a single query.
+        """
+        last_element = ""
+        while True:
+            memberships = await self._run(_get_memberships, last_element, page_size)
+            for membership in memberships:
+                yield membership
+            if len(memberships) < page_size:
+                return
+            last_element = memberships[-1]["username"]
+
+    async def approximate_count(self, table: str) -> Optional[int]:
+        """Exact count, as tables of a demo backend are small."""
+        return await self._run(_count, table)
 
-        cursor = self.connection.cursor()
-        result = cursor.execute(
-            """
-            SELECT name, is_banned
-            FROM users
-            WHERE name = :username
-            """,
-            {"username": username},
-        ).fetchone()
-        if not result:
-            return None
-        return {"username": result[0], "is_banned": result[1]}
+    async def get_user(self, username: str = ""):
+        return await self._run(_get_user, username)
 
-    async def get_members_of_group(self, group: str) -> List[str]:
+    async def get_members_of_group(
+        self, group: str, last_element: str = "", page_size: Optional[int] = None
+    ) -> List[str]:
         """Get members of group"""
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-
-        query_result = cursor.execute(
-            """
-            SELECT user
-            FROM user_in_group
-            WHERE group_name = :group
-        """,
-            {"group": group},
-        )
-        members = [member[0] for member in query_result]
-        return members
+        return await self._run(_get_members_of_group, group, last_element, page_size)
 
     async def group_exists(self, group: str) -> bool:
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        result = cursor.execute(
-            "SELECT 1 FROM groups WHERE name = :group", {"group": group}
-        ).fetchone()
-
-        return bool(result)
+        return await self._run(_group_exists, group)
 
     async def create_user(self, username):
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        cursor.execute(
-            "INSERT INTO users(name) VALUES(:username)", {"username": username}
-        )
-        self.connection.commit()
+        await self._run(_create_user, username)
 
     async def delete_user(self, username):
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        cursor.execute(
-            "DELETE FROM user_in_group WHERE user = :username", {"username": username}
-        )
-        cursor.execute(
-            "DELETE FROM users WHERE name = :username", {"username": username}
-        )
-        self.connection.commit()
+        await self._run(_delete_user, username)
 
     async def user_exists(self, user: str) -> bool:
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        result = cursor.execute(
-            "SELECT 1 FROM users WHERE name = :user", {"user": user}
-        ).fetchone()
-        return bool(result)
+        return await self._run(_user_exists, user)
 
     async def is_user_in_group(self, user: str, group: str) -> bool:
-        if self.connection is None:
-            raise RuntimeError("This class should be used in a context manager.")
-        cursor = self.connection.cursor()
-        result = cursor.execute(
-            """
-                SELECT 1
-                FROM user_in_group
-                WHERE
-                    user = :user
-                AND group_name = :group
-            """,
-            {"user": user, "group": group},
-        ).fetchone()
-        return bool(result)
+        return await self._run(_is_user_in_group, user, group)
 
     async def add_member_to_group(self, member, group):
         """Staff adds member to group"""
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            INSERT INTO user_in_group(
-                user, group_name
-            ) VALUES (
-                :user, :group
-            )
-            """,
-            {"user": member, "group": group},
-        )
-        self.connection.commit()
+        await self._run(_add_member_to_group, member, group)
 
     async def delete_member_in_group(self, member, group):
         """Delete member in group"""
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            DELETE FROM user_in_group
-            WHERE
-                user = :user
-            AND group_name = :group
-            """,
-            {"user": member, "group": group},
-        )
-        self.connection.commit()
+        await self._run(_delete_member_in_group, member, group)
 
     async def delete_members_in_group(self, group):
         """Delete all members of group"""
-        if self.connection is None:
+        if self.closed:
             return
-
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            DELETE FROM user_in_group
-            WHERE group_name = :group
-            """,
-            {"group": group},
-        )
-        self.connection.commit()
+        await self._run(_delete_members_in_group, group)
 
     async def ban_user(self, username: str, ban: bool = True):
         """Ban user"""
-        if self.connection is None:
+        await self._run(_ban_user, username, ban)
+
+    async def add_members_to_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        return await self._run(_add_members_to_group, members, group)
+
+    async def remove_members_from_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        return await self._run(_remove_members_from_group, members, group)
+
+    async def ensure_user_and_get_authorizations(self, user: str) -> List[str]:
+        return await self._run(_ensure_user_and_get_authorizations, user)
+
+    async def add_member_to_existing_group(self, member: str, group: str) -> str:
+        return await self._run(_add_member_to_existing_group, member, group)
+
+    async def remove_member_from_existing_group(self, member: str, group: str) -> str:
+        return await self._run(_remove_member_from_existing_group, member, group)
+
+    async def bulk_load(
+        self, users: Iterable[str], groups: Iterable[str], memberships: Memberships
+    ) -> None:
+        """Create everything in a single transaction, using executemany."""
+        await self._run(_bulk_load, users, groups, memberships)
+
+
+class ThreadedSqliteStorage(DemoSqliteStorage):
+    """Sqlite backend running its queries on a bounded pool of threads,
+    so blocking sqlite3 calls never stall the event loop.
+
+    Each worker thread lazily opens its own connection, and the database
+    is switched to WAL mode so readers don't wait on the occasional
+    writer. As each thread has its own connection, an on-disk database
+    file is required.
+
+    Options:
+    - file: Path to the sqlite database.
+    - workers: Number of threads (and connections), defaults to 4.
+    """
+
+    def __init__(self, options: dict, **kwargs) -> None:
+        super().__init__(options, **kwargs)
+        if self.file == ":memory:":
+            raise ValueError(
+                "ThreadedSqliteStorage needs a database file, "
+                "each thread would get its own in-memory database."
+            )
+        self.workers = options.get("workers", 4)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+
+    @property
+    def closed(self) -> bool:
+        return self.executor is None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the connection of the current worker thread, opening it if needed.
+
+        The connection is only ever used by this thread, check_same_thread
+        is disabled only to let __aexit__ close it.
+        """
+        try:
+            return self.local.connection
+        except AttributeError:
+            connection = sqlite3.connect(self.file, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+            self.connections.append(connection)
+            return connection
+
+    def _call(self, query: Callable[..., T], args: tuple) -> T:
+        return query(self._connect(), *args)
+
+    async def _run(self, query: Callable[..., T], *args: Any) -> T:
+        if self.executor is None:
             raise RuntimeError("This class should be used in a context manager.")
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, self._call, query, args
+        )
 
-        cursor = self.connection.cursor()
-        cursor.execute(
-            "UPDATE users SET is_banned = :ban WHERE name = :username",
-            {"username": username, "ban": ban},
+    async def __aenter__(self):
+        self.executor = ThreadPoolExecutor(  # pylint: disable=consider-using-with
+            max_workers=self.workers, thread_name_prefix="pasee-sqlite"
         )
+        await self._run(_create_schema)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
@@ -0,0 +1,124 @@
+"""Instrumentation of any storage backend: timing of each call, and
+logging of slow ones.
+"""
+import inspect
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from pasee.metrics import Metrics
+from pasee.storage_interface import StorageBackend, StorageBackendProxy
+
+logger = logging.getLogger(__name__)
+
+# Arguments holding usernames, not to be logged.
+USERNAME_PARAMETERS = {
+    "user",
+    "username",
+    "member",
+    "members",
+    "users",
+    "memberships",
+    "last_element",
+}
+
+
+class InstrumentedStorage(StorageBackendProxy):
+    """Time each call to the wrapped backend, in the
+    pasee_storage_call_duration_seconds histogram of metrics, and log
+    slow calls with their arguments, usernames redacted.
+
+    Iterations (iter_members_of_group, iter_memberships) are not timed,
+    their duration depending on their consumer.
+
+    Options:
+    - slow_call_threshold: Calls taking more seconds are logged,
+      defaults to 0.1.
+    - explain: Log the plan of slow queries, as given by the explain()
+      method of the backend (EXPLAIN on PostgreSQL), defaults to false.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        options: dict,
+        metrics: Optional[Metrics] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(backend, options, **kwargs)
+        self.metrics = Metrics() if metrics is None else metrics
+        self.slow_call_threshold = options.get("slow_call_threshold", 0.1)
+        self.explain_slow_calls = options.get("explain", False)
+
+    async def _slow_call(
+        self, method: str, duration: float, arguments: Dict[str, Any]
+    ) -> None:
+        logger.warning(
+            "Slow storage call: %s(%s) took %.3fs",
+            method,
+            ", ".join(f"{name}={value!r}" for name, value in redact(arguments).items()),
+            duration,
+        )
+        if self.explain_slow_calls:
+            try:
+                plan = await self.backend.explain(method, *arguments.values())
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Can't explain %s", method)
+                return
+            if plan is not None:
+                for username in _usernames(arguments):
+                    plan = plan.replace(username, "<username>")
+                logger.warning("Plan of %s:\n%s", method, plan)
+
+
+def redact(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Arguments of a call, with usernames replaced by placeholders."""
+    redacted: Dict[str, Any] = {}
+    for name, value in arguments.items():
+        if name not in USERNAME_PARAMETERS:
+            redacted[name] = value
+        elif isinstance(value, (list, tuple, set)):
+            kind = "memberships" if name == "memberships" else "usernames"
+            redacted[name] = f"<{len(value)} {kind}>"
+        else:
+            redacted[name] = "<username>"
+    return redacted
+
+
+def _usernames(arguments: Dict[str, Any]) -> List[str]:
+    """Usernames given in arguments, as plans may show them."""
+    usernames: List[str] = []
+    for name in USERNAME_PARAMETERS & arguments.keys():
+        value = arguments[name]
+        usernames.extend([value] if isinstance(value, str) else value)
+    return [
+        username for username in usernames if isinstance(username, str) and username
+    ]
+
+
+def _instrumented(name: str, method):
+    signature = inspect.signature(method)
+
+    async def instrumented(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            self.metrics.storage_call_duration.observe((name,), duration)
+            if duration > self.slow_call_threshold:
+                arguments = signature.bind(self, *args, **kwargs).arguments
+                del arguments["self"]
+                await self._slow_call(  # pylint: disable=protected-access
+                    name, duration, arguments
+                )
+
+    instrumented.__name__ = name
+    instrumented.__doc__ = method.__doc__
+    return instrumented
+
+
+for _name, _method in vars(StorageBackendProxy).items():
+    if inspect.iscoroutinefunction(_method) and not _name.startswith("_"):
+        if _name != "explain":
+            setattr(InstrumentedStorage, _name, _instrumented(_name, _method))
@@ -1,14 +1,265 @@
-"""sqlite
+"""PostgreSQL storage backend, using an asyncpg pool
 """
-from typing import List
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional
+import copy
+import functools
+import itertools
+import re
+import time
 
 import asyncpg
 
-from pasee.storage_interface import StorageBackend
+from pasee.storage_interface import StorageBackend, DEFAULT_PAGE_SIZE, Memberships
+from pasee.storage_interface import MEMBER_ADDED, ALREADY_MEMBER
+from pasee.storage_interface import MEMBER_REMOVED, NOT_MEMBER, GROUP_NOT_FOUND
 
+# Hot statements, prepared on each connection of the pool. They are
+# named after the method using them, and take its arguments in order.
+STATEMENTS = {
+    "get_authorizations_for_user": """
+        SELECT groups.name
+        FROM groups
+        JOIN user_in_group
+            ON groups.id = user_in_group.group_id
+        JOIN users
+            ON user_in_group.user_id = users.id
+        WHERE
+            users.username = $1
+        ORDER BY groups.name ASC
+    """,
+    "group_exists": "SELECT EXISTS (SELECT 1 FROM groups WHERE name = $1)",
+    "user_exists": "SELECT EXISTS (SELECT 1 FROM users WHERE username = $1)",
+    "is_user_in_group": """
+        SELECT EXISTS (
+            SELECT 1
+            FROM user_in_group
+            JOIN users ON users.id = user_in_group.user_id
+            JOIN groups ON groups.id = user_in_group.group_id
+            WHERE users.username = $1
+            AND groups.name = $2
+        )
+    """,
+    "ensure_user_and_get_authorizations": """
+        WITH new_user AS (
+            INSERT INTO users(username) VALUES ($1)
+            ON CONFLICT (username) DO NOTHING
+        )
+        SELECT groups.name
+        FROM groups
+        JOIN user_in_group
+            ON groups.id = user_in_group.group_id
+        JOIN users
+            ON user_in_group.user_id = users.id
+        WHERE
+            users.username = $1
+        ORDER BY groups.name ASC
+    """,
+    "add_member_to_existing_group": """
+        WITH target AS (
+            SELECT id FROM groups WHERE name = $2
+        ), new_user AS (
+            INSERT INTO users(username)
+            SELECT $1 WHERE EXISTS (SELECT 1 FROM target)
+            ON CONFLICT (username) DO NOTHING
+            RETURNING id
+        ), member AS (
+            SELECT id FROM new_user
+            UNION ALL
+            SELECT id FROM users WHERE username = $1
+        ), added AS (
+            INSERT INTO user_in_group (user_id, group_id)
+            SELECT member.id, target.id
+            FROM member, target
+            ON CONFLICT (user_id, group_id) DO NOTHING
+            RETURNING 1
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM target) AS group_exists,
+            EXISTS (SELECT 1 FROM added) AS done
+    """,
+    "remove_member_from_existing_group": """
+        WITH target AS (
+            SELECT id FROM groups WHERE name = $2
+        ), removed AS (
+            DELETE FROM user_in_group USING users, target
+            WHERE user_in_group.user_id = users.id
+              AND user_in_group.group_id = target.id
+              AND users.username = $1
+            RETURNING 1
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM target) AS group_exists,
+            EXISTS (SELECT 1 FROM removed) AS done
+    """,
+}
+
+
+# STATEMENTS writing, which can't run on replicas.
+WRITE_STATEMENTS = frozenset(
+    {
+        "ensure_user_and_get_authorizations",
+        "add_member_to_existing_group",
+        "remove_member_from_existing_group",
+    }
+)
+
+
+async def prepare_statements(
+    connection: asyncpg.Connection, read_only: bool = False
+) -> None:
+    """Pool init hook, preparing the hot STATEMENTS on each new
+    connection, into its statement cache (used by fetch() and friends).
+
+    Statements are run once, with empty arguments, in a transaction
+    rolled back: prepared statements outlive it. Replica connections
+    (read_only) skip the WRITE_STATEMENTS.
+    """
+    transaction = connection.transaction(readonly=read_only)
+    await transaction.start()
+    try:
+        for name, query in STATEMENTS.items():
+            if read_only and name in WRITE_STATEMENTS:
+                continue
+            arguments = set(re.findall(r"\$\d+", query))
+            await connection.fetch(query, *[""] * len(arguments))
+    finally:
+        await transaction.rollback()
+
+
+# Members of a group ($1) after $2, ordered by username, LIMIT NULL
+# meaning all of them.
+MEMBERS_OF_GROUP = """
+    SELECT users.username
+    FROM user_in_group
+    JOIN users ON users.id = user_in_group.user_id
+    JOIN groups ON groups.id = user_in_group.group_id
+    WHERE groups.name = $1
+    AND users.username > $2
+    ORDER BY users.username ASC
+    LIMIT $3
+"""
+
+# All users with their groups, ordered by username, one row per user
+# and group (or a single row with a NULL group for users without any).
+MEMBERSHIPS = """
+    SELECT users.username, users.is_banned, groups.name
+    FROM users
+    LEFT JOIN user_in_group ON user_in_group.user_id = users.id
+    LEFT JOIN groups ON groups.id = user_in_group.group_id
+    ORDER BY users.username ASC, groups.name ASC
+"""
+
+# Exact counts, used by approximate_count() for tables never analyzed.
+COUNTS = {
+    "users": "SELECT count(*) FROM users",
+    "groups": "SELECT count(*) FROM groups",
+}
+
+
+def _membership_change_status(result, done: str, not_done: str) -> str:
+    if not result["group_exists"]:
+        return GROUP_NOT_FOUND
+    return done if result["done"] else not_done
+
+
+class _Pool:
+    """An asyncpg pool, with counters telling how busy it is."""
+
+    def __init__(self, connect_options: dict) -> None:
+        self.connect_options = connect_options
+        self.pool: Any = None
+        self.waiters = 0
+        self.in_use = 0
+        self.acquisitions = 0
+        self.acquire_seconds = 0.0
+        self.acquire_seconds_max = 0.0
+
+    async def open(self, **pool_options) -> None:
+        """Create the asyncpg pool."""
+        self.pool = await asyncpg.create_pool(**self.connect_options, **pool_options)
+
+    def terminate(self) -> None:
+        """Close all connections of the pool, if opened."""
+        if self.pool is not None:
+            self.pool.terminate()
+
+    @property
+    def busy(self) -> int:
+        """Connections used or waited for."""
+        return self.in_use + self.waiters
+
+    def acquire(self) -> "_PoolAcquire":
+        """To be used as `async with pool.acquire() as connection:`."""
+        return _PoolAcquire(self)
+
+    def stats(self, prefix: str) -> Dict[str, float]:
+        """Counters of the pool, their names starting with prefix."""
+        return {
+            f"{prefix}in_use": self.in_use,
+            f"{prefix}waiters": self.waiters,
+            f"{prefix}acquisitions": self.acquisitions,
+            f"{prefix}acquire_seconds_total": self.acquire_seconds,
+            f"{prefix}acquire_seconds_max": self.acquire_seconds_max,
+        }
+
+
+class _PoolAcquire:
+    """Async context manager acquiring a connection from a _Pool,
+    measuring how long it waited for it.
+    """
 
-class PostgresStorage(StorageBackend):
-    """Exposing a simple backend that fetch authorizations from a dictionary."""
+    def __init__(self, pool: _Pool) -> None:
+        self.pool = pool
+        self.connection = None
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        pool = self.pool
+        pool.waiters += 1
+        start = time.perf_counter()
+        try:
+            self.connection = await pool.pool.acquire()
+        finally:
+            pool.waiters -= 1
+        waited = time.perf_counter() - start
+        pool.acquisitions += 1
+        pool.acquire_seconds += waited
+        pool.acquire_seconds_max = max(pool.acquire_seconds_max, waited)
+        pool.in_use += 1
+        return self.connection
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.pool.in_use -= 1
+        await self.pool.pool.release(self.connection)
+
+
+class PostgresStorage(  # pylint: disable=too-many-instance-attributes
+    StorageBackend
+):  # pylint: disable=too-many-public-methods
+    """Storage backend using PostgreSQL, through a pool of connections.
+
+    Options, besides connection ones (user, password, database, host, port):
+    - min_size: Connections opened at startup, defaults to 1.
+    - max_size: Maximum number of connections, defaults to 5.
+    - max_queries: Queries after which a connection is replaced,
+      defaults to 50000.
+    - max_inactive_connection_lifetime: Seconds after which an idle
+      connection is closed, defaults to 300, 0 disables it.
+    - command_timeout: Default timeout of queries in seconds, defaults
+      to none.
+    - statement_cache_size: Prepared statements cached per connection,
+      defaults to 100, 0 disables it (needed behind pgbouncer in
+      transaction mode).
+    - prepare_statements: Prepare hot statements on each new
+      connection, defaults to true unless statement_cache_size is 0.
+    - replicas: DSNs of read replicas, each one getting its own pool
+      (with the same pool options), defaults to none.
+    - replica_selection: "round-robin" or "least-busy" (fewest
+      connections used or waited for), defaults to "round-robin".
+
+    Listings and get_authorizations_for_user are served by replicas,
+    everything else (writes, and existence checks guarding them) by
+    the primary. Use primary() to read what was just written.
+    """
 
     def __init__(self, options: dict, **kwargs) -> None:
         super().__init__(options, **kwargs)  # type: ignore
@@ -17,71 +268,141 @@ class PostgresStorage(StorageBackend):
         self.database = options["database"]
         self.host = options["host"]
         self.port = options["port"]
+        self.pool_options = {
+            "min_size": options.get("min_size", 1),
+            "max_size": options.get("max_size", 5),
+            "max_queries": options.get("max_queries", 50000),
+            "max_inactive_connection_lifetime": options.get(
+                "max_inactive_connection_lifetime", 300.0
+            ),
+            "command_timeout": options.get("command_timeout"),
+            "statement_cache_size": options.get("statement_cache_size", 100),
+        }
+        self.prepare_statements = options.get(
+            "prepare_statements", self.pool_options["statement_cache_size"] > 0
+        )
+        self.statement_counts = dict.fromkeys(STATEMENTS, 0)
+        self.statement_seconds = dict.fromkeys(STATEMENTS, 0.0)
+        self.primary_pool = _Pool(
+            {
+                "database": self.database,
+                "user": self.user,
+                "password": self.password,
+                "host": self.host,
+                "port": self.port,
+            }
+        )
+        self.replica_pools = [
+            _Pool({"dsn": dsn}) for dsn in options.get("replicas", [])
+        ]
+        self.replica_selection = options.get("replica_selection", "round-robin")
+        if self.replica_selection not in ("round-robin", "least-busy"):
+            raise ValueError(f"Unknown replica_selection {self.replica_selection!r}")
+        self.next_replica = itertools.cycle(self.replica_pools)
+        self.use_replicas = bool(self.replica_pools)
 
     async def __aenter__(self):
-        self.pool = await asyncpg.create_pool(  # pylint: disable=W0201
-            database=self.database,  # W0201 is attribute-defined-outside-init
-            user=self.user,  # we define it outside of init on purpose
-            password=self.password,
-            host=self.host,
-            port=self.port,
-            min_size=1,
-            max_size=5,
-        )
+        for pool in [self.primary_pool, *self.replica_pools]:
+            await pool.open(
+                init=(
+                    functools.partial(
+                        prepare_statements, read_only=pool is not self.primary_pool
+                    )
+                    if self.prepare_statements
+                    else None
+                ),
+                **self.pool_options,
+            )
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        try:
-            self.pool.terminate()
-        except AttributeError:
-            pass
+        for pool in [self.primary_pool, *self.replica_pools]:
+            pool.terminate()
 
-    async def get_authorizations_for_user(self, user: str) -> List[str]:
-        """Claim list of groups an user belongs to"""
-        async with self.pool.acquire() as connection:
+    def primary(self) -> "PostgresStorage":
+        """A view of this storage (sharing its pools) not using replicas."""
+        if not self.use_replicas:
+            return self
+        primary = copy.copy(self)
+        primary.use_replicas = False
+        return primary
 
-            results = await connection.fetch(
-                """
-                SELECT groups.name
-                FROM groups
-                JOIN user_in_group
-                    ON groups.id = user_in_group.group_id
-                JOIN users
-                    ON user_in_group.user_id = users.id
-                WHERE
-                    users.username = $1
-                ORDER BY groups.name ASC
-                """,
-                user,
-            )
+    def _replica(self) -> _Pool:
+        if self.replica_selection == "least-busy":
+            return min(self.replica_pools, key=lambda pool: pool.busy)
+        return next(self.next_replica)
+
+    def acquire(self, read_only: bool = False) -> _PoolAcquire:
+        """To be used as `async with self.acquire() as connection:`.
+
+        read_only connections come from a replica, if any is used.
+        """
+        if read_only and self.use_replicas:
+            return self._replica().acquire()
+        return self.primary_pool.acquire()
+
+    async def _run(
+        self, name: str, method: str, *args: Any, read_only: bool = False
+    ) -> Any:
+        """Run one of the STATEMENTS, using method (fetch, fetchrow or
+        fetchval), counting and timing it.
+        """
+        async with self.acquire(read_only) as connection:
+            start = time.perf_counter()
+            try:
+                return await getattr(connection, method)(STATEMENTS[name], *args)
+            finally:
+                self.statement_counts[name] += 1
+                self.statement_seconds[name] += time.perf_counter() - start
 
-            return [elem[0] for elem in results]
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = {}
+        for name in STATEMENTS:
+            stats[f"statement_{name}_count"] = self.statement_counts[name]
+            stats[f"statement_{name}_seconds_total"] = self.statement_seconds[name]
+        stats["pool_max_size"] = self.pool_options["max_size"]
+        stats.update(self.primary_pool.stats("pool_"))
+        for index, pool in enumerate(self.replica_pools):
+            stats.update(pool.stats(f"replica_{index}_pool_"))
+        return stats
+
+    async def get_authorizations_for_user(self, user: str) -> List[str]:
+        """Claim list of groups an user belongs to"""
+        results = await self._run(
+            "get_authorizations_for_user", "fetch", user, read_only=True
+        )
+        return [elem[0] for elem in results]
 
     async def create_group(self, group_name):
         """Staff member adds group method"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute("INSERT INTO groups(name) VALUES($1)", group_name)
 
-    async def get_groups(self, last_element: str = "") -> List[str]:
+    async def get_groups(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
         """Get groups paginated by group name in alphabetical order
-        List of groups is returned by page of 20
+        List of groups is returned by page of page_size
         last_element is the last know element returned in previous page
         So passing the last element to this function will retrieve the next page
         """
-        async with self.pool.acquire() as connection:
+        async with self.acquire(read_only=True) as connection:
             results = await connection.fetch(
                 """
                 SELECT name
                 FROM groups
                 WHERE name > $1
                 ORDER BY name
-                LIMIT 20
+                LIMIT $2
                 """,
                 last_element,
+                page_size,
             )
             return [group[0] for group in results]
 
-    async def get_groups_of_user(self, user: str, last_element: str = "") -> List[str]:
-        async with self.pool.acquire() as connection:
+    async def get_groups_of_user(
+        self, user: str, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        async with self.acquire(read_only=True) as connection:
             results = await connection.fetch(
                 """
                 SELECT groups.name
@@ -94,29 +415,60 @@ class PostgresStorage(StorageBackend):
                     users.username = $1
                     AND groups.name > $2
                 ORDER BY groups.name ASC
-                LIMIT 20
+                LIMIT $3
                 """,
                 user,
                 last_element,
+                page_size,
             )
         return [group[0] for group in results]
 
-    async def get_users(self, last_element: str = ""):
-        async with self.pool.acquire() as connection:
+    async def get_users(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        async with self.acquire(read_only=True) as connection:
             results = await connection.fetch(
                 """
                 SELECT username
                 FROM users
                 WHERE username > $1
                 ORDER BY username ASC
-                LIMIT 50
+                LIMIT $2
                 """,
                 last_element,
+                page_size,
             )
             return [group[0] for group in results]
 
+    async def approximate_count(self, table: str) -> Optional[int]:
+        """Row count estimated by the planner (from the last VACUUM or
+        ANALYZE), counted if the table was never analyzed.
+        """
+        if table not in COUNTS:
+            raise ValueError(f"Can't count {table}")
+        async with self.acquire(read_only=True) as connection:
+            estimate = await connection.fetchval(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = $1::regclass",
+                table,
+            )
+            if estimate is None or estimate < 0:
+                estimate = await connection.fetchval(COUNTS[table])
+        return estimate
+
+    async def explain(self, method: str, *args: Any) -> Optional[str]:
+        """Plan of the statement run by method, for the hot STATEMENTS
+        (EXPLAIN without ANALYZE: the statement is not run).
+        """
+        if method not in STATEMENTS:
+            return None
+        async with self.acquire() as connection:
+            plan = await connection.fetch(
+                "EXPLAIN " + STATEMENTS[method], *args  # nosec (constant SQL)
+            )
+        return "\n".join(row[0] for row in plan)
+
     async def get_user(self, username: str = ""):
-        async with self.pool.acquire() as connection:
+        async with self.acquire(read_only=True) as connection:
             result = await connection.fetchrow(
                 """
                 SELECT
@@ -137,26 +489,60 @@ class PostgresStorage(StorageBackend):
     async def delete_group(self, group: str):
         """Delete group"""
         await self.delete_members_in_group(group)
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute("DELETE FROM groups WHERE name = $1", group)
 
-    async def get_members_of_group(self, group: str) -> List[str]:
+    async def get_members_of_group(
+        self, group: str, last_element: str = "", page_size: Optional[int] = None
+    ) -> List[str]:
         """Get members of group"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire(read_only=True) as connection:
             results = await connection.fetch(
-                """
-                SELECT users.username
-                FROM user_in_group
-                JOIN users ON users.id = user_in_group.user_id
-                JOIN groups ON groups.id = user_in_group.group_id
-                WHERE groups.name = $1
-            """,
-                group,
+                MEMBERS_OF_GROUP, group, last_element, page_size
             )
         return [member[0] for member in results]
 
+    async def iter_members_of_group(
+        self, group: str, page_size: int = 1000
+    ) -> AsyncGenerator[str, None]:
+        """Iterate over members of group using a server-side cursor,
+        fetching page_size rows at a time.
+        """
+        async with self.acquire(read_only=True) as connection:
+            async with connection.transaction(readonly=True):
+                async for member in connection.cursor(
+                    MEMBERS_OF_GROUP, group, "", None, prefetch=page_size
+                ):
+                    yield member[0]
+
+    async def iter_memberships(
+        self, page_size: int = 1000
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Iterate over users with their groups, using a single query
+        read through a server-side cursor, page_size rows at a time.
+        """
+        user: Optional[str] = None
+        user_is_banned = False
+        groups: List[str] = []
+        async with self.acquire(read_only=True) as connection:
+            async with connection.transaction(readonly=True):
+                rows = connection.cursor(MEMBERSHIPS, prefetch=page_size)
+                async for username, is_banned, group in rows:
+                    if username != user:
+                        if user is not None:
+                            yield {
+                                "username": user,
+                                "is_banned": user_is_banned,
+                                "groups": groups,
+                            }
+                        user, user_is_banned, groups = username, bool(is_banned), []
+                    if group is not None:
+                        groups.append(group)
+        if user is not None:
+            yield {"username": user, "is_banned": user_is_banned, "groups": groups}
+
     async def create_user(self, username):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(
                 """
                 INSERT INTO users(username) VALUES ($1)
@@ -165,7 +551,7 @@ class PostgresStorage(StorageBackend):
             )
 
     async def delete_user(self, username):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
 
             await connection.execute(
                 """
@@ -179,22 +565,14 @@ class PostgresStorage(StorageBackend):
             await connection.execute("DELETE FROM users WHERE username = $1", username)
 
     async def group_exists(self, group: str) -> bool:
-        async with self.pool.acquire() as connection:
-            result = await connection.fetch(
-                "SELECT 1 FROM groups WHERE name = $1", group
-            )
-            return bool(result)
+        return await self._run("group_exists", "fetchval", group)
 
     async def user_exists(self, user: str) -> bool:
-        async with self.pool.acquire() as connection:
-            result = await connection.fetch(
-                "SELECT 1 FROM users WHERE username = $1", user
-            )
-        return bool(result)
+        return await self._run("user_exists", "fetchval", user)
 
     async def add_member_to_group(self, member, group):
         """Staff adds member to group"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(
                 """
                 INSERT INTO user_in_group (user_id, group_id)
@@ -209,24 +587,11 @@ class PostgresStorage(StorageBackend):
 
     async def is_user_in_group(self, user: str, group: str) -> bool:
         """Verify that user is in group"""
-        async with self.pool.acquire() as connection:
-            result = await connection.fetch(
-                """
-                SELECT 1
-                FROM user_in_group
-                JOIN users ON users.id = user_in_group.user_id
-                JOIN groups ON groups.id = user_in_group.group_id
-                WHERE groups.name = $1
-                AND users.username = $2
-                """,
-                group,
-                user,
-            )
-            return bool(result)
+        return await self._run("is_user_in_group", "fetchval", user, group)
 
     async def delete_member_in_group(self, member, group):
         """Delete member in group"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(
                 """
                 DELETE FROM user_in_group USING users, groups
@@ -240,7 +605,7 @@ class PostgresStorage(StorageBackend):
             )
 
     async def delete_members_in_group(self, group):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(
                 """
                 DELETE FROM user_in_group USING groups
@@ -252,7 +617,7 @@ class PostgresStorage(StorageBackend):
 
     async def ban_user(self, username: str, ban: bool = True):
         """Ban user"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute(
                 """
                 UPDATE users
@@ -262,3 +627,129 @@ class PostgresStorage(StorageBackend):
                 ban,
                 username,
             )
+
+    async def add_members_to_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        """Create missing users and add them all to group, in a single
+        statement.
+        """
+        members = list(dict.fromkeys(members))
+        async with self.acquire() as connection:
+            results = await connection.fetch(
+                """
+                WITH input AS (
+                    SELECT DISTINCT unnest($1::text[]) AS username
+                ), new_users AS (
+                    INSERT INTO users(username)
+                    SELECT username FROM input
+                    ON CONFLICT (username) DO NOTHING
+                    RETURNING id, username
+                ), members AS (
+                    SELECT id, username FROM new_users
+                    UNION ALL
+                    SELECT users.id, users.username
+                    FROM users JOIN input USING (username)
+                ), added AS (
+                    INSERT INTO user_in_group (user_id, group_id)
+                    SELECT members.id, groups.id
+                    FROM members, groups
+                    WHERE groups.name = $2
+                    ON CONFLICT (user_id, group_id) DO NOTHING
+                    RETURNING user_id
+                )
+                SELECT members.username
+                FROM members JOIN added ON added.user_id = members.id
+                """,
+                members,
+                group,
+            )
+        added = {result[0] for result in results}
+        return {
+            member: MEMBER_ADDED if member in added else ALREADY_MEMBER
+            for member in members
+        }
+
+    async def remove_members_from_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        """Remove members from group, in a single statement."""
+        members = list(dict.fromkeys(members))
+        async with self.acquire() as connection:
+            results = await connection.fetch(
+                """
+                DELETE FROM user_in_group USING users, groups
+                WHERE user_in_group.user_id = users.id
+                  AND user_in_group.group_id = groups.id
+                  AND users.username = ANY($1::text[])
+                  AND groups.name = $2
+                RETURNING users.username
+                """,
+                members,
+                group,
+            )
+        removed = {result[0] for result in results}
+        return {
+            member: MEMBER_REMOVED if member in removed else NOT_MEMBER
+            for member in members
+        }
+
+    async def ensure_user_and_get_authorizations(self, user: str) -> List[str]:
+        """Create user if needed and get its groups, in a single statement."""
+        results = await self._run("ensure_user_and_get_authorizations", "fetch", user)
+        return [elem[0] for elem in results]
+
+    async def add_member_to_existing_group(self, member: str, group: str) -> str:
+        """Add member to group if group exists, creating the user if
+        needed, in a single statement.
+        """
+        result = await self._run(
+            "add_member_to_existing_group", "fetchrow", member, group
+        )
+        return _membership_change_status(result, MEMBER_ADDED, ALREADY_MEMBER)
+
+    async def remove_member_from_existing_group(self, member: str, group: str) -> str:
+        """Remove member from group if group exists, in a single statement."""
+        result = await self._run(
+            "remove_member_from_existing_group", "fetchrow", member, group
+        )
+        return _membership_change_status(result, MEMBER_REMOVED, NOT_MEMBER)
+
+    async def bulk_load(
+        self, users: Iterable[str], groups: Iterable[str], memberships: Memberships
+    ) -> None:
+        """Create everything in a single transaction, with a statement
+        per table, rows being given as arrays.
+        """
+        memberships = list(memberships)
+        members = [user for user, _ in memberships]
+        async with self.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    """
+                    INSERT INTO users(username)
+                    SELECT DISTINCT unnest($1::text[])
+                    ON CONFLICT (username) DO NOTHING
+                    """,
+                    [*users, *members],
+                )
+                await connection.execute(
+                    """
+                    INSERT INTO groups(name)
+                    SELECT DISTINCT unnest($1::text[])
+                    ON CONFLICT (name) DO NOTHING
+                    """,
+                    list(groups),
+                )
+                await connection.execute(
+                    """
+                    INSERT INTO user_in_group(user_id, group_id)
+                    SELECT DISTINCT users.id, groups.id
+                    FROM unnest($1::text[], $2::text[]) AS input(username, name)
+                    JOIN users USING (username)
+                    JOIN groups USING (name)
+                    ON CONFLICT (user_id, group_id) DO NOTHING
+                    """,
+                    members,
+                    [group for _, group in memberships],
+                )
@@ -3,10 +3,29 @@
 
 
 from abc import abstractmethod
-from typing import AsyncContextManager, List, Any
+import copy
+from typing import AsyncContextManager, AsyncGenerator, Dict, Iterable, List, Any
+from typing import Optional, Tuple
 
+# Outcomes of bulk membership changes, by user.
+MEMBER_ADDED = "added"
+ALREADY_MEMBER = "already_member"
+MEMBER_REMOVED = "removed"
+NOT_MEMBER = "not_member"
+GROUP_NOT_FOUND = "group_not_found"
 
-class StorageBackend(AsyncContextManager):  # pylint: disable=inherit-non-class
+# Sizes of pages of listings, callers are expected to bound the ones
+# they get from clients to MAX_PAGE_SIZE.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# (user, group) pairs, see StorageBackend.bulk_load().
+Memberships = Iterable[Tuple[str, str]]
+
+
+class StorageBackend(  # pylint: disable=inherit-non-class,too-many-public-methods
+    AsyncContextManager
+):
     # (see https://github.com/PyCQA/pylint/issues/2472)
     """Abstract class for representing an Storage backend"""
 
@@ -23,32 +42,59 @@ class StorageBackend(AsyncContextManager):  # pylint: disable=inherit-non-class
         """Add group"""
 
     @abstractmethod
-    async def get_groups(self, last_element: str = "") -> List[str]:
+    async def get_groups(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
         """Get groups paginated by group name in alphabetical order
-        List of groups is returned by page of 20
+        List of groups is returned by page of page_size
         last_element is the last know element returned in previous page
         So passing the last element to this function will retrieve the next page
         """
 
     @abstractmethod
-    async def get_groups_of_user(self, user: str, last_element: str = "") -> List[str]:
-        """Get groups of user"""
+    async def get_groups_of_user(
+        self, user: str, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        """Get groups of user, paginated like get_groups"""
 
     @abstractmethod
     async def delete_group(self, group: str):
         """Delete group"""
 
     @abstractmethod
-    async def get_users(self, last_element: str = ""):
-        """Get users"""
+    async def get_users(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        """Get users, paginated like get_groups"""
 
     @abstractmethod
     async def get_user(self, username: str = ""):
         """Get user"""
 
     @abstractmethod
-    async def get_members_of_group(self, group) -> List[str]:
-        """Get members of group"""
+    async def get_members_of_group(
+        self, group, last_element: str = "", page_size: Optional[int] = None
+    ) -> List[str]:
+        """Get members of group in alphabetical order, starting after
+        last_element, at most page_size of them (all by default).
+        """
+
+    async def iter_members_of_group(
+        self, group: str, page_size: int = 1000
+    ) -> AsyncGenerator[str, None]:
+        """Iterate over all members of group in alphabetical order,
+        fetching them by pages of page_size.
+
+        Backends able to use a server-side cursor should override this.
+        """
+        last_element = ""
+        while True:
+            members = await self.get_members_of_group(group, last_element, page_size)
+            for member in members:
+                yield member
+            if len(members) < page_size:
+                return
+            last_element = members[-1]
 
     @abstractmethod
     async def group_exists(self, group) -> bool:
@@ -87,3 +133,303 @@ class StorageBackend(AsyncContextManager):  # pylint: disable=inherit-non-class
     @abstractmethod
     async def ban_user(self, username: str, ban: bool = True):
         """Ban user"""
+
+    async def add_members_to_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        """Add many members to an existing group, creating missing users.
+
+        Returns the outcome (MEMBER_ADDED or ALREADY_MEMBER) by member.
+        Backends should override this to do it in a single transaction,
+        this implementation does it a member at a time.
+        """
+        outcomes = {}
+        for member in dict.fromkeys(members):
+            if not await self.user_exists(member):
+                await self.create_user(member)
+            if await self.is_user_in_group(member, group):
+                outcomes[member] = ALREADY_MEMBER
+            else:
+                await self.add_member_to_group(member, group)
+                outcomes[member] = MEMBER_ADDED
+        return outcomes
+
+    async def remove_members_from_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        """Remove many members from a group.
+
+        Returns the outcome (MEMBER_REMOVED or NOT_MEMBER) by member.
+        Backends should override this to do it in a single transaction,
+        this implementation does it a member at a time.
+        """
+        outcomes = {}
+        for member in dict.fromkeys(members):
+            if await self.is_user_in_group(member, group):
+                await self.delete_member_in_group(member, group)
+                outcomes[member] = MEMBER_REMOVED
+            else:
+                outcomes[member] = NOT_MEMBER
+        return outcomes
+
+    async def ensure_user_and_get_authorizations(self, user: str) -> List[str]:
+        """Create user if it does not exist, and get its groups.
+
+        Backends should override this to do it in a single statement.
+        """
+        if not await self.user_exists(user):
+            await self.create_user(user)
+        return await self.get_authorizations_for_user(user)
+
+    async def add_member_to_existing_group(self, member: str, group: str) -> str:
+        """Add member to group if group exists, creating the user if needed.
+
+        Returns GROUP_NOT_FOUND, ALREADY_MEMBER or MEMBER_ADDED. Backends
+        should override this to do it in a single statement.
+        """
+        if not await self.group_exists(group):
+            return GROUP_NOT_FOUND
+        return (await self.add_members_to_group([member], group))[member]
+
+    async def remove_member_from_existing_group(self, member: str, group: str) -> str:
+        """Remove member from group if group exists.
+
+        Returns GROUP_NOT_FOUND, NOT_MEMBER or MEMBER_REMOVED. Backends
+        should override this to do it in a single statement.
+        """
+        if not await self.group_exists(group):
+            return GROUP_NOT_FOUND
+        return (await self.remove_members_from_group([member], group))[member]
+
+    async def bulk_load(
+        self, users: Iterable[str], groups: Iterable[str], memberships: Memberships
+    ) -> None:
+        """Create users, groups, and memberships given as (user, group)
+        pairs, skipping existing ones, to load large datasets.
+
+        Users of memberships are created if needed, memberships of
+        groups that don't exist are skipped. Backends should override
+        this to do it in a few statements, this implementation does it
+        a user, a group, or the members of a group at a time. Once
+        done, callers should ANALYZE the tables, so the database
+        planner knows their new sizes.
+        """
+        for user in dict.fromkeys(users):
+            if not await self.user_exists(user):
+                await self.create_user(user)
+        for group in dict.fromkeys(groups):
+            if not await self.group_exists(group):
+                await self.create_group(group)
+        members_of_group: Dict[str, List[str]] = {}
+        for user, group in memberships:
+            members_of_group.setdefault(group, []).append(user)
+        for group, members in members_of_group.items():
+            if await self.group_exists(group):
+                await self.add_members_to_group(members, group)
+
+    async def iter_memberships(
+        self, page_size: int = 1000
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Iterate over all users in alphabetical order, as dicts giving
+        their username, is_banned and groups (in alphabetical order).
+
+        This default implementation pages through users, querying each
+        one, backends should override it to use a single query.
+        """
+        last_element = ""
+        while True:
+            users = await self.get_users(last_element, page_size)
+            for username in users:
+                user = await self.get_user(username)
+                groups: List[str] = []
+                while True:
+                    page = await self.get_groups_of_user(
+                        username, groups[-1] if groups else "", page_size
+                    )
+                    groups.extend(page)
+                    if len(page) < page_size:
+                        break
+                yield {
+                    "username": username,
+                    "is_banned": bool(user and user["is_banned"]),
+                    "groups": groups,
+                }
+            if len(users) < page_size:
+                return
+            last_element = users[-1]
+
+    async def approximate_count(self, table: str) -> Optional[int]:
+        """Approximate number of "users" or "groups", cheap to get even on
+        large tables. None if the backend can't tell.
+        """
+        del table
+        return None
+
+    async def explain(self, method: str, *args: Any) -> Optional[str]:
+        """Plan of the query run by the given method with the given
+        arguments, without running it, for diagnostics. None if the
+        backend can't tell.
+        """
+        del method, args
+        return None
+
+    def stats(self) -> Dict[str, float]:  # pylint: disable=no-self-use
+        """Counters describing the backend state, for monitoring."""
+        return {}
+
+    def primary(self) -> "StorageBackend":
+        """The backend, reading from the primary database only.
+
+        Backends spreading reads over replicas return a view of
+        themselves avoiding them, to read what was just written.
+        """
+        return self
+
+
+class StorageBackendProxy(StorageBackend):  # pylint: disable=too-many-public-methods
+    """A storage backend forwarding everything to another storage backend.
+
+    Meant to be subclassed by wrappers (caches, instrumentation, ...)
+    overriding only the methods they're interested in.
+
+    Listing methods and get_authorizations_for_user are forwarded to
+    reader, defaulting to backend.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        options: dict,
+        reader: Optional[StorageBackend] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.backend = backend
+        self.reader = backend if reader is None else reader
+        super().__init__(options, **kwargs)
+
+    async def __aenter__(self):
+        await self.backend.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return await self.backend.__aexit__(exc_type, exc_value, traceback)
+
+    async def get_authorizations_for_user(self, user) -> List[str]:
+        return await self.reader.get_authorizations_for_user(user)
+
+    async def create_group(self, group_name):
+        return await self.backend.create_group(group_name)
+
+    async def get_groups(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        return await self.reader.get_groups(last_element, page_size)
+
+    async def get_groups_of_user(
+        self, user: str, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        return await self.reader.get_groups_of_user(user, last_element, page_size)
+
+    async def delete_group(self, group: str):
+        return await self.backend.delete_group(group)
+
+    async def get_users(
+        self, last_element: str = "", page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[str]:
+        return await self.reader.get_users(last_element, page_size)
+
+    async def get_user(self, username: str = ""):
+        return await self.reader.get_user(username)
+
+    async def get_members_of_group(
+        self, group, last_element: str = "", page_size: Optional[int] = None
+    ) -> List[str]:
+        return await self.reader.get_members_of_group(group, last_element, page_size)
+
+    async def iter_members_of_group(
+        self, group: str, page_size: int = 1000
+    ) -> AsyncGenerator[str, None]:
+        members = self.reader.iter_members_of_group(group, page_size)
+        try:
+            async for member in members:  # pragma: no branch
+                yield member
+        finally:
+            await members.aclose()
+
+    async def group_exists(self, group) -> bool:
+        return await self.backend.group_exists(group)
+
+    async def user_exists(self, user) -> bool:
+        return await self.backend.user_exists(user)
+
+    async def create_user(self, username):
+        return await self.backend.create_user(username)
+
+    async def delete_user(self, username):
+        return await self.backend.delete_user(username)
+
+    async def is_user_in_group(self, user, group) -> bool:
+        return await self.backend.is_user_in_group(user, group)
+
+    async def add_member_to_group(self, member, group) -> bool:
+        return await self.backend.add_member_to_group(member, group)
+
+    async def delete_member_in_group(self, member, group):
+        return await self.backend.delete_member_in_group(member, group)
+
+    async def delete_members_in_group(self, group):
+        return await self.backend.delete_members_in_group(group)
+
+    async def ban_user(self, username: str, ban: bool = True):
+        return await self.backend.ban_user(username, ban)
+
+    async def add_members_to_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        return await self.backend.add_members_to_group(members, group)
+
+    async def remove_members_from_group(
+        self, members: Iterable[str], group: str
+    ) -> Dict[str, str]:
+        return await self.backend.remove_members_from_group(members, group)
+
+    async def ensure_user_and_get_authorizations(self, user: str) -> List[str]:
+        return await self.backend.ensure_user_and_get_authorizations(user)
+
+    async def add_member_to_existing_group(self, member: str, group: str) -> str:
+        return await self.backend.add_member_to_existing_group(member, group)
+
+    async def remove_member_from_existing_group(self, member: str, group: str) -> str:
+        return await self.backend.remove_member_from_existing_group(member, group)
+
+    async def bulk_load(
+        self, users: Iterable[str], groups: Iterable[str], memberships: Memberships
+    ) -> None:
+        await self.backend.bulk_load(users, groups, memberships)
+
+    async def iter_memberships(
+        self, page_size: int = 1000
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        memberships = self.reader.iter_memberships(page_size)
+        try:
+            async for membership in memberships:  # pragma: no branch
+                yield membership
+        finally:
+            await memberships.aclose()
+
+    async def approximate_count(self, table: str) -> Optional[int]:
+        return await self.reader.approximate_count(table)
+
+    async def explain(self, method: str, *args: Any) -> Optional[str]:
+        return await self.backend.explain(method, *args)
+
+    def stats(self) -> Dict[str, float]:
+        return self.backend.stats()
+
+    def primary(self) -> StorageBackend:
+        backend, reader = self.backend.primary(), self.reader.primary()
+        if backend is self.backend and reader is self.reader:
+            return self
+        wrapper = copy.copy(self)
+        wrapper.backend, wrapper.reader = backend, reader
+        return wrapper
@@ -1,16 +1,15 @@
 """Hanlers for tokens
 """
-import json
 from datetime import datetime, timedelta
-from typing import Tuple
+from typing import Any, Dict, Tuple
 
 import jwt
 import shortuuid
 from aiohttp import web
 
+from pasee import keys, utils
 from pasee.identity_providers import backend as identity_providers
-from pasee.identity_providers.backend import Claims
-from pasee.utils import import_class
+from pasee.identity_providers.backend import Claims, IdentityProviderBackend
 
 
 def create_jti_and_expiration_values(hours_to_add: int):
@@ -21,44 +20,44 @@ def create_jti_and_expiration_values(hours_to_add: int):
 def generate_access_token_and_refresh_token_pairs(
     claims, private_key, algorithm
 ) -> Tuple[str, str]:
-    """Create new access token with refresh token"""
+    """Create new access token with refresh token, both having the
+    signing key id as kid header.
+    """
+    headers = {"kid": keys.signing_key_id(private_key)}
     claims["jti"], claims["exp"] = create_jti_and_expiration_values(  # type: ignore
         hours_to_add=1
     )
-    access_token = jwt.encode(claims, private_key, algorithm=algorithm)
+    access_token = jwt.encode(claims, private_key, algorithm=algorithm, headers=headers)
 
     claims["jti"], claims["exp"] = create_jti_and_expiration_values(  # type: ignore
         hours_to_add=720
     )
     del claims["groups"]
     claims["refresh_token"] = True
-    refresh_token = jwt.encode(claims, private_key, algorithm=algorithm)
+    refresh_token = jwt.encode(
+        claims, private_key, algorithm=algorithm, headers=headers
+    )
     return access_token, refresh_token
 
 
+def get_identity_provider(request: web.Request, name: str) -> IdentityProviderBackend:
+    """Get one of the identity providers instantiated at startup."""
+    try:
+        return request.app["identity_providers"][name]
+    except KeyError as err:
+        raise web.HTTPBadRequest(reason="Identity provider not implemented") from err
+
+
 async def authenticate_with_identity_provider(request: web.Request) -> Claims:
     """Use identity provider provided by user to authenticate."""
-    try:
-        input_data = await request.json()
-    except json.decoder.JSONDecodeError:
-        input_data = {}
+    input_data = await utils.request_json(request) if request.body_exists else {}
 
     identity_provider_input = request.rel_url.query.get("idp", None)
     if not identity_provider_input:
         raise web.HTTPBadRequest(
             reason="Identity provider not provided in query string"
         )
-    if identity_provider_input not in request.app["settings"]["idps"]:
-        raise web.HTTPBadRequest(reason="Identity provider not implemented")
-
-    identity_provider_path = request.app["settings"]["idps"][identity_provider_input][
-        "implementation"
-    ]
-    identity_provider_settings = request.app["settings"]["idps"][
-        identity_provider_input
-    ]
-    identity_provider = import_class(identity_provider_path)(identity_provider_settings)
-
+    identity_provider = get_identity_provider(request, identity_provider_input)
     return await identity_provider.authenticate_user(input_data)
 
 
@@ -68,23 +67,16 @@ async def handle_oauth_callback(
     """Callback handler for oauth protocol"""
     if identity_provider_input not in identity_providers.BACKENDS:
         raise web.HTTPBadRequest(reason="Identity provider not implemented")
-    identity_provider_path = identity_providers.BACKENDS[identity_provider_input]
-    identity_provider_settings = request.app["settings"]["idps"][
-        identity_provider_input
-    ]
-    identity_provider = import_class(identity_provider_path)(identity_provider_settings)
-    idp_claims = await identity_provider.authenticate_user(
-        {
-            "oauth_verifier": request.rel_url.query.get("oauth_verifier"),
-            "oauth_token": request.rel_url.query.get("oauth_token"),
-        },
-        step=2,
-    )
+    identity_provider = get_identity_provider(request, identity_provider_input)
+    oauth_response: Dict[str, Any] = {
+        "oauth_verifier": request.rel_url.query.get("oauth_verifier"),
+        "oauth_token": request.rel_url.query.get("oauth_token"),
+    }
+    idp_claims = await identity_provider.authenticate_user(oauth_response, step=2)
 
     sub = f"{identity_provider_input}-{idp_claims['sub']}"
-    if not await request.app["storage_backend"].user_exists(sub):
-        await request.app["storage_backend"].create_user(sub)
-    groups = await request.app["storage_backend"].get_authorizations_for_user(sub)
+    storage_backend = utils.storage_backend(request)
+    groups = await storage_backend.ensure_user_and_get_authorizations(sub)
 
     pasee_claims = {
         "iss": request.app["settings"]["jwt"]["iss"],
@@ -93,6 +85,6 @@ async def handle_oauth_callback(
     }
     return generate_access_token_and_refresh_token_pairs(
         pasee_claims,
-        request.app["settings"]["private_key"],
+        keys.load_private_key(request.app["settings"]["private_key"]),
         algorithm=request.app["settings"]["algorithm"],
     )
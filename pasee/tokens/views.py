@@ -8,54 +8,70 @@ from typing import List, Dict, Any
 
 from aiohttp import web
 
-from pasee.serializers import serialize
+from pasee.serializers import COREJSON, Document, Field, Link, Precomputed
+from pasee.serializers import encode, serialize
 from pasee.tokens.handlers import generate_access_token_and_refresh_token_pairs
 from pasee.tokens.handlers import authenticate_with_identity_provider
 from pasee.tokens.handlers import handle_oauth_callback
-from pasee.vendor import coreapi
-from pasee import utils, Unauthorized
+from pasee import keys, utils, Unauthorized
+from pasee.views import STATIC_CACHE_CONTROL
 
 
 logger = logging.getLogger(__name__)
 
 
-async def get_tokens(request: web.Request) -> web.Response:
-    """Handlers for GET /token/, just describes that a POST is possible."""
-    hostname = request.app["settings"]["hostname"]
-    access_token, refresh_token = None, None
-    identity_provider_input = request.rel_url.query.get("idp", None)
-    if identity_provider_input:
-        access_token, refresh_token = await handle_oauth_callback(
-            identity_provider_input, request
-        )
-
+def _tokens_document(settings, access_token=None, refresh_token=None) -> Document:
+    """Describes how to get a token from each identity provider."""
     idps = {}
-    for idp_name, idp_conf in request.app["settings"]["idps"].items():
-        fields: List[coreapi.Field] = []
+    for idp_name, idp_conf in settings["idps"].items():
+        fields: List[Field] = []
         if idp_conf.get("input_fields"):
             fields = [
-                coreapi.Field(name=field.get("name"), required=field.get("required"))
+                Field(name=field.get("name"), required=field.get("required"))
                 for field in idp_conf["input_fields"]
             ]
-        idps[f"identify_via_{idp_name}"] = coreapi.Link(
+        idps[f"identify_via_{idp_name}"] = Link(
             action="post",
             title=idp_conf.get("title"),
             description=idp_conf.get("description"),
             fields=fields,
             url=f"/tokens/?idp={idp_name}",
         )
+    return Document(
+        url=f"{settings['hostname']}/token",
+        title="Request Token From Identity Provider",
+        content={
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            **idps,
+        },
+    )
+
+
+def render_tokens(settings) -> Precomputed:
+    """GET /tokens/ without OAuth callback only depends on settings."""
+    return Precomputed(
+        encode(_tokens_document(settings)),
+        content_type=COREJSON,
+        cache_control=STATIC_CACHE_CONTROL,
+    )
 
+
+async def get_tokens(request: web.Request) -> web.Response:
+    """Handlers for GET /token/, just describes that a POST is possible,
+    or gives tokens when called back by an OAuth identity provider.
+    """
+    identity_provider_input = request.rel_url.query.get("idp", None)
+    if not identity_provider_input:
+        return request.app["precomputed"]["get_tokens"].response(request)
+    access_token, refresh_token = await handle_oauth_callback(
+        identity_provider_input, request
+    )
+    request.app["metrics"].tokens_issued.inc((identity_provider_input, "login"))
     return serialize(
         request,
-        coreapi.Document(
-            url=f"{hostname}/token",
-            title="Request Token From Identity Provider",
-            content={
-                "access_token": access_token,
-                "refresh_token": refresh_token,
-                **idps,
-            },
-        ),
+        _tokens_document(request.app["settings"], access_token, refresh_token),
+        headers={"Cache-Control": "no-store", "Pragma": "no-cache"},
     )
 
 
@@ -67,48 +83,50 @@ async def post_token(request: web.Request) -> web.Response:
             raise web.HTTPBadRequest(
                 reason="Missing Authorization header for refreshing access token"
             )
-        claims = utils.enforce_authorization(request.headers, request.app["settings"])
+        claims = utils.request_claims(request)
         if not claims.get("refresh_token", False):
             raise Unauthorized("Token is not a refresh token")
+        grant = "refresh"
+        identity_provider = claims["sub"].split("-", 1)[0]
     else:
         claims = await authenticate_with_identity_provider(request)
+        grant = "login"
+        identity_provider = request.rel_url.query["idp"]
 
     response_content: Dict[str, Any] = {
-        "identify_to_kisee": coreapi.Link(
+        "identify_to_kisee": Link(
             action="post",
             title="Login via login/password pair",
             description="""
                 POSTing to this endpoint will identify you by login/password.
             """,
             fields=[
-                coreapi.Field(name="login", required=True),
-                coreapi.Field(name="password", required=True),
+                Field(name="login", required=True),
+                Field(name="password", required=True),
             ],
             url="/tokens/?idp=kisee",
         )
     }
 
     if "sub" in claims:
-        storage_backend = request.app["storage_backend"]
-        if not await storage_backend.user_exists(claims["sub"]):
-            await storage_backend.create_user(claims["sub"])
-
-        claims["groups"] = await storage_backend.get_authorizations_for_user(
+        storage_backend = utils.storage_backend(request)
+        claims["groups"] = await storage_backend.ensure_user_and_get_authorizations(
             claims["sub"]
         )
         access_token, refresh_token = generate_access_token_and_refresh_token_pairs(
             claims,
-            request.app["settings"]["private_key"],
+            keys.load_private_key(request.app["settings"]["private_key"]),
             algorithm=request.app["settings"]["algorithm"],
         )
         response_content["access_token"] = access_token
         response_content["refresh_token"] = refresh_token
+        request.app["metrics"].tokens_issued.inc((identity_provider, grant))
     else:
         response_content["authorize_url"] = claims["authorize_url"]
 
     return serialize(
         request,
-        coreapi.Document(
+        Document(
             url="/tokens/",
             title="Create a token with Identify Provider",
             content=response_content,
@@ -5,16 +5,14 @@
 """
 import functools
 import logging
-from typing import List, Tuple
-from urllib.parse import parse_qs
+from typing import List, Optional, Tuple
 
-from aiohttp import web, ClientSession
+from aiohttp import web
 
 from pasee import Unauthorized
-from pasee.serializers import serialize
+from pasee.serializers import Document, Error, Field, Link, serialize
 from pasee.identity_providers.utils import get_identity_provider_with_capability
-from pasee.vendor import coreapi
-from pasee import utils
+from pasee import pagination, utils
 from pasee.groups.utils import is_root
 
 logger = logging.getLogger(__name__)
@@ -45,7 +43,7 @@ async def find_register_user_provider(
     "register_user" action and returns its "register_user" link.
     """
     identity_provider = get_identity_provider_with_capability(
-        request.app["settings"], "register_user"
+        request.app["identity_providers"], "register_user"
     )
     if identity_provider:
         try:
@@ -56,35 +54,40 @@ async def find_register_user_provider(
             register_user_endpoint = await identity_provider.get_endpoint(
                 "register_user"
             )
-        async with ClientSession() as session:
-            async with session.get(register_user_endpoint) as resp:
+        async with identity_provider.http_session() as session:
+            async with session.get(
+                register_user_endpoint, **identity_provider.request_options
+            ) as resp:
                 return {
                     **(await resp.json())["register_user"],
                     **{"url": register_user_endpoint},
                 }
 
 
-async def _get_users(request: web.Request) -> Tuple[List[coreapi.Error], List[str]]:
-    """Get users, if requester is root."""
+async def _get_users(
+    request: web.Request,
+) -> Tuple[List[Error], List[str], Optional[int]]:
+    """Get users and their approximate count, if requester is root."""
     try:
         if utils.is_root(request):
-            after = request.rel_url.query.get("after", "")
-            return [], await request.app["storage_backend"].get_users(after)
+            storage_backend = utils.storage_backend(request)
+            users = await storage_backend.get_users(
+                pagination.page_start(request, "users", "after"),
+                pagination.page_size(request),
+            )
+            return [], users, await storage_backend.approximate_count("users")
     except Unauthorized as err:
-        return [coreapi.Error(content={"reason": err.reason})], []
-    return [], []
+        return [Error(content={"reason": err.reason})], [], None
+    return [], [], None
 
 
 async def get_users(request: web.Request) -> web.Response:
     """Handlers for GET /users/, just describes that a POST is possible."""
     hostname = request.app["settings"]["hostname"]
-    errors, users = await _get_users(request)
-    last_element = users[-1] if users else None
+    errors, users, count = await _get_users(request)
     content = {
         "users": [
-            coreapi.Document(
-                url=f"{hostname}/users/{user}/", content={"username": user}
-            )
+            Document(url=f"{hostname}/users/{user}/", content={"username": user})
             for user in users
         ],
         "errors": errors,
@@ -94,25 +97,14 @@ async def get_users(request: web.Request) -> web.Response:
     if register_user:  # pragma: no cover  # Needs a running kisee.
         content["register_user"] = register_user
 
-    if last_element:
-        if request.rel_url.query:
-            if not request.rel_url.query.get("after"):
-                next_endpoint = f"{hostname}{request.rel_url}&after={last_element}"
-            else:
-                parsed_query = parse_qs(request.rel_url.raw_query_string)
-                query = {key: "".join(value) for key, value in parsed_query.items()}
-                query["after"] = last_element
-                query_string = "?" + "&".join(
-                    [f"{key}={value}" for key, value in query.items()]
-                )
-                next_endpoint = f"{hostname}{request.path}{query_string}"
-        else:
-            next_endpoint = f"{hostname}{request.rel_url}?after={last_element}"
-        content["next"] = coreapi.Link(url=next_endpoint)
+    if count is not None:
+        content["approximate_count"] = count
+    if len(users) == pagination.page_size(request):
+        content["next"] = pagination.next_link(request, "users", users[-1])
 
     return serialize(
         request,
-        coreapi.Document(
+        Document(
             url=f"{hostname}/users/",
             title="Users management interface",
             content=content,
@@ -128,42 +120,41 @@ async def get_user(request: web.Request) -> web.Response:
     hostname = request.app["settings"]["hostname"]
     username = request.match_info["username"]
 
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
+    claims = utils.request_claims(request)
     if not is_root(claims["groups"]) and not claims["sub"] == username:  # is user
         raise web.HTTPForbidden(reason="Do not have rights to view user info")
 
-    last_element = request.rel_url.query.get("last_element", "")
+    listing = f"groups_of_user:{username}"
+    last_element = pagination.page_start(request, listing, "last_element")
+    page_size = pagination.page_size(request)
 
-    user = await request.app["storage_backend"].get_user(username)
+    user = await utils.storage_backend(request).get_user(username)
     if not user:
         raise web.HTTPNotFound(reason="User does not exist")
 
-    groups = await request.app["storage_backend"].get_groups_of_user(
-        username, last_element
+    groups = await utils.storage_backend(request).get_groups_of_user(
+        username, last_element, page_size
     )
 
     content = user
-    content["patch"] = coreapi.Link(
+    content["patch"] = Link(
         action="patch",
         title="Patch fields of user",
         description="A method to patch fields of user",
-        fields=[coreapi.Field(name="is_banned")],
+        fields=[Field(name="is_banned")],
     )
 
+    if len(groups) == page_size:
+        content["next"] = pagination.next_link(request, listing, groups[-1])
     if groups:
-        content["next"] = coreapi.Link(
-            url=f"{hostname}/users/{username}?last_element={groups[-1]}"
-        )
         content["groups"] = [
-            coreapi.Document(
-                url=f"{hostname}/groups/{group}/", content={"group": group}
-            )
+            Document(url=f"{hostname}/groups/{group}/", content={"group": group})
             for group in groups
         ]
 
     return serialize(
         request,
-        coreapi.Document(
+        Document(
             url=f"{hostname}/users/{username}", title="User interface", content=content
         ),
         headers={"Vary": "Origin"},
@@ -176,20 +167,20 @@ async def patch_user(request: web.Request) -> web.Response:
     """
     username = request.match_info["username"]
 
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
+    claims = utils.request_claims(request)
     if not is_root(claims["groups"]):
         raise web.HTTPForbidden(reason="Do not have rights to patch")
 
-    user = await request.app["storage_backend"].get_user(username)
+    user = await utils.storage_backend(request).get_user(username)
     if not user:
         raise web.HTTPNotFound(reason="User does not exist")
 
-    input_data = await request.json()
+    input_data = await utils.request_json(request)
     if "username" in input_data:
         raise web.HTTPBadRequest(reason="can not patch username")
     if "is_banned" in input_data:
         ban = input_data["is_banned"]
-        await request.app["storage_backend"].ban_user(username, ban)
+        await utils.storage_backend(request).ban_user(username, ban)
     return web.Response(status=204)
 
 
@@ -198,8 +189,8 @@ async def delete_user(request: web.Request) -> web.Response:
     Delete {username}
     """
     username = request.match_info["username"]
-    claims = utils.enforce_authorization(request.headers, request.app["settings"])
+    claims = utils.request_claims(request)
     if not is_root(claims["groups"]):
         raise web.HTTPForbidden(reason="Do not have rights to delete user")
-    await request.app["storage_backend"].delete_user(username)
+    await utils.storage_backend(request).delete_user(username)
     return web.Response(status=204)
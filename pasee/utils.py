@@ -1,12 +1,18 @@
 """Some functions not directly linked with the core of pasee but still usefull.
 """
-from typing import MutableMapping, Mapping, Union, Any
+from collections import OrderedDict
+from typing import Dict, MutableMapping, Mapping, Optional, Tuple, Union, Any
 
 from importlib import import_module
+import hashlib
+import json
+import time
 
+from aiohttp import web
 import jwt
 
 from pasee import Unauthorized, Unauthenticated
+from pasee import keys
 import pasee.groups.utils
 
 Claims = MutableMapping[str, Union[Any]]
@@ -35,9 +41,80 @@ def import_class(dotted_path: str) -> type:
         ) from err
 
 
-def enforce_authorization(headers: RequestHeaders, settings: Settings) -> Claims:
+class ClaimsCache:
+    """Bounded LRU cache of verified token claims, keyed by token digest.
+
+    An entry never outlives the exp claim of its token, nor max_ttl
+    seconds (for tokens without exp).
+    """
+
+    def __init__(self, max_size: int = 10000, max_ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.entries: OrderedDict[str, Tuple[float, Claims]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        """Key used to store the claims of a token."""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Claims]:
+        """Get a copy of the claims of a token, None if unknown or expired."""
+        key = self.digest(token)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return dict(entry[1])
+
+    def set(self, token: str, claims: Claims) -> None:
+        """Store verified claims of a token."""
+        expires_at = time.time() + self.max_ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        key = self.digest(token)
+        self.entries[key] = (expires_at, dict(claims))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit rate, and signature verifications avoided thanks to the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "claims_cache_hits": self.hits,
+            "claims_cache_misses": self.misses,
+            "claims_cache_hit_rate": self.hits / lookups if lookups else 0,
+            "claims_cache_verifications_avoided": self.hits,
+            "claims_cache_size": len(self.entries),
+        }
+
+
+def verification_key(token: str, settings: Settings) -> keys.PublicKey:
+    """Public key designated by the kid header of the token, among the
+    published ones, defaulting to the current public key.
+    """
+    public_key = keys.load_public_key(settings["public_key"])
+    if not settings.get("additional_public_keys"):
+        return public_key
+    kid = jwt.get_unverified_header(token).get("kid")
+    return keys.public_keys_by_kid(keys.published_public_keys(settings)).get(
+        kid, public_key
+    )
+
+
+def enforce_authorization(
+    headers: RequestHeaders, settings: Settings, cache: Optional[ClaimsCache] = None
+) -> Claims:
     """claim user authorization middleware handler written as a standalone
     function to allow easier mocking for test
+
+    If a cache is given, it is used to skip signature verification of
+    already seen tokens.
     """
     if not headers.get("Authorization"):
         raise Unauthenticated("Missing authorization header")
@@ -48,16 +125,53 @@ def enforce_authorization(headers: RequestHeaders, settings: Settings) -> Claims
     if scheme != "Bearer":
         raise Unauthorized("Expected Bearer token")
 
+    if cache is not None:
+        cached_claims = cache.get(token)
+        if cached_claims is not None:
+            return cached_claims
+
     try:
-        return {
+        claims = {
             **jwt.decode(
-                token, settings["public_key"], algorithms=settings["algorithm"]
+                token,
+                verification_key(token, settings),
+                algorithms=settings["algorithm"],
             )
         }
     except jwt.ExpiredSignatureError as err:
         raise Unauthorized("Expired signature") from err
     except jwt.InvalidTokenError as err:
         raise Unauthorized("Invalid token") from err
+    if cache is not None:
+        cache.set(token, claims)
+    return claims
+
+
+def request_claims(request) -> Claims:
+    """Claims of the Bearer token of the request, verified at most once
+    per request.
+
+    Can raise Unauthenticated or Unauthorized, see enforce_authorization.
+    """
+    if "claims" not in request:
+        request["claims"] = enforce_authorization(
+            request.headers, request.app["settings"], request.app.get("claims_cache")
+        )
+    return request["claims"]
+
+
+async def request_json(request) -> Any:
+    """Body of the request, parsed at most once per request.
+
+    Raise HTTPBadRequest if it's not JSON, or HTTPRequestEntityTooLarge
+    if it's bigger than the max_body_size setting.
+    """
+    if "json" not in request:
+        try:
+            request["json"] = await request.json()
+        except json.decoder.JSONDecodeError as err:
+            raise web.HTTPBadRequest(reason="Malformed JSON.") from err
+    return request["json"]
 
 
 def is_root(request) -> bool:
@@ -67,7 +181,22 @@ def is_root(request) -> bool:
     token, ...).
     """
     try:
-        claims = enforce_authorization(request.headers, request.app["settings"])
+        claims = request_claims(request)
     except Unauthenticated:
         return False
     return pasee.groups.utils.is_root(claims["groups"])
+
+
+def storage_backend(request):
+    """The storage backend to use for the request.
+
+    Clients send `X-Pasee-Primary: true` to read from the primary
+    database, typically right after changing a membership, when the
+    storage backend reads from replicas.
+    """
+    if "storage_backend" not in request:
+        backend = request.app["storage_backend"]
+        if request.headers.get("X-Pasee-Primary", "").lower() in ("1", "true"):
+            backend = backend.primary()
+        request["storage_backend"] = backend
+    return request["storage_backend"]
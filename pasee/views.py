@@ -1,19 +1,38 @@
 """Views for the Pasee server, implementing:
 
 - GET /
+- GET /public-key/
+- GET /.well-known/jwks.json
+- GET /stats/
+- GET /metrics
+- GET /memberships/
 """
 
 import json
 import logging
+from typing import Dict
 
 from aiohttp import web
 
+from pasee import keys, metrics, utils
+from pasee.serializers import Precomputed, stream_ndjson
+
 logger = logging.getLogger(__name__)
 
 
-async def get_root(request: web.Request) -> web.Response:
+# Precomputed responses only change on restart, let clients and proxies
+# keep them a few minutes, revalidating them using their ETag.
+STATIC_CACHE_CONTROL = "public, max-age=300"
+
+# Verifiers keep public keys for hours, refetching on an unknown kid, so
+# a new key has to be published (additional_public_keys) that long
+# before signing with it.
+JWKS_CACHE_CONTROL = "public, max-age=21600"
+
+
+def render_root(settings) -> Precomputed:
     """https://tools.ietf.org/html/draft-nottingham-json-home-06"""
-    hostname = request.app["settings"]["hostname"]
+    hostname = settings["hostname"]
     home = {
         "api": {
             "title": "Identification Manager",
@@ -24,6 +43,7 @@ async def get_root(request: web.Request) -> web.Response:
         },
         "resources": {
             "public-key": {"href": f"{hostname}/public-key/"},
+            "jwks": {"href": f"{hostname}/.well-known/jwks.json"},
             "tokens": {
                 "hints": {"allow": ["GET", "POST"]},
                 "href": f"{hostname}/tokens/",
@@ -35,27 +55,97 @@ async def get_root(request: web.Request) -> web.Response:
             "group": {
                 "hrefTemplate": f"{hostname}/groups/{{group_uid}}/",
                 "hrefVars": {"group_uid": "group unique id"},
-                "hints": {"allow": ["GET", "POST", "DELETE"]},
+                "hints": {"allow": ["GET", "POST", "PATCH", "DELETE"]},
             },
             "users": {
                 "href": f"{hostname}/users/",
                 "hints": {"allow": ["GET", "DELETE", "PATCH"]},
             },
+            "memberships": {
+                "href": f"{hostname}/memberships/",
+                "hints": {
+                    "allow": ["GET"],
+                    "formats": {"application/x-ndjson": {}},
+                },
+            },
         },
     }
-    return web.Response(
-        body=json.dumps(home, indent=4),
-        headers={"Vary": "Origin"},
+    return Precomputed(
+        json.dumps(home, indent=4).encode(),
         content_type="application/json-home",
+        cache_control=STATIC_CACHE_CONTROL,
     )
 
 
+def render_public_key(settings) -> Precomputed:
+    """The public key, with the algorithm to use it with."""
+    return Precomputed(
+        json.dumps(
+            {"public_key": settings["public_key"], "algorithm": settings["algorithm"]}
+        ).encode(),
+        content_type="application/json",
+        cache_control=STATIC_CACHE_CONTROL,
+    )
+
+
+def render_jwks(settings) -> Precomputed:
+    """The published public keys, by kid, as a JSON Web Key Set."""
+    return Precomputed(
+        json.dumps(keys.jwks(keys.published_public_keys(settings))).encode(),
+        content_type="application/json",
+        cache_control=JWKS_CACHE_CONTROL,
+    )
+
+
+async def get_root(request: web.Request) -> web.Response:
+    """The json-home document, rendered at startup."""
+    return request.app["precomputed"]["get_root"].response(request)
+
+
 async def get_public_key(request: web.Request) -> web.Response:
     """Get public key"""
-    public_key = request.app["settings"]["public_key"]
-    algorithm = request.app["settings"]["algorithm"]
+    return request.app["precomputed"]["get_public_key"].response(request)
+
+
+async def get_jwks(request: web.Request) -> web.Response:
+    """Get the public keys, as a JSON Web Key Set"""
+    return request.app["precomputed"]["get_jwks"].response(request)
+
+
+def _stats(app: web.Application) -> Dict[str, float]:
+    return {**app["storage_backend"].stats(), **app["claims_cache"].stats()}
+
+
+async def get_stats(request: web.Request) -> web.Response:
+    """Counters of the storage backend and caches, for staff members."""
+    if not utils.is_root(request):
+        raise web.HTTPForbidden(reason="Restricted to staff")
     return web.Response(
-        body=json.dumps({"public_key": public_key, "algorithm": algorithm}),
+        body=json.dumps(_stats(request.app)),
         headers={"Vary": "Origin"},
         content_type="application/json",
     )
+
+
+async def get_metrics(request: web.Request) -> web.Response:
+    """Metrics of this process, in the Prometheus text format.
+
+    Not authenticated, so the staff-only counters of /stats/ are left out.
+    """
+    return web.Response(
+        body=request.app["metrics"].render().encode(),
+        headers={"Content-Type": metrics.CONTENT_TYPE},
+    )
+
+
+async def get_memberships(request: web.Request) -> web.StreamResponse:
+    """All users with their groups, one JSON document per line, for staff
+    members.
+    """
+    if not utils.is_root(request):
+        raise web.HTTPForbidden(reason="Restricted to staff")
+    return await stream_ndjson(
+        request,
+        utils.storage_backend(request).iter_memberships(),
+        headers={"Vary": "Origin, Accept-Encoding"},
+    )
@@ -0,0 +1,121 @@
+"""Prefork serving: worker processes accepting connections on a single
+listening socket, inherited from the supervisor.
+
+Token minting is CPU bound (ECDSA signatures), so a single process
+can't use more than one core. Each worker runs its own application,
+with its own storage backend connections.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def listen(host: str, port: int, backlog: int = 128) -> socket.socket:
+    """The listening socket, to be shared by all workers."""
+    family, kind, proto, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+    )[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Keep `workers` processes running target(index), restarting the
+    ones that die, until SIGINT or SIGTERM.
+
+    On shutdown, workers get a SIGTERM and shutdown_timeout seconds to
+    finish their requests before being killed.
+    """
+
+    poll_interval = 0.1
+
+    def __init__(
+        self,
+        target: Callable[[int], None],
+        workers: int,
+        shutdown_timeout: float = 60,
+        restart_delay: float = 1,
+    ) -> None:
+        self.target = target
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self.children: Dict[int, int] = {}  # Worker index by pid.
+        self.started_at: Dict[int, float] = {}  # Start time by worker index.
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        """Fork a worker, running target(index)."""
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover (runs in the worker)
+            status = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.target(index)
+            except BaseException:  # pylint: disable=broad-except
+                logger.exception("Worker %d crashed", index)
+                status = 1
+            finally:
+                os._exit(status)  # pylint: disable=protected-access
+        self.children[pid] = index
+        self.started_at[index] = time.monotonic()
+        logger.info("Worker %d started (pid %d)", index, pid)
+
+    def stop(self, signum, frame=None) -> None:  # pylint: disable=unused-argument
+        """Signal handler, asking for a graceful shutdown."""
+        logger.info("Got signal %d, shutting down", signum)
+        self.stopping = True
+
+    def reap(self) -> Dict[int, int]:
+        """Forget exited workers, giving their exit status by index."""
+        exited = {}
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            index = self.children.pop(pid)
+            exited[index] = status
+            log = logger.info if self.stopping else logger.warning
+            log("Worker %d (pid %d) exited with %d", index, pid, status)
+        return exited
+
+    def run(self) -> None:
+        """Start workers, restart them as they die, until asked to stop."""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        while not self.stopping:
+            for index in self.reap():
+                # Don't fork in a loop when workers die at startup.
+                if time.monotonic() - self.started_at[index] < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                if not self.stopping:
+                    self.spawn(index)
+            time.sleep(self.poll_interval)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Ask workers to stop, kill the ones still running after
+        shutdown_timeout seconds.
+        """
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(self.poll_interval)
+        for pid in list(self.children):
+            logger.warning("Worker %d (pid %d) killed", self.children.pop(pid), pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
@@ -2,9 +2,12 @@ import json
 
 import aiohttp
 from aioresponses import aioresponses
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 import jwt
 import pytest
 
+from pasee import keys
 from pasee.identity_providers.kisee import KiseeIdentityProvider
 
 
@@ -102,7 +105,7 @@ async def test_kisee_idp_bad_token(provider, test_token, fake_kisee):
         status=201,
         body=json.dumps({"tokens": [test_token[::-1]]}),
     )
-    with pytest.raises(aiohttp.web_exceptions.HTTPInternalServerError):
+    with pytest.raises(aiohttp.web_exceptions.HTTPUnauthorized):
         await provider.authenticate_user({"login": "toto", "password": "toto"})
 
 
@@ -120,3 +123,163 @@ async def test_kisee_idp_service_failure(provider, fake_kisee):
     )
     with pytest.raises(aiohttp.web_exceptions.HTTPBadGateway):
         await provider.authenticate_user({"login": "toto", "password": "toto"})
+
+
+async def test_kisee_idp_shared_session(test_token, fake_kisee):
+    fake_kisee.post(
+        "http://kisee.example.com/jwt/",
+        status=201,
+        body=json.dumps({"tokens": [test_token]}),
+    )
+    async with aiohttp.ClientSession() as session:
+        provider = KiseeIdentityProvider(
+            {
+                "settings": {"public_keys": [PUBLIC_KEY]},
+                "endpoint": "http://kisee.example.com/",
+                "name": "kisee",
+                "timeout": 5,
+            },
+            session=session,
+        )
+        assert provider.request_options["timeout"].total == 5
+        claims = await provider.authenticate_user({"login": "toto", "password": "x"})
+        assert claims["sub"] == "kisee-toto"
+        assert not session.closed
+
+
+@pytest.mark.parametrize(
+    "settings, total, connect",
+    [({"timeout": 10}, 10, 5), ({"connect_timeout": 1}, 30, 1), ({}, None, None)],
+)
+async def test_kisee_idp_timeouts(settings, total, connect):
+    timeout = aiohttp.ClientTimeout(total=30, connect=5)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        provider = KiseeIdentityProvider(
+            {
+                "settings": {"public_keys": [PUBLIC_KEY]},
+                "endpoint": "http://kisee.example.com/",
+                "name": "kisee",
+                **settings,
+            },
+            session=session,
+        )
+    if total is None:
+        assert "timeout" not in provider.request_options
+    else:
+        assert provider.request_options["timeout"].total == total
+        assert provider.request_options["timeout"].connect == connect
+
+
+def test_kisee_idp_timeouts__short_lived_session():
+    provider = KiseeIdentityProvider(
+        {
+            "settings": {"public_keys": [PUBLIC_KEY]},
+            "endpoint": "http://kisee.example.com/",
+            "name": "kisee",
+            "connect_timeout": 1,
+        }
+    )
+    assert provider.request_options["timeout"].total == 5 * 60
+    assert provider.request_options["timeout"].connect == 1
+
+
+async def test_warm_up(provider, fake_kisee):
+    await provider.warm_up()
+    # json-home has been fetched once (aioresponses mocks are one-shot).
+    assert (await provider.get_endpoint("jwt")) == "http://kisee.example.com/jwt/"
+    assert (
+        await provider.get_endpoint("register_user")
+    ) == "http://kisee.example.com/users/"
+
+
+async def test_warm_up_failure(provider, caplog):
+    with aioresponses() as mocked:
+        mocked.get("http://kisee.example.com/", status=500, body="Oops")
+        await provider.warm_up()
+    assert provider.resource_to_endpoint == {}
+    assert "Can't discover kisee endpoints" in caplog.text
+
+
+@pytest.fixture
+def rotating_provider():
+    """A provider knowing an old key, and the key used by test tokens."""
+    old_key = (
+        ec.generate_private_key(ec.SECP256K1())
+        .public_key()
+        .public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        .decode()
+    )
+    return KiseeIdentityProvider(
+        {
+            "settings": {"public_keys": [old_key, PUBLIC_KEY]},
+            "endpoint": "http://kisee.example.com/",
+            "name": "kisee",
+        }
+    )
+
+
+def count_decodes(monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr("pasee.identity_providers.kisee.jwt.decode", counting_decode)
+    return calls
+
+
+def test_decode_token_by_kid(rotating_provider, monkeypatch):
+    kid = keys.key_id(keys.load_public_key(PUBLIC_KEY))
+    assert kid in rotating_provider.public_keys
+    token = jwt.encode(
+        {"sub": "toto"}, PRIVATE_KEY, algorithm="ES256", headers={"kid": kid}
+    )
+    calls = count_decodes(monkeypatch)
+    assert rotating_provider._decode_token(token)["sub"] == "toto"
+    assert len(calls) == 1
+
+
+def test_decode_token_without_kid(rotating_provider, test_token, monkeypatch):
+    calls = count_decodes(monkeypatch)
+    assert rotating_provider._decode_token(test_token)["sub"] == "toto"
+    assert len(calls) == 2
+
+
+def test_decode_token_unknown_kid(rotating_provider, monkeypatch):
+    token = jwt.encode(
+        {"sub": "toto"}, PRIVATE_KEY, algorithm="ES256", headers={"kid": "unknown"}
+    )
+    calls = count_decodes(monkeypatch)
+    assert rotating_provider._decode_token(token)["sub"] == "toto"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("token", ["not a token", "e30.e30.e30"])
+def test_decode_token_invalid(rotating_provider, token):
+    with pytest.raises(aiohttp.web_exceptions.HTTPUnauthorized):
+        rotating_provider._decode_token(token)
+
+
+def test_public_keys_by_kid(monkeypatch):
+    provider = KiseeIdentityProvider(
+        {
+            "settings": {"public_keys": {"2021-04": PUBLIC_KEY}},
+            "endpoint": "http://kisee.example.com/",
+            "name": "kisee",
+        }
+    )
+    token = jwt.encode(
+        {"sub": "toto"}, PRIVATE_KEY, algorithm="ES256", headers={"kid": "2021-04"}
+    )
+    assert provider._decode_token(token)["sub"] == "toto"
+    token = jwt.encode(
+        {"sub": "toto"}, PRIVATE_KEY, algorithm="ES256", headers={"kid": "unknown"}
+    )
+    calls = count_decodes(monkeypatch)
+    with pytest.raises(aiohttp.web_exceptions.HTTPUnauthorized):
+        provider._decode_token(token)
+    assert not calls
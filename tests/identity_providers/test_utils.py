@@ -1,8 +1,17 @@
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+import jwt
 import pytest
 import pytoml
 
+from pasee.identity_providers.kisee import KiseeIdentityProvider
+from pasee.identity_providers.twitter import TwitterIdentityProvider
+from pasee.identity_providers.utils import build_identity_providers
 from pasee.identity_providers.utils import get_identity_provider_with_capability
 from pasee.utils import enforce_authorization, Unauthorized, Unauthenticated
+from pasee.utils import ClaimsCache, is_root, request_claims
 
 PUBLIC_KEY = """-----BEGIN PUBLIC KEY-----
 MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEgLwEAlfrY/AJrS4bCzg2pEhXrT5Zu3cr
@@ -23,26 +32,44 @@ def settings():
     settings = pytoml.loads(
         """
 [[identity_providers]]
-name = "Let's test with json"
-implementation = "json.dumps"
+name = "kisee"
+implementation = "pasee.identity_providers.kisee.KiseeIdentityProvider"
+endpoint = "http://kisee.example.com/"
 capabilities = ["register_user"]
+[identity_providers.settings]
+public_keys = []
 
 [[identity_providers]]
 name = "twitter"
+implementation = "pasee.identity_providers.twitter.TwitterIdentityProvider"
+[identity_providers.settings]
+consumer_key = "key"
+consumer_secret = "secret"
+callback_url = "http://pasee.example.com/tokens/?idp=twitter"
 """
     )
-    settings["idps"] = {idp["name"]: idp for idp in settings["identity_providers"]}
     return settings
 
 
+def test_build_identity_providers(settings):
+    identity_providers = build_identity_providers(settings, session=None)
+    assert isinstance(identity_providers["kisee"], KiseeIdentityProvider)
+    assert isinstance(identity_providers["twitter"], TwitterIdentityProvider)
+
+
 def test_get_identity_provider_with_capability(settings):
-    assert "Let's test with json" in get_identity_provider_with_capability(
-        settings, "register_user"
+    identity_providers = build_identity_providers(settings)
+    assert (
+        get_identity_provider_with_capability(identity_providers, "register_user")
+        is identity_providers["kisee"]
     )
 
 
 def test_get_identity_provider_with_capability_not_found(settings):
-    assert get_identity_provider_with_capability(settings, "delete-user") is None
+    identity_providers = build_identity_providers(settings)
+    assert (
+        get_identity_provider_with_capability(identity_providers, "delete-user") is None
+    )
 
 
 def test_enforce_authorization__missing_authorization_header():
@@ -75,3 +102,64 @@ def test_enforce_authorization__expired_token():
             {"Authorization": f"Bearer {expired_token}"},
             {"public_key": PUBLIC_KEY, "algorithm": ALGORITHM},
         )
+
+
+def test_enforce_authorization__cached():
+    cache = ClaimsCache()
+    token = jwt.encode(
+        {"sub": "foo", "exp": time.time() + 60}, PRIVATE_KEY, algorithm=ALGORITHM
+    )
+    settings = {"public_key": PUBLIC_KEY, "algorithm": ALGORITHM}
+    headers = {"Authorization": f"Bearer {token}"}
+    assert enforce_authorization(headers, settings)["sub"] == "foo"
+    claims = enforce_authorization(headers, settings, cache)
+    claims["groups"] = ["staff"]
+    assert enforce_authorization(headers, settings, cache) == {
+        "sub": "foo",
+        "exp": pytest.approx(time.time() + 60, abs=5),
+    }
+    assert cache.stats()["claims_cache_verifications_avoided"] == 1
+    assert cache.stats()["claims_cache_hit_rate"] == 0.5
+
+
+def test_claims_cache__respects_exp(monkeypatch):
+    cache = ClaimsCache(max_ttl=60)
+    cache.set("token", {"sub": "foo", "exp": time.time() + 10})
+    cache.set("token-without-exp", {"sub": "foo"})
+    assert cache.get("token")["sub"] == "foo"
+    assert cache.get("token-without-exp") == {"sub": "foo"}
+    now = time.time()
+    monkeypatch.setattr("pasee.utils.time.time", lambda: now + 30)
+    assert cache.get("token") is None
+    assert cache.get("token-without-exp") == {"sub": "foo"}
+    monkeypatch.setattr("pasee.utils.time.time", lambda: now + 90)
+    assert cache.get("token-without-exp") is None
+
+
+def test_claims_cache__lru():
+    cache = ClaimsCache(max_size=2)
+    assert cache.stats()["claims_cache_hit_rate"] == 0
+    cache.set("a", {"sub": "a"})
+    cache.set("b", {"sub": "b"})
+    cache.get("a")
+    cache.set("c", {"sub": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"sub": "a"}
+
+
+def test_request_claims__verified_once_per_request(monkeypatch):
+    calls = []
+
+    def fake_enforce_authorization(headers, settings, cache=None):
+        calls.append(headers)
+        return {"sub": "foo", "groups": ["staff"]}
+
+    monkeypatch.setattr("pasee.utils.enforce_authorization", fake_enforce_authorization)
+    app = web.Application()
+    app["settings"] = {}
+    request = make_mocked_request(
+        "GET", "/", headers={"Authorization": "Bearer x"}, app=app
+    )
+    assert is_root(request)
+    assert request_claims(request)["sub"] == "foo"
+    assert len(calls) == 1
@@ -24,7 +24,7 @@ def decode_token__new_user(self, token):
     }
 
 
-def enforce_authorization(headers, settings):
+def enforce_authorization(headers, settings, cache=None):
     return {
         "iss": "example.com",
         "sub": "kisee-toto",
@@ -34,7 +34,7 @@ def enforce_authorization(headers, settings):
     }
 
 
-def enforce_authorization_for_refresh_token(headers, settings):
+def enforce_authorization_for_refresh_token(headers, settings, cache=None):
     return {
         "iss": "example.com",
         "sub": "kisee-toto",
@@ -45,7 +45,9 @@ def enforce_authorization_for_refresh_token(headers, settings):
     }
 
 
-def enforce_authorization_for_refresh_token_without_claim(headers, settings):
+def enforce_authorization_for_refresh_token_without_claim(
+    headers, settings, cache=None
+):
     return {
         "iss": "example.com",
         "sub": "kisee-toto",
@@ -55,7 +57,7 @@ def enforce_authorization_for_refresh_token_without_claim(headers, settings):
     }
 
 
-def enforce_authorization__non_staff(headers, settings):
+def enforce_authorization__non_staff(headers, settings, cache=None):
     return {
         "iss": "example.com",
         "sub": "kisee-tototo",
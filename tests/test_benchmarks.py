@@ -0,0 +1,154 @@
+"""Benchmarks, run as part of the test suite when PASEE_BENCHMARKS is
+set, results being logged (see them using pytest --log-cli-level=INFO).
+
+Their size can be tuned with the PASEE_BENCHMARK_TOKENS environment
+variable. PostgreSQL benchmarks need PASEE_TEST_POSTGRES instead, see
+test_pgsql.py.
+"""
+import logging
+import os
+import time
+from typing import Tuple
+
+import jwt
+import pytest
+
+from pasee import keys, serializers
+from pasee.__main__ import load_conf
+from pasee.pasee import identification_app
+from pasee.storage_backend.pgsql_backend.pgsql import PostgresStorage
+from pasee.storage_interface import MAX_PAGE_SIZE
+from pasee.vendor import coreapi
+from test_pgsql import POSTGRES, needs_postgres, postgres_options
+
+TOKENS = int(os.environ.get("PASEE_BENCHMARK_TOKENS", "200"))
+needs_benchmarks = pytest.mark.skipif(
+    not os.environ.get("PASEE_BENCHMARKS"), reason="PASEE_BENCHMARKS not set"
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def refresh_tokens_per_second(
+    aiohttp_client, settings
+) -> float:  # pragma: no cover  # opt-in benchmark
+    """Sequentially refresh distinct tokens through POST /tokens/?refresh,
+    so each request verifies a token and signs two.
+    """
+    client = await aiohttp_client(identification_app(settings))
+    refresh_tokens = [
+        jwt.encode(
+            {"sub": "kisee-benchmark", "jti": str(i), "refresh_token": True},
+            settings["private_key"],
+            algorithm=settings["algorithm"],
+        )
+        for i in range(TOKENS)
+    ]
+    start = time.perf_counter()
+    for refresh_token in refresh_tokens:
+        response = await client.post(
+            "/tokens/?refresh", headers={"Authorization": f"Bearer {refresh_token}"}
+        )
+        assert response.status == 201
+        await response.read()
+    return TOKENS / (time.perf_counter() - start)
+
+
+@needs_benchmarks
+async def test_benchmark_preloaded_keys(
+    aiohttp_client, monkeypatch
+):  # pragma: no cover  # opt-in benchmark
+    settings = load_conf("tests/test-settings.toml")
+    signing_keys = {settings["private_key"], settings["public_key"]}
+    load_public_key = keys.load_public_key
+    with monkeypatch.context() as patch:
+        # How it was before: PyJWT parses PEM strings on each call.
+        patch.setattr("pasee.keys.load_private_key", lambda pem: pem)
+        patch.setattr(
+            "pasee.keys.load_public_key",
+            lambda pem: pem if pem in signing_keys else load_public_key(pem),
+        )
+        pem_keys = await refresh_tokens_per_second(aiohttp_client, settings)
+    preloaded_keys = await refresh_tokens_per_second(aiohttp_client, settings)
+    logger.info(
+        "POST /tokens/?refresh: %.0f tokens/s with PEM keys, "
+        "%.0f tokens/s with preloaded keys",
+        pem_keys,
+        preloaded_keys,
+    )
+
+
+async def hot_queries_round_trip(
+    options: dict,
+) -> Tuple[float, float]:  # pragma: no cover  # needs a running postgres
+    """Round-trip time in seconds of the hot queries of PostgresStorage,
+    on first use of a connection, and then mean round-trip time.
+    """
+    storage = PostgresStorage(options)
+    async with storage:
+        await storage.create_user("kisee-benchmark")
+        await storage.create_group("benchmark")
+        try:
+            await storage.add_member_to_group("kisee-benchmark", "benchmark")
+            timings = []
+            for _ in range(TOKENS):
+                start = time.perf_counter()
+                await storage.get_authorizations_for_user("kisee-benchmark")
+                await storage.user_exists("kisee-benchmark")
+                await storage.is_user_in_group("kisee-benchmark", "benchmark")
+                timings.append((time.perf_counter() - start) / 3)
+        finally:
+            await storage.delete_group("benchmark")
+            await storage.delete_user("kisee-benchmark")
+    return timings[0], sum(timings[1:]) / (len(timings) - 1)
+
+
+@needs_postgres
+async def test_benchmark_prepared_statements(
+    loop,
+):  # pragma: no cover  # needs a running postgres
+    options = postgres_options(POSTGRES)
+    modes = {"implicitly prepared": False, "prepared at connection": True}
+    for mode, prepare_statements in modes.items():
+        first, mean = await hot_queries_round_trip(
+            {**options, "prepare_statements": prepare_statements}
+        )
+        logger.info(
+            "PostgreSQL hot queries round-trip, %s: %.0fus on first use, %.0fus then",
+            mode,
+            first * 1e6,
+            mean * 1e6,
+        )
+
+
+@needs_benchmarks
+def test_benchmark_serializers():  # pragma: no cover  # opt-in benchmark
+    codec = coreapi.codecs.CoreJSONCodec()
+    members = [f"kisee-member-{i}" for i in range(MAX_PAGE_SIZE)]
+
+    def members_page(namespace):
+        return namespace.Document(
+            url="http://localhost/groups/benchmark/",
+            title="benchmark group management interface",
+            content={
+                "members": [
+                    namespace.Document(url=f"http://localhost/users/{member}")
+                    for member in members
+                ],
+                "next": namespace.Link(url="http://localhost/groups/benchmark/?c=1"),
+            },
+        )
+
+    start = time.perf_counter()
+    codec.encode(members_page(coreapi))
+    corejson = time.perf_counter() - start
+    start = time.perf_counter()
+    serializers.encode(members_page(serializers))
+    fast = time.perf_counter() - start
+    logger.info(
+        "Serializing %d members: %.1fms with CoreJSONCodec, "
+        "%.1fms with pasee.serializers",
+        MAX_PAGE_SIZE,
+        corejson * 1e3,
+        fast * 1e3,
+    )
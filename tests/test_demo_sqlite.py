@@ -1,6 +1,11 @@
+import asyncio
+
 import pytest
 
-from pasee.storage_backend.demo_backend.sqlite import DemoSqliteStorage
+from pasee.storage_backend.demo_backend.sqlite import (
+    DemoSqliteStorage,
+    ThreadedSqliteStorage,
+)
 
 
 @pytest.fixture
@@ -80,3 +85,71 @@ async def test_get_user(sqlite_storage):
 async def test_ban_user(sqlite_storage):
     with pytest.raises(RuntimeError):
         await sqlite_storage.ban_user("")
+
+
+@pytest.fixture
+def threaded_storage(tmp_path):
+    return ThreadedSqliteStorage({"file": str(tmp_path / "pasee.sqlite"), "workers": 2})
+
+
+def test_threaded_refuses_memory_database():
+    with pytest.raises(ValueError):
+        ThreadedSqliteStorage({"file": ":memory:"})
+
+
+async def test_threaded_outside_context_manager(threaded_storage):
+    with pytest.raises(RuntimeError):
+        await threaded_storage.get_authorizations_for_user("")
+    await threaded_storage.delete_members_in_group("")
+
+
+async def test_threaded_uses_wal(threaded_storage):
+    await threaded_storage.__aenter__()
+    try:
+        journal_mode = await threaded_storage._run(
+            lambda connection: connection.execute("PRAGMA journal_mode").fetchone()[0]
+        )
+    finally:
+        await threaded_storage.__aexit__(None, None, None)
+    assert journal_mode == "wal"
+    assert threaded_storage.closed
+
+
+async def test_threaded_storage(threaded_storage):
+    await threaded_storage.__aenter__()
+    try:
+        await threaded_storage.create_user("kisee-toto")
+        assert await threaded_storage.user_exists("kisee-toto")
+        await threaded_storage.create_group("my_group")
+        await threaded_storage.create_group("my_group.staff")
+        assert await threaded_storage.group_exists("my_group")
+        await threaded_storage.add_member_to_group("kisee-toto", "my_group")
+        await threaded_storage.add_member_to_group("kisee-toto", "my_group.staff")
+        assert await threaded_storage.is_user_in_group("kisee-toto", "my_group")
+        results = await asyncio.gather(
+            *[
+                threaded_storage.get_authorizations_for_user("kisee-toto")
+                for _ in range(10)
+            ]
+        )
+        assert all(groups == ["my_group", "my_group.staff"] for groups in results)
+        assert await threaded_storage.get_groups() == ["my_group", "my_group.staff"]
+        assert await threaded_storage.get_groups_of_user("kisee-toto", "my_group") == [
+            "my_group.staff"
+        ]
+        assert await threaded_storage.get_members_of_group("my_group") == ["kisee-toto"]
+        assert await threaded_storage.get_users() == ["kisee-toto"]
+        await threaded_storage.ban_user("kisee-toto")
+        assert await threaded_storage.get_user("kisee-toto") == {
+            "username": "kisee-toto",
+            "is_banned": 1,
+        }
+        await threaded_storage.delete_member_in_group("kisee-toto", "my_group")
+        assert not await threaded_storage.is_user_in_group("kisee-toto", "my_group")
+        await threaded_storage.delete_members_in_group("my_group.staff")
+        await threaded_storage.delete_group("my_group")
+        assert not await threaded_storage.group_exists("my_group")
+        await threaded_storage.delete_user("kisee-toto")
+        assert await threaded_storage.get_user("kisee-toto") is None
+    finally:
+        await threaded_storage.__aexit__(None, None, None)
@@ -0,0 +1,62 @@
+from base64 import urlsafe_b64decode
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+
+from pasee import keys
+
+PUBLIC_KEY = """-----BEGIN PUBLIC KEY-----
+MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEgLwEAlfrY/AJrS4bCzg2pEhXrT5Zu3cr
+mVu3bgkvT/P7bsq4lu20o8kWQd/srSRCb7kvz9xQQMVLLemrebXZCA==
+-----END PUBLIC KEY-----"""
+
+
+def test_load_public_key_is_cached():
+    assert keys.load_public_key(PUBLIC_KEY) is keys.load_public_key(PUBLIC_KEY)
+
+
+def test_public_jwk():
+    public_key = keys.load_public_key(PUBLIC_KEY)
+    jwk = keys.public_jwk(public_key)
+    assert jwk["kty"] == "EC"
+    assert jwk["crv"] == "secp256k1"
+    x = int.from_bytes(urlsafe_b64decode(jwk["x"] + "="), "big")
+    assert x == public_key.public_numbers().x
+
+
+def test_key_id():
+    kid = keys.key_id(keys.load_public_key(PUBLIC_KEY))
+    assert kid == keys.key_id(keys.load_public_key(PUBLIC_KEY))
+    assert len(kid) == 43  # sha256, base64url encoded without padding.
+    other_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+    assert keys.public_jwk(other_key)["crv"] == "P-256"
+    assert keys.key_id(other_key) != kid
+
+
+def test_signing_key_id():
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption()
+    ).decode()
+    kid = keys.key_id(private_key.public_key())
+    assert keys.signing_key_id(private_key) == kid
+    assert keys.signing_key_id(pem) == kid
+
+
+def test_jwks():
+    other_key = ec.generate_private_key(ec.SECP384R1()).public_key()
+    other_pem = other_key.public_bytes(
+        Encoding.PEM, PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    jwks = keys.jwks((PUBLIC_KEY, other_pem))
+    assert [jwk["kid"] for jwk in jwks["keys"]] == [
+        keys.key_id(keys.load_public_key(PUBLIC_KEY)),
+        keys.key_id(other_key),
+    ]
+    assert jwks["keys"][1]["crv"] == "P-384"
+    assert {jwk["use"] for jwk in jwks["keys"]} == {"sig"}
@@ -2,9 +2,12 @@
 """
 
 
+import asyncio
 import sys
 from unittest.mock import patch
 
+import pytest
+
 import pasee.__main__ as main
 
 
@@ -13,3 +16,27 @@ def test_parse_args():
     with patch.object(sys, "argv", ["dummy"]):
         args = main.pasee_arg_parser().parse_args()
         assert (args.settings_file or args.settings) == "settings.toml"
+
+
+def test_parse_args__workers_and_event_loop():
+    args = main.pasee_arg_parser().parse_args(
+        ["--workers", "4", "--event-loop", "uvloop"]
+    )
+    assert args.workers == 4
+    assert args.event_loop == "uvloop"
+
+
+def test_install_event_loop():
+    pytest.importorskip("uvloop")
+    policy = asyncio.get_event_loop_policy()
+    try:
+        assert main.install_event_loop("asyncio") == "asyncio"
+        assert main.install_event_loop("uvloop") == "uvloop"
+        assert type(asyncio.get_event_loop_policy()).__module__.startswith("uvloop")
+    finally:
+        asyncio.set_event_loop_policy(policy)
+
+
+def test_install_event_loop__uvloop_missing(monkeypatch):
+    monkeypatch.setattr(main, "uvloop", None)
+    assert main.install_event_loop("uvloop") == "asyncio"
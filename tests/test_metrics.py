@@ -0,0 +1,47 @@
+from pasee.metrics import Counter, Gauge, Histogram, Metrics
+
+
+def test_counter():
+    counter = Counter("requests_total", "Requests.", ("route", "status"))
+    counter.inc(("get_root", "200"))
+    counter.inc(("get_root", "200"), 2)
+    counter.inc(('a "quoted"\\\n', "500"))
+    assert counter.render() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="a \\"quoted\\"\\\\\\n",status="500"} 1',
+        'requests_total{route="get_root",status="200"} 3',
+    ]
+
+
+def test_gauge():
+    gauge = Gauge("in_flight", "In flight.")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.render()[-1] == "in_flight 1"
+    gauge.set((), 0.5)
+    assert gauge.render()[-1] == "in_flight 0.5"
+
+
+def test_histogram():
+    histogram = Histogram("duration_seconds", "Duration.", ("route",), (0.1, 1))
+    for value in 0.05, 0.1, 0.5, 3:
+        histogram.observe(("get_root",), value)
+    assert histogram.render()[2:] == [
+        'duration_seconds_bucket{route="get_root",le="0.1"} 2',
+        'duration_seconds_bucket{route="get_root",le="1"} 3',
+        'duration_seconds_bucket{route="get_root",le="+Inf"} 4',
+        'duration_seconds_sum{route="get_root"} 3.65',
+        'duration_seconds_count{route="get_root"} 4',
+    ]
+
+
+def test_metrics_render():
+    metrics = Metrics()
+    metrics.tokens_issued.inc(("kisee", "login"))
+    text = metrics.render()
+    assert text.endswith("\n")
+    assert (
+        'pasee_tokens_issued_total{identity_provider="kisee",grant="login"} 1\n' in text
+    )
@@ -1,8 +1,11 @@
 import json
 
 import pytest
+from aiohttp import web
 from aioresponses import aioresponses
 
+from pasee.metrics import Metrics
+from pasee.middlewares import record_metrics
 from pasee.pasee import identification_app
 from pasee.__main__ import load_conf
 import mocks
@@ -22,3 +25,82 @@ async def test_bad_json(client):
         headers={"Content-Type": "application/json"},
     )
     assert response.status == 400
+
+
+@pytest.fixture
+def json_parses(monkeypatch):
+    """Count calls to Request.json()."""
+    parses = []
+    parse = web.Request.json
+
+    async def counting_json(request, **kwargs):
+        parses.append(request.path)
+        return await parse(request, **kwargs)
+
+    monkeypatch.setattr(web.Request, "json", counting_json)
+    return parses
+
+
+@pytest.mark.parametrize(
+    "method, path, body, status",
+    [
+        ("POST", "/groups/", {"group": "parsed_once"}, 201),
+        ("POST", "/groups/staff/", {"username": "kisee-someone"}, 404),
+        ("PATCH", "/groups/staff/", {"add": ["kisee-someone"]}, 404),
+        ("PATCH", "/users/kisee-someone", {"is_banned": False}, 404),
+    ],
+)
+async def test_json_parsed_once(
+    client, monkeypatch, json_parses, method, path, body, status
+):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.request(method, path, json=body)
+    assert response.status == status
+    assert json_parses == [path]
+
+
+async def test_json_parsed_once__authentication(client, json_parses):
+    with aioresponses(passthrough=["http://127.0.0.1:"]) as mocked:
+        mocked.get(
+            "http://dump-kisee-endpoint/",
+            payload={"resources": {"jwt": {"href": "http://dump-kisee-endpoint/jwt/"}}},
+        )
+        mocked.post("http://dump-kisee-endpoint/jwt/", status=403)
+        response = await client.post(
+            "/tokens/?idp=kisee", json={"login": "toto", "password": "x"}
+        )
+    assert response.status == 403
+    assert json_parses == ["/tokens/"]
+
+
+async def test_max_body_size(aiohttp_client):
+    settings = load_conf("tests/test-settings.toml")
+    settings["max_body_size"] = 64
+    client = await aiohttp_client(identification_app(settings))
+    response = await client.post("/groups/", json={"group": "x" * 64})
+    assert response.status == 413
+
+
+async def test_record_metrics(aiohttp_client):
+    async def not_found(request):
+        raise web.HTTPNotFound()
+
+    async def crash(request):
+        raise RuntimeError("Crash")
+
+    app = web.Application(middlewares=[record_metrics])
+    app["metrics"] = Metrics()
+    app.router.add_get("/not-found/", not_found, name="not_found")
+    app.router.add_get("/crash/{id}", crash)
+    client = await aiohttp_client(app)
+    assert (await client.get("/not-found/")).status == 404
+    assert (await client.get("/crash/1")).status == 500
+    assert (await client.get("/unknown")).status == 404
+    assert app["metrics"].requests.values == {
+        ("not_found", "GET", "404"): 1,
+        ("/crash/{id}", "GET", "500"): 1,
+        ("unmatched", "GET", "404"): 1,
+    }
+    assert set(app["metrics"].requests_in_flight.values.values()) == {0}
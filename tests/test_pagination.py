@@ -0,0 +1,35 @@
+import pytest
+from aiohttp import web
+
+from pasee import pagination
+
+SETTINGS = {"private_key": "not really a key", "hostname": "http://localhost"}
+
+
+def test_cursor_round_trip():
+    cursor = pagination.encode_cursor(SETTINGS, "users", "kisee-toto")
+    assert "kisee-toto" not in cursor
+    assert pagination.decode_cursor(SETTINGS, "users", cursor) == "kisee-toto"
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "garbage",
+        "a.b.c",
+        pagination.encode_cursor(SETTINGS, "groups", "kisee-toto"),
+        pagination.encode_cursor({"private_key": "other key"}, "users", "kisee-toto"),
+    ],
+)
+def test_invalid_cursors(cursor):
+    with pytest.raises(web.HTTPBadRequest):
+        pagination.decode_cursor(SETTINGS, "users", cursor)
+
+
+def test_tampered_cursor():
+    payload, signature = pagination.encode_cursor(SETTINGS, "users", "a").split(".")
+    forged = pagination.encode_cursor(SETTINGS, "users", "b").split(".")[0]
+    with pytest.raises(web.HTTPBadRequest):
+        pagination.decode_cursor(SETTINGS, "users", f"{forged}.{signature}")
+    assert pagination.decode_cursor(SETTINGS, "users", f"{payload}.{signature}") == "a"
@@ -1,7 +1,15 @@
+import logging
+
 import pytest
+import aiohttp
 
 from pasee.__main__ import load_conf
 from pasee import MissingSettings
+from pasee.middlewares import shield_from_cancellation
+from pasee import workers
+from pasee.pasee import identification_app, start_server
+from pasee.storage_backend.cache import CachedStorage
+from pasee.storage_backend.instrumentation import InstrumentedStorage
 import mocks
 
 
@@ -23,3 +31,82 @@ def test_load_conf__none_in_parameter(monkeypatch):
 def test_load_conf__missing_variables_in_conf(monkeypatch):
     with pytest.raises(MissingSettings):
         config = load_conf("tests/test-settings-missing-values.toml")
+
+
+def test_storage_backend_cache():
+    settings = load_conf("tests/test-settings.toml")
+    settings["storage_backend"]["cache"] = {"ttl": 10}
+    app = identification_app(settings=settings)
+    assert isinstance(app["storage_backend"], CachedStorage)
+    assert app["storage_backend"].ttl == 10
+
+
+def test_storage_backend_instrumentation():
+    settings = load_conf("tests/test-settings.toml")
+    settings["storage_backend"]["cache"] = {"ttl": 10}
+    settings["storage_backend"]["instrumentation"] = {"slow_call_threshold": 1}
+    app = identification_app(settings=settings)
+    instrumented = app["storage_backend"].backend
+    assert isinstance(instrumented, InstrumentedStorage)
+    assert instrumented.slow_call_threshold == 1
+    assert instrumented.metrics is app["metrics"]
+
+
+async def test_identity_providers_built_at_startup(aiohttp_client):
+    settings = load_conf("tests/test-settings.toml")
+    app = identification_app(settings=settings)
+    await aiohttp_client(app)
+    assert set(app["identity_providers"]) == {"kisee", "twitter"}
+    assert app["identity_providers"]["kisee"].session is app["http_client"]
+
+
+@pytest.mark.parametrize(
+    "server_settings, access_log",
+    [
+        ({}, True),
+        ({"backlog": 16, "keepalive_timeout": 0.1, "access_log": False}, False),
+    ],
+)
+async def test_start_server(loop, caplog, server_settings, access_log):
+    caplog.set_level(logging.INFO, logger="aiohttp.access")
+    settings = load_conf("tests/test-settings.toml")
+    settings.update(host="127.0.0.1", port=0, server=server_settings)
+    runner = await start_server(
+        identification_app(settings), settings, handle_signals=False
+    )
+    try:
+        host, port = runner.addresses[0][:2]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{host}:{port}/public-key/") as response:
+                assert response.status == 200
+    finally:
+        await runner.cleanup()
+    logged = any("GET /public-key/" in message for message in caplog.messages)
+    assert logged is access_log
+
+
+async def test_start_server__on_socket(loop):
+    settings = load_conf("tests/test-settings.toml")
+    sock = workers.listen("127.0.0.1", 0)
+    runner = await start_server(
+        identification_app(settings), settings, sock=sock, handle_signals=False
+    )
+    try:
+        port = sock.getsockname()[1]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/") as response:
+                assert response.status == 200
+    finally:
+        await runner.cleanup()
+
+
+async def test_handler_cancellation_disabled(aiohttp_client):
+    settings = load_conf("tests/test-settings.toml")
+    settings["server"] = {"handler_cancellation": False}
+    app = identification_app(settings=settings)
+    assert shield_from_cancellation in app.middlewares
+    client = await aiohttp_client(app)
+    response = await client.get("/public-key/")
+    assert response.status == 200
+    response = await client.get("/memberships/")
+    assert response.status == 403
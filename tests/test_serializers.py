@@ -0,0 +1,91 @@
+"""The serializers encode documents exactly like coreapi's CoreJSONCodec."""
+import pytest
+
+from pasee import serializers
+from pasee.vendor import coreapi
+
+HOST = "https://pasee.example.com"
+
+
+def build(namespace):
+    """The same document, using either coreapi or pasee.serializers classes."""
+    return namespace.Document(
+        url=f"{HOST}/groups/",
+        title="Groups — Ünïcode ✓",
+        content={
+            "groups": [
+                namespace.Document(url=f"{HOST}/groups/staff/", title="staff"),
+                namespace.Document(url="/groups/é/", content={"nested": {"a": 1}}),
+            ],
+            "approximate_count": 2,
+            "_type": "escaped",
+            "__meta": {"_type": "escaped too", "list": [1.5, None, True, "ß"]},
+            "errors": [namespace.Error(content={"reason": "nope"})],
+            "error": namespace.Error(
+                title="Oops", content={"link": namespace.Link(url=f"{HOST}/x/")}
+            ),
+            "create_group": namespace.Link(
+                action="post",
+                title="Create a group",
+                description="With a description",
+                fields=[
+                    namespace.Field(name="group", required=True),
+                    namespace.Field(name="owner", location="form"),
+                ],
+            ),
+            "delete_group": namespace.Link(
+                url=f"{HOST}/groups/", action="delete", encoding="application/json"
+            ),
+            "get_group": namespace.Link(url=f"{HOST}/groups/", action="get"),
+            "elsewhere": namespace.Link(
+                url="http://elsewhere.example.com/", transform="inplace"
+            ),
+            "self": namespace.Link(url=f"{HOST}/groups/"),
+            "staff": namespace.Document(
+                url=f"{HOST}/groups/staff/",
+                description="Staff members",
+                content={"link": namespace.Link(url=f"{HOST}/groups/staff/")},
+            ),
+        },
+    )
+
+
+def test_same_bytes_as_corejson():
+    expected = coreapi.codecs.CoreJSONCodec().encode(build(coreapi))
+    assert serializers.json_dumps(serializers.to_primitive(build(serializers))) == (
+        expected
+    )
+
+
+def test_same_bytes_as_corejson_with_orjson():
+    orjson = pytest.importorskip("orjson")
+    expected = coreapi.codecs.CoreJSONCodec().encode(build(coreapi))
+    assert orjson.dumps(serializers.to_primitive(build(serializers))) == expected
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {},
+        {"url": f"{HOST}/"},
+        {"url": "", "title": "", "content": {"a": []}},
+        {"description": "Only a description"},
+    ],
+)
+def test_same_bytes_for_small_documents(document):
+    expected = coreapi.codecs.CoreJSONCodec().encode(coreapi.Document(**document))
+    assert serializers.encode(serializers.Document(**document)) == expected
+
+
+def test_relative_url():
+    assert serializers._relative_url(None, f"{HOST}/a/") == f"{HOST}/a/"
+    assert serializers._relative_url(f"{HOST}/a/", f"{HOST}/a/") == ""
+    assert serializers._relative_url(f"{HOST}/a/", f"{HOST}/b/?c=d") == "/b/?c=d"
+    assert serializers._relative_url("/a/", f"{HOST}/b/") == f"{HOST}/b/"
+    assert serializers._relative_url("/a/", "/b/") == "/b/"
+
+
+def test_same_bytes_for_primitives():
+    error = {"_type": "error", "_meta": {"title": "Not Found"}}
+    expected = coreapi.codecs.CoreJSONCodec().encode(error)
+    assert serializers.encode(error) == expected
@@ -0,0 +1,317 @@
+import pytest
+
+from pasee.storage_backend.cache import CachedStorage
+from pasee.storage_backend.demo_backend.sqlite import DemoSqliteStorage
+from pasee.storage_interface import StorageBackend, StorageBackendProxy
+
+
+class LaggingReplica(StorageBackendProxy):
+    """Reads from a replica which did not see any member yet."""
+
+    async def get_members_of_group(self, group, last_element="", page_size=None):
+        return []
+
+    def primary(self):
+        return self.backend
+
+
+@pytest.fixture
+async def storage(loop):
+    storage = CachedStorage(DemoSqliteStorage({"file": ":memory:"}), {"max_size": 2})
+    await storage.__aenter__()
+    await storage.create_user("kisee-toto")
+    await storage.create_user("kisee-titi")
+    await storage.create_group("my_group")
+    await storage.add_member_to_group("kisee-toto", "my_group")
+    await storage.add_member_to_group("kisee-titi", "my_group")
+    yield storage
+    await storage.__aexit__(None, None, None)
+
+
+async def test_hits_and_misses(storage):
+    assert await storage.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    assert await storage.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    assert (storage.hits, storage.misses) == (1, 1)
+    assert storage.stats()["authorizations_cache_size"] == 1
+
+
+async def test_lru_eviction(storage):
+    await storage.get_authorizations_for_user("kisee-toto")
+    await storage.get_authorizations_for_user("kisee-titi")
+    await storage.get_authorizations_for_user("kisee-toto")
+    await storage.get_authorizations_for_user("kisee-tata")
+    assert list(storage.entries) == ["kisee-toto", "kisee-tata"]
+
+
+async def test_ttl(storage, monkeypatch):
+    await storage.get_authorizations_for_user("kisee-toto")
+    now = storage.entries["kisee-toto"][0]
+    monkeypatch.setattr("pasee.storage_backend.cache.time.monotonic", lambda: now)
+    await storage.get_authorizations_for_user("kisee-toto")
+    assert storage.misses == 2
+
+
+async def test_invalidated_by_membership_changes(storage):
+    await storage.create_group("other_group")
+    await storage.get_authorizations_for_user("kisee-toto")
+    await storage.get_authorizations_for_user("kisee-tata")
+    await storage.add_member_to_group("kisee-toto", "other_group")
+    assert await storage.get_authorizations_for_user("kisee-toto") == [
+        "my_group",
+        "other_group",
+    ]
+    await storage.delete_member_in_group("kisee-toto", "other_group")
+    assert await storage.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    await storage.delete_members_in_group("my_group")
+    assert await storage.get_authorizations_for_user("kisee-toto") == []
+    await storage.add_member_to_group("kisee-toto", "my_group")
+    await storage.get_authorizations_for_user("kisee-toto")
+    await storage.delete_group("my_group")
+    assert await storage.get_authorizations_for_user("kisee-toto") == []
+    await storage.delete_user("kisee-toto")
+    assert "kisee-toto" not in storage.entries
+    assert storage.hits == 0
+
+
+async def test_lookup_racing_with_mutation_is_not_cached(storage, monkeypatch):
+    backend_lookup = storage.backend.get_authorizations_for_user
+
+    async def racing_lookup(user):
+        groups = await backend_lookup(user)
+        await storage.delete_member_in_group(user, "my_group")
+        return groups
+
+    monkeypatch.setattr(storage.backend, "get_authorizations_for_user", racing_lookup)
+    await storage.get_authorizations_for_user("kisee-toto")
+    assert "kisee-toto" not in storage.entries
+
+
+async def test_lookup_racing_with_bulk_load_is_not_cached(storage, monkeypatch):
+    backend_lookup = storage.backend.get_authorizations_for_user
+
+    async def racing_lookup(user):
+        groups = await backend_lookup(user)
+        await storage.bulk_load([], ["other_group"], [(user, "other_group")])
+        return groups
+
+    monkeypatch.setattr(storage.backend, "get_authorizations_for_user", racing_lookup)
+    assert await storage.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    assert "kisee-toto" not in storage.entries
+
+
+async def test_forwarded_methods(storage):
+    assert await storage.group_exists("my_group")
+    assert await storage.user_exists("kisee-toto")
+    assert await storage.is_user_in_group("kisee-toto", "my_group")
+    assert await storage.get_groups() == ["my_group"]
+    assert await storage.get_groups_of_user("kisee-toto") == ["my_group"]
+    assert await storage.get_users() == ["kisee-titi", "kisee-toto"]
+    assert await storage.get_users("", 1) == ["kisee-titi"]
+    assert await storage.approximate_count("users") == 2
+    assert await StorageBackend.approximate_count(storage.backend, "users") is None
+    assert await storage.get_members_of_group("my_group") == [
+        "kisee-titi",
+        "kisee-toto",
+    ]
+    await storage.ban_user("kisee-toto")
+    assert (await storage.get_user("kisee-toto"))["is_banned"]
+
+
+async def test_proxy(storage):
+    proxy = StorageBackendProxy(storage.backend, {})
+    assert await proxy.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    await proxy.add_member_to_group("kisee-toto", "my_group.staff")
+    await proxy.delete_member_in_group("kisee-toto", "my_group.staff")
+    await proxy.add_members_to_group(["kisee-toto"], "my_group.staff")
+    await proxy.remove_members_from_group(["kisee-toto"], "my_group.staff")
+    assert await proxy.ensure_user_and_get_authorizations("kisee-toto") == ["my_group"]
+    await proxy.add_member_to_existing_group("kisee-toto", "my_group.staff")
+    await proxy.remove_member_from_existing_group("kisee-toto", "my_group.staff")
+    await proxy.bulk_load([], ["my_group.staff"], [("kisee-toto", "my_group.staff")])
+    assert await proxy.is_user_in_group("kisee-toto", "my_group.staff")
+    await proxy.delete_members_in_group("my_group")
+    await proxy.delete_group("my_group")
+    await proxy.delete_user("kisee-toto")
+    assert await proxy.get_authorizations_for_user("kisee-toto") == []
+    assert proxy.stats() == {}
+
+
+@pytest.mark.parametrize("generic", [False, True])
+async def test_bulk_load(storage, generic):
+    await storage.get_authorizations_for_user("kisee-toto")
+    bulk_load = StorageBackend.bulk_load if generic else type(storage).bulk_load
+    await bulk_load(
+        storage,
+        ["kisee-tata", "kisee-tata", "kisee-toto"],
+        ["a.b", "a.b.staff", "my_group"],
+        [
+            ("kisee-toto", "a.b"),
+            ("kisee-toto", "a.b"),
+            ("kisee-titi", "my_group"),
+            ("kisee-tutu", "a.b.staff"),
+            ("kisee-tutu", "no_group"),
+        ],
+    )
+    assert await storage.get_authorizations_for_user("kisee-toto") == [
+        "a.b",
+        "my_group",
+    ]
+    assert await storage.get_members_of_group("a.b") == ["kisee-toto"]
+    assert await storage.get_users() == [
+        "kisee-tata",
+        "kisee-titi",
+        "kisee-toto",
+        "kisee-tutu",
+    ]
+    assert await storage.get_groups() == ["a.b", "a.b.staff", "my_group"]
+
+
+async def test_bulk_membership_changes(storage):
+    await storage.get_authorizations_for_user("kisee-toto")
+    assert await storage.add_members_to_group(
+        ["kisee-toto", "kisee-tata", "kisee-tata"], "my_group"
+    ) == {"kisee-toto": "already_member", "kisee-tata": "added"}
+    assert await storage.get_authorizations_for_user("kisee-tata") == ["my_group"]
+    assert await storage.remove_members_from_group(
+        ["kisee-toto", "kisee-tutu"], "my_group"
+    ) == {"kisee-toto": "removed", "kisee-tutu": "not_member"}
+    assert await storage.get_authorizations_for_user("kisee-toto") == []
+    assert storage.hits == 0
+
+
+async def test_bulk_membership_changes_fallback(storage):
+    """The member at a time implementation of StorageBackend, as used
+    by backends not having their own.
+    """
+    assert await StorageBackend.add_members_to_group(
+        storage.backend, ["kisee-toto", "kisee-tata"], "my_group"
+    ) == {"kisee-toto": "already_member", "kisee-tata": "added"}
+    assert await StorageBackend.remove_members_from_group(
+        storage.backend, ["kisee-toto", "kisee-tutu"], "my_group"
+    ) == {"kisee-toto": "removed", "kisee-tutu": "not_member"}
+    assert await storage.get_members_of_group("my_group") == [
+        "kisee-tata",
+        "kisee-titi",
+    ]
+
+
+async def test_ensure_user_and_get_authorizations(storage):
+    # Looking up an unknown user caches it, without telling if it exists.
+    assert await storage.get_authorizations_for_user("kisee-tata") == []
+    assert await storage.ensure_user_and_get_authorizations("kisee-tata") == []
+    assert await storage.user_exists("kisee-tata")
+    assert await storage.ensure_user_and_get_authorizations("kisee-tata") == []
+    assert await storage.get_authorizations_for_user("kisee-tata") == []
+    assert (storage.hits, storage.misses) == (2, 2)
+
+
+async def test_single_member_changes(storage):
+    await storage.get_authorizations_for_user("kisee-toto")
+    await storage.create_group("other_group")
+    assert (
+        await storage.add_member_to_existing_group("kisee-toto", "other_group")
+        == "added"
+    )
+    assert (
+        await storage.add_member_to_existing_group("kisee-toto", "other_group")
+        == "already_member"
+    )
+    assert await storage.get_authorizations_for_user("kisee-toto") == [
+        "my_group",
+        "other_group",
+    ]
+    assert (
+        await storage.remove_member_from_existing_group("kisee-toto", "other_group")
+        == "removed"
+    )
+    assert (
+        await storage.remove_member_from_existing_group("kisee-toto", "other_group")
+        == "not_member"
+    )
+    assert await storage.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    for change in (
+        storage.add_member_to_existing_group,
+        storage.remove_member_from_existing_group,
+    ):
+        assert await change("kisee-toto", "no_group") == "group_not_found"
+    assert storage.hits == 0
+
+
+@pytest.mark.parametrize(
+    "method, args, expected",
+    [
+        ("ensure_user_and_get_authorizations", ("kisee-tata",), []),
+        ("ensure_user_and_get_authorizations", ("kisee-toto",), ["my_group"]),
+        ("add_member_to_existing_group", ("kisee-tata", "my_group"), "added"),
+        ("add_member_to_existing_group", ("kisee-toto", "no_group"), "group_not_found"),
+        ("remove_member_from_existing_group", ("kisee-toto", "my_group"), "removed"),
+        (
+            "remove_member_from_existing_group",
+            ("kisee-toto", "no_group"),
+            "group_not_found",
+        ),
+    ],
+)
+async def test_single_statement_fallbacks(storage, method, args, expected):
+    """Default implementations of StorageBackend, as used by backends not
+    having their own.
+    """
+    assert await getattr(StorageBackend, method)(storage.backend, *args) == expected
+
+
+async def test_primary(storage):
+    assert storage.backend.primary() is storage.backend
+    proxy = StorageBackendProxy(storage.backend, {})
+    assert proxy.primary() is proxy
+    replicated = StorageBackendProxy(LaggingReplica(storage.backend, {}), {})
+    assert await replicated.get_members_of_group("my_group") == []
+    assert await replicated.primary().get_members_of_group("my_group") == [
+        "kisee-titi",
+        "kisee-toto",
+    ]
+    assert await replicated.get_members_of_group("my_group") == []
+
+
+async def test_primary_skips_cache(storage):
+    storage.backend = LaggingReplica(storage.backend, {})
+    await storage.get_authorizations_for_user("kisee-toto")
+    primary = storage.primary()
+    assert await primary.get_authorizations_for_user("kisee-toto") == ["my_group"]
+    assert await primary.get_members_of_group("my_group") == [
+        "kisee-titi",
+        "kisee-toto",
+    ]
+    assert (storage.hits, storage.misses) == (0, 1)
+    await primary.delete_member_in_group("kisee-toto", "my_group")
+    assert "kisee-toto" not in storage.entries
+
+
+async def test_members_pages(storage):
+    assert await storage.get_members_of_group("my_group", page_size=1) == ["kisee-titi"]
+    assert await storage.get_members_of_group("my_group", "kisee-titi", 1) == [
+        "kisee-toto"
+    ]
+    assert await storage.get_members_of_group("my_group", "kisee-toto", 1) == []
+    members = storage.iter_members_of_group("my_group", page_size=1)
+    assert [member async for member in members] == ["kisee-titi", "kisee-toto"]
+
+
+@pytest.mark.parametrize("page_size", [1, 1000])
+async def test_memberships(storage, page_size):
+    await storage.create_group("other_group")
+    await storage.add_member_to_group("kisee-toto", "other_group")
+    await storage.create_user("kisee-tata")
+    await storage.ban_user("kisee-tata")
+    expected = [
+        {"username": "kisee-tata", "is_banned": True, "groups": []},
+        {"username": "kisee-titi", "is_banned": False, "groups": ["my_group"]},
+        {
+            "username": "kisee-toto",
+            "is_banned": False,
+            "groups": ["my_group", "other_group"],
+        },
+    ]
+    memberships = storage.iter_memberships(page_size)
+    assert [membership async for membership in memberships] == expected
+    memberships = StorageBackend.iter_memberships(storage.backend, page_size)
+    assert [membership async for membership in memberships] == expected
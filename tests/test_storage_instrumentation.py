@@ -0,0 +1,97 @@
+import logging
+
+import pytest
+
+from pasee.metrics import Metrics
+from pasee.storage_backend.demo_backend.sqlite import DemoSqliteStorage
+from pasee.storage_backend.instrumentation import InstrumentedStorage, redact
+
+
+class ExplainedStorage(DemoSqliteStorage):
+    """Gives a plan for any call."""
+
+    async def explain(self, method, *args):
+        if method == "group_exists":
+            raise RuntimeError("No plan")
+        return f"Seq Scan for {method}{args}"
+
+
+@pytest.fixture
+async def storage(loop):
+    storage = InstrumentedStorage(
+        ExplainedStorage({"file": ":memory:"}),
+        {"slow_call_threshold": 0, "explain": True},
+        metrics=Metrics(),
+    )
+    await storage.__aenter__()
+    await storage.create_group("my_group")
+    yield storage
+    await storage.__aexit__(None, None, None)
+
+
+async def test_call_durations(storage):
+    await storage.add_members_to_group(["kisee-toto", "kisee-titi"], "my_group")
+    assert await storage.get_members_of_group("my_group") == [
+        "kisee-titi",
+        "kisee-toto",
+    ]
+    assert [member async for member in storage.iter_members_of_group("my_group")]
+    durations = storage.metrics.storage_call_duration
+    assert sum(durations.counts[("get_members_of_group",)]) == 1
+    assert sum(durations.counts[("create_group",)]) == 1
+    assert ("iter_members_of_group",) not in durations.counts
+    assert storage.get_members_of_group.__name__ == "get_members_of_group"
+
+
+async def test_slow_calls_are_logged_redacted(storage, caplog):
+    await storage.add_members_to_group(["kisee-toto", "kisee-titi"], "my_group")
+    await storage.is_user_in_group(user="kisee-toto", group="my_group")
+    assert "kisee-" not in caplog.text
+    assert "add_members_to_group(members='<2 usernames>', group='my_group')" in (
+        caplog.text
+    )
+    assert "is_user_in_group(user='<username>', group='my_group')" in caplog.text
+    assert "Seq Scan for is_user_in_group('<username>', 'my_group')" in caplog.text
+
+
+async def test_explain_failure(storage, caplog):
+    assert await storage.group_exists("my_group")
+    assert "Can't explain group_exists" in caplog.text
+
+
+async def test_fast_calls_are_not_logged(caplog):
+    storage = InstrumentedStorage(DemoSqliteStorage({"file": ":memory:"}), {})
+    async with storage:
+        await storage.create_group("my_group")
+    assert caplog.records == []
+    assert sum(storage.metrics.storage_call_duration.counts[("create_group",)]) == 1
+
+
+async def test_plans_are_logged_on_demand(caplog):
+    storage = InstrumentedStorage(
+        ExplainedStorage({"file": ":memory:"}), {"slow_call_threshold": -1}
+    )
+    async with storage:
+        await storage.user_exists("kisee-toto")
+    assert [record.levelno for record in caplog.records] == [logging.WARNING]
+
+
+async def test_backends_without_plans(caplog):
+    storage = InstrumentedStorage(
+        DemoSqliteStorage({"file": ":memory:"}),
+        {"slow_call_threshold": -1, "explain": True},
+    )
+    async with storage:
+        assert await storage.explain("user_exists", "kisee-toto") is None
+        await storage.user_exists("kisee-toto")
+    assert "Plan of" not in caplog.text
+
+
+def test_redact():
+    assert redact({"members": iter(["kisee-toto"]), "group": "my_group"}) == {
+        "members": "<username>",
+        "group": "my_group",
+    }
+    assert redact(
+        {"users": ["kisee-toto"], "memberships": [("kisee-toto", "my_group")]}
+    ) == {"users": "<1 usernames>", "memberships": "<1 memberships>"}
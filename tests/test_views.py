@@ -1,9 +1,15 @@
 import json
 
+import jwt
 import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from yarl import URL
 from aioresponses import aioresponses
 
+from pasee import keys
 from pasee.__main__ import load_conf
+from pasee.middlewares import SECURITY_HEADERS
 from pasee.pasee import identification_app
 import mocks
 
@@ -114,6 +120,35 @@ async def test_get_tokens(client):
     assert response.status == 200
 
 
+@pytest.mark.parametrize("path", ["/", "/public-key/", "/tokens/"])
+async def test_precomputed__not_modified(client, path):
+    response = await client.get(path)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "public, max-age=300"
+    body = await response.read()
+    assert body
+    response = await client.get(path, headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+    assert await response.read() == b""
+    response = await client.get(path, headers={"If-None-Match": f'"x", W/{etag}'})
+    assert response.status == 304
+    response = await client.get(path, headers={"If-None-Match": "*"})
+    assert response.status == 304
+    response = await client.get(path, headers={"If-None-Match": '"outdated"'})
+    assert response.status == 200
+    assert await response.read() == body
+    assert response.headers["ETag"] == etag
+
+
+async def test_get_tokens__precomputed_content(client):
+    response = await client.get("/tokens/")
+    assert response.content_type == "application/vnd.coreapi+json"
+    document = await response.json(content_type=None)
+    assert document["access_token"] is None
+    assert document["identify_via_kisee"]["action"] == "post"
+
+
 async def test_post_tokens__twitter(client, monkeypatch):
     monkeypatch.setattr(
         "pasee.identity_providers.twitter.TwitterIdentityProvider.authenticate_user",
@@ -147,9 +182,16 @@ async def test_get_tokens__twitter_callback__user_exists(client, monkeypatch):
     assert response.status == 200
 
 
-async def test_get_tokens__oauth_unknown_idp(client):
+@pytest.mark.parametrize("idp", ["unknown", "not-oauth"])
+async def test_get_tokens__oauth_unknown_idp(client, monkeypatch, idp):
+    # A configured identity provider, which is not one of the BACKENDS.
+    monkeypatch.setitem(
+        client.server.app["identity_providers"],
+        "not-oauth",
+        client.server.app["identity_providers"]["kisee"],
+    )
     response = await client.get(
-        "/tokens/?idp=unknown&oauth_verifier=some_random_token&oauth_token=some_random_token",
+        f"/tokens/?idp={idp}&oauth_verifier=some_random_token&oauth_token=some_random_token",
         json={"login": "test"},
     )
     assert response.status == 400
@@ -665,6 +707,82 @@ async def test_post_tokens__refresh_token__missing_header(client, monkeypatch):
     assert response.status == 400
 
 
+def refresh_token(private_key, **headers):
+    return jwt.encode(
+        {"sub": "kisee-toto", "refresh_token": True},
+        private_key,
+        algorithm="ES256",
+        headers=headers,
+    )
+
+
+async def test_get_jwks(client):
+    response = await client.get("/.well-known/jwks.json")
+    assert response.headers["Cache-Control"] == "public, max-age=21600"
+    assert "ETag" in response.headers
+    jwks = await response.json()
+    assert [jwk["crv"] for jwk in jwks["keys"]] == ["secp256k1"]
+    settings = client.server.app["settings"]
+    response = await client.post(
+        "/tokens/?refresh",
+        headers={"Authorization": f"Bearer {refresh_token(settings['private_key'])}"},
+    )
+    assert response.status == 201
+    tokens = await response.json(content_type=None)
+    for token in tokens["access_token"], tokens["refresh_token"]:
+        assert jwt.get_unverified_header(token)["kid"] == jwks["keys"][0]["kid"]
+
+
+async def test_get_metrics(client):
+    settings = client.server.app["settings"]
+    await client.get("/public-key/")
+    await client.post(
+        "/tokens/?refresh",
+        headers={"Authorization": f"Bearer {refresh_token(settings['private_key'])}"},
+    )
+    response = await client.get("/metrics")
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = await response.text()
+    assert (
+        'pasee_http_requests_total{route="get_public_key",method="GET",status="200"} 1'
+        in text
+    )
+    assert 'pasee_http_requests_in_flight{route="get_metrics"} 1' in text
+    assert (
+        'pasee_tokens_issued_total{identity_provider="kisee",grant="refresh"} 1' in text
+    )
+    assert "claims_cache" not in text
+
+
+async def test_key_rotation(aiohttp_client):
+    next_key = ec.generate_private_key(ec.SECP256K1())
+    next_public_key = (
+        next_key.public_key()
+        .public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+        .decode()
+    )
+    settings = load_conf("tests/test-settings.toml")
+    settings["additional_public_keys"] = [next_public_key]
+    client = await aiohttp_client(identification_app(settings))
+
+    response = await client.get("/.well-known/jwks.json")
+    kids = [jwk["kid"] for jwk in (await response.json())["keys"]]
+    assert kids[1] == keys.key_id(next_key.public_key())
+
+    for token, status in [
+        (refresh_token(settings["private_key"]), 201),
+        (refresh_token(settings["private_key"], kid=kids[0]), 201),
+        (refresh_token(next_key, kid=kids[1]), 201),
+        (refresh_token(next_key), 400),
+        (refresh_token(next_key, kid="unknown"), 400),
+        ("not.a.token", 400),
+    ]:
+        response = await client.post(
+            "/tokens/?refresh", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status == status
+
+
 async def test_get_groups(client):
     response = await client.get("/groups/")
     assert response.status == 200
@@ -788,6 +906,78 @@ async def test_get_group(client, monkeypatch):
     assert response.status == 404
 
 
+async def test_get_group__pages(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    monkeypatch.setattr("pasee.groups.views.MEMBERS_PER_PAGE", 1)
+    headers = {"Authorization": "Bearer somefaketoken"}
+    response = await client.get("/groups/get_group/", headers=headers)
+    content = await response.json()
+    assert [member["username"] for member in content["members"]] == ["kisee-guytodel"]
+    response = await client.get(URL(content["next"]["url"]).path_qs, headers=headers)
+    content = await response.json()
+    assert [member["username"] for member in content["members"]] == ["kisee-toto"]
+    response = await client.get(URL(content["next"]["url"]).path_qs, headers=headers)
+    content = await response.json()
+    assert content["members"] == []
+    assert "next" not in content
+    response = await client.get(
+        "/groups/get_group/?last_element=kisee-guytodel&page_size=5", headers=headers
+    )
+    content = await response.json()
+    assert [member["username"] for member in content["members"]] == ["kisee-toto"]
+    assert "next" not in content
+
+
+@pytest.mark.parametrize("members_per_chunk", [1, 1000])
+async def test_get_group__stream(client, monkeypatch, members_per_chunk):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    monkeypatch.setattr("pasee.groups.views.MEMBERS_PER_CHUNK", members_per_chunk)
+    response = await client.get(
+        "/groups/get_group/",
+        headers={
+            "Authorization": "Bearer somefaketoken",
+            "Accept": "application/x-ndjson",
+        },
+    )
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    for header, value in SECURITY_HEADERS.items():
+        assert response.headers[header] == value
+    assert [json.loads(line) for line in (await response.text()).splitlines()] == [
+        {"username": "kisee-guytodel"},
+        {"username": "kisee-toto"},
+    ]
+
+
+async def test_get_group__from_primary(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    primaries = []
+    storage_backend = client.app["storage_backend"]
+
+    def primary():
+        primaries.append(storage_backend)
+        return storage_backend
+
+    monkeypatch.setattr(storage_backend, "primary", primary)
+    response = await client.get(
+        "/groups/get_group/", headers={"Authorization": "Bearer somefaketoken"}
+    )
+    assert response.status == 200
+    assert not primaries
+    response = await client.get(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken", "X-Pasee-Primary": "true"},
+    )
+    assert response.status == 200
+    assert len(primaries) == 1
+
+
 async def test_get_group__raises_not_authorized(client, monkeypatch):
     monkeypatch.setattr(
         "pasee.utils.enforce_authorization", mocks.enforce_authorization__non_staff
@@ -942,3 +1132,237 @@ async def test_post_group__raises_not_authorized(client, monkeypatch):
         json={"username": "kisee-guytoadd"},
     )
     assert response.status == 403
+
+
+async def test_patch_group(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.patch(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json={
+            "add": ["kisee-guytoadd", "kisee-toto", "kisee-newguy"],
+            "remove": ["kisee-guytodel", "kisee-restrictedguy"],
+        },
+    )
+    assert response.status == 200
+    assert (await response.json())["members"] == {
+        "kisee-guytoadd": "added",
+        "kisee-toto": "already_member",
+        "kisee-newguy": "added",
+        "kisee-guytodel": "removed",
+        "kisee-restrictedguy": "not_member",
+    }
+    members = await client.app["storage_backend"].get_members_of_group("get_group")
+    assert sorted(members) == ["kisee-guytoadd", "kisee-newguy", "kisee-toto"]
+    assert await client.app["storage_backend"].user_exists("kisee-newguy")
+
+
+@pytest.mark.parametrize(
+    "body, members",
+    [
+        ({"add": ["kisee-guytoadd"]}, {"kisee-guytoadd": "added"}),
+        ({"remove": ["kisee-guytodel"]}, {"kisee-guytodel": "removed"}),
+    ],
+)
+async def test_patch_group__add_or_remove(client, monkeypatch, body, members):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.patch(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json=body,
+    )
+    assert response.status == 200
+    assert (await response.json())["members"] == members
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"add": "kisee-guytoadd"},
+        {"add": [42]},
+        {"add": ["kisee-guytoadd"], "remove": ["kisee-guytoadd"]},
+        ["kisee-guytoadd"],
+        "x",
+    ],
+)
+async def test_patch_group__bad_request(client, monkeypatch, body):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.patch(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json=body,
+    )
+    assert response.status == 400
+
+
+async def test_patch_group__too_many_members(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    monkeypatch.setattr("pasee.groups.views.MAX_MEMBERS_PER_PATCH", 2)
+    response = await client.patch(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json={"add": ["kisee-a", "kisee-b", "kisee-c"]},
+    )
+    assert response.status == 413
+
+
+async def test_patch_group__not_found(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.patch(
+        "/groups/group_does_not_exist/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json={"add": ["kisee-guytoadd"]},
+    )
+    assert response.status == 404
+
+
+async def test_patch_group__not_authorized(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization__non_staff
+    )
+    response = await client.patch(
+        "/groups/get_group/",
+        headers={"Authorization": "Bearer somefaketoken"},
+        json={"add": ["kisee-guytoadd"]},
+    )
+    assert response.status == 403
+
+
+async def test_get_stats(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.get(
+        "/stats/", headers={"Authorization": "Bearer somefaketoken"}
+    )
+    assert response.status == 200
+    assert "claims_cache_hits" in await response.json()
+
+
+async def test_get_stats__non_staff(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization__non_staff
+    )
+    response = await client.get(
+        "/stats/", headers={"Authorization": "Bearer somefaketoken"}
+    )
+    assert response.status == 403
+
+
+async def test_get_users__pages(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    headers = {"Authorization": "Bearer somefaketoken"}
+    usernames = []
+    url = "/users/?page_size=3&foo=bar"
+    while url:
+        response = await client.get(url, headers=headers)
+        content = await response.json()
+        assert content["approximate_count"] == 7
+        usernames.extend(user["username"] for user in content["users"])
+        url = URL(content["next"]["url"]).path_qs if "next" in content else None
+        assert url is None or "foo=bar" in url
+    assert usernames == sorted(usernames)
+    assert len(usernames) == 7
+
+
+async def test_get_groups__pages(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    headers = {"Authorization": "Bearer somefaketoken"}
+    response = await client.get("/groups/?page_size=1", headers=headers)
+    content = await response.json()
+    assert content["approximate_count"] == 5
+    assert [group["group"] for group in content["groups"]] == ["get_group"]
+    response = await client.get(URL(content["next"]["url"]).path_qs, headers=headers)
+    content = await response.json()
+    assert [group["group"] for group in content["groups"]] == ["get_group.staff"]
+    response = await client.get("/groups/?user=kisee-toto&page_size=1", headers=headers)
+    content = await response.json()
+    assert "approximate_count" not in content
+    response = await client.get(URL(content["next"]["url"]).path_qs, headers=headers)
+    assert [group["group"] for group in (await response.json())["groups"]] == [
+        "get_group.staff"
+    ]
+
+
+async def test_get_user__pages(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    headers = {"Authorization": "Bearer somefaketoken"}
+    response = await client.get("/users/kisee-toto?page_size=1", headers=headers)
+    content = await response.json()
+    groups = [group["group"] for group in content["groups"]]
+    response = await client.get(URL(content["next"]["url"]).path_qs, headers=headers)
+    content = await response.json()
+    groups.extend(group["group"] for group in content["groups"])
+    assert groups == sorted(groups)
+    assert len(groups) == 2
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/users/?cursor=garbage",
+        "/users/?page_size=0",
+        "/users/?page_size=ten",
+        "/groups/?cursor=garbage",
+        "/users/kisee-toto?cursor=garbage",
+    ],
+)
+async def test_pagination__bad_request(client, monkeypatch, url):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.get(url, headers={"Authorization": "Bearer faketoken"})
+    assert response.status == 400
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "gzip"])
+async def test_get_memberships(client, monkeypatch, accept_encoding):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization
+    )
+    response = await client.get(
+        "/memberships/",
+        headers={
+            "Authorization": "Bearer somefaketoken",
+            "Accept-Encoding": accept_encoding,
+        },
+    )
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert response.headers.get("Content-Encoding", "identity") == accept_encoding
+    for header, value in SECURITY_HEADERS.items():
+        assert response.headers[header] == value
+    memberships = [json.loads(line) for line in (await response.text()).splitlines()]
+    assert len(memberships) == 7
+    assert {
+        "username": "kisee-toto",
+        "is_banned": False,
+        "groups": ["get_group", "get_group.staff", "staff"],
+    } in memberships
+
+
+async def test_get_memberships__non_staff(client, monkeypatch):
+    monkeypatch.setattr(
+        "pasee.utils.enforce_authorization", mocks.enforce_authorization__non_staff
+    )
+    response = await client.get(
+        "/memberships/", headers={"Authorization": "Bearer somefaketoken"}
+    )
+    assert response.status == 403
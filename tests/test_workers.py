@@ -0,0 +1,84 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from pasee import workers
+
+
+@pytest.fixture
+def supervisor_signals():
+    """Restore signal handlers replaced by Supervisor.run()."""
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def sleeping_worker(index):  # pragma: no cover (runs in the worker)
+    time.sleep(60)
+
+
+def crashing_worker(index):  # pragma: no cover (runs in the worker)
+    raise RuntimeError("Can't start")
+
+
+def stubborn_worker(index):  # pragma: no cover (runs in the worker)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def after(delay, function, *args):
+    timer = threading.Timer(delay, function, args)
+    timer.start()
+    return timer
+
+
+def test_listen():
+    sock = workers.listen("127.0.0.1", 0)
+    try:
+        assert sock.getsockname()[1] > 0
+        assert sock.get_inheritable()
+    finally:
+        sock.close()
+
+
+def test_supervisor_restarts_workers(supervisor_signals):
+    supervisor = workers.Supervisor(
+        sleeping_worker, 2, shutdown_timeout=5, restart_delay=0.5
+    )
+    supervisor.poll_interval = 0.01
+    first_pids = []
+
+    def kill_first_worker():
+        first_pids.extend(supervisor.children)
+        os.kill(first_pids[0], signal.SIGKILL)
+
+    after(0.5, kill_first_worker)
+    after(1.5, os.kill, os.getpid(), signal.SIGTERM)
+    supervisor.run()
+    assert supervisor.children == {}
+    assert len(first_pids) == 2
+    assert supervisor.started_at[0] > supervisor.started_at[1]
+
+
+def test_supervisor_kills_stubborn_workers(supervisor_signals):
+    supervisor = workers.Supervisor(stubborn_worker, 1, shutdown_timeout=0.5)
+    supervisor.poll_interval = 0.01
+    after(0.5, os.kill, os.getpid(), signal.SIGINT)
+    start = time.monotonic()
+    supervisor.run()
+    assert supervisor.children == {}
+    assert time.monotonic() - start > 0.9
+
+
+def test_supervisor_delays_restarts(supervisor_signals):
+    supervisor = workers.Supervisor(crashing_worker, 1, restart_delay=1)
+    supervisor.poll_interval = 0.01
+    after(0.5, os.kill, os.getpid(), signal.SIGTERM)
+    start = time.monotonic()
+    supervisor.run()
+    assert time.monotonic() - start > 0.9
+    assert supervisor.children == {}